@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Stage-level benchmark for the preprocessing pipeline.
+
+Runs each stage of preprocess.py on its own, in a fresh process, against a
+directory written by generate_synthetic.py (or any TimeSeries/factors
+trees), and records wall time, CPU time, input rows, rows/s, peak RSS and
+output bytes per stage as JSON. Results can also be appended to a JSONL
+history file to track throughput over time.
+
+Usage:
+    python benchmark.py DATA_DIR [--stage NAME ...] [--repeat N] [--cold]
+                        [--output results.json] [--history bench_history.jsonl]
+                        [-- extra preprocess.py options]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import preprocess
+from generate_synthetic import SYNTHETIC_MANIFEST
+
+SCRIPT = Path(preprocess.__file__).resolve()
+BENCHMARK_VERSION = 1
+
+
+def count_rows(path: Path, known: dict[str, int]) -> int:
+    """Data rows of a CSV: from the generator manifest when listed, else by counting lines."""
+    if path.name in known:
+        return known[path.name]
+    if not path.exists():
+        return 0
+    lines = 0
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(8 * 1024 * 1024), b""):
+            lines += block.count(b"\n")
+    return max(lines - 1, 0)
+
+
+def _peak_rss_mb(rusage) -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return rusage.ru_maxrss * scale / (1024 * 1024)
+
+
+def run_stage(stage: preprocess.Stage, data_dirs: dict[str, Path], work: Path, rows: int,
+              extra: list[str]) -> dict:
+    """Run one stage in a child process and measure it.
+
+    The stage writes to an empty output directory, so output_bytes is all it
+    leaves there: its outputs with their shards and their compressed and
+    content-hashed copies (plus the data manifest).
+    """
+    out_dir = work / "out"
+    shutil.rmtree(out_dir, ignore_errors=True)
+    cmd = [
+        sys.executable, str(SCRIPT), "--force", "--jobs", "1", "--stage", stage.name,
+        "--timeseries-dir", str(data_dirs["timeseries"]), "--factors-dir", str(data_dirs["factors"]),
+        "--output-dir", str(out_dir), "--cache-dir", str(work / "cache"), *extra,
+    ]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    log = proc.stdout.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        sys.stdout.write(log.decode("utf-8", "replace")[-4000:])
+
+    output_bytes = sum(path.stat().st_size for path in out_dir.rglob("*") if path.is_file())
+    return {
+        "stage": stage.name,
+        "returncode": proc.returncode,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(rusage.ru_utime + rusage.ru_stime, 4),
+        "rows": rows,
+        "rows_per_s": round(rows / wall, 1) if wall > 0 else None,
+        "peak_rss_mb": round(_peak_rss_mb(rusage), 1),
+        "output_bytes": output_bytes,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SCRIPT.parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time each preprocessing stage on a data directory.")
+    parser.add_argument("data", type=Path, help="directory written by generate_synthetic.py")
+    parser.add_argument("--timeseries-dir", type=Path, metavar="DIR",
+                        help="TimeSeries CSVs (default: DATA/TimeSeries)")
+    parser.add_argument("--factors-dir", type=Path, metavar="DIR",
+                        help="transport factor CSVs (default: DATA/factors)")
+    parser.add_argument("--stage", action="append", choices=list(preprocess.STAGE_BY_NAME), metavar="NAME",
+                        help="benchmark only this stage (repeatable; default: all stages)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage (default: %(default)s)")
+    parser.add_argument("--cold", action="store_true",
+                        help="clear the bilateral cache before every run (default: later runs reuse it)")
+    parser.add_argument("--output", type=Path, help="write the results JSON here (default: stdout)")
+    parser.add_argument("--history", type=Path, help="append the results as one line to this JSONL file")
+    parser.epilog = "Options after -- are passed through to preprocess.py."
+    argv = sys.argv[1:] if argv is None else argv
+    extra: list[str] = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, extra = argv[:split], argv[split + 1:]
+    args = parser.parse_args(argv)
+    args.extra = extra
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    data_dirs = {
+        "timeseries": (args.timeseries_dir or args.data / "TimeSeries").resolve(),
+        "factors": (args.factors_dir or args.data / "factors").resolve(),
+    }
+    try:
+        with open(args.data / SYNTHETIC_MANIFEST, encoding="utf-8") as fh:
+            synthetic = json.load(fh)
+    except (OSError, ValueError):
+        synthetic = {"params": None, "rows": {}}
+
+    # Stage inputs are resolved against the module's directories
+    preprocess.TIMESERIES_DIR = data_dirs["timeseries"]
+    preprocess.TRANSPORT_FACTORS_DIR = data_dirs["factors"]
+    stages = [stage for stage in preprocess.STAGES if not args.stage or stage.name in args.stage]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="preprocess-bench-") as tmp:
+        work = Path(tmp)
+        for stage in stages:
+            rows = sum(count_rows(path, synthetic["rows"]) for path in stage.inputs())
+            for run in range(args.repeat):
+                if args.cold:
+                    shutil.rmtree(work / "cache", ignore_errors=True)
+                result = {"run": run, **run_stage(stage, data_dirs, work, rows, args.extra)}
+                results.append(result)
+                print(
+                    f"{stage.name:<20} run {run}: {result['wall_s']:8.2f}s wall "
+                    f"{result['cpu_s']:8.2f}s cpu {result['rows_per_s'] or 0:>14,.0f} rows/s "
+                    f"{result['peak_rss_mb']:8.1f} MB peak"
+                    + ("" if result["returncode"] == 0 else f"  FAILED ({result['returncode']})"),
+                    file=sys.stderr,
+                )
+
+    report = {
+        "version": BENCHMARK_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "data": {key: str(path) for key, path in data_dirs.items()},
+        "synthetic": synthetic["params"],
+        "preprocess_args": args.extra,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(report, separators=(",", ":")) + "\n")
+    if any(result["returncode"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
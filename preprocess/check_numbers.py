@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Regression check for the vectorised number formatting of preprocess.py.
+
+metric_column() (and the round_array() under it) must write exactly what
+safe_float() wrote row by row: the same values, the same int/float types
+and so the same JSON text, including for NaN, inf, None and non-numeric
+cells. Exits non-zero on the first mismatch.
+
+Usage:
+    python check_numbers.py
+"""
+
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from preprocess import metric_column, safe_float
+
+EDGE_CELLS = [
+    None, float("nan"), float("inf"), float("-inf"), "", "n/a", "abc", "1.25", "-0",
+    0.0, -0.0, 0.5, 1.5, 2.5, -2.5, 2.675, 1.005, 0.05, 0.15, 3.65, 20000007.15, 1e17 + 0.5,
+    5e-324, -1e-9, 123456789.123456, 1e300, -1e300,
+]
+
+
+def check() -> list[str]:
+    rng = np.random.default_rng(0)
+    # Random values with many cells sitting near a rounding half
+    halves = (rng.integers(-10**7, 10**7, 2000) + 0.5) / 10.0 ** rng.integers(0, 4, 2000)
+    cells = EDGE_CELLS + halves.tolist() + rng.normal(0, 1e6, 2000).tolist()
+    df = pd.DataFrame({"mixed": pd.Series(cells, dtype=object),
+                       "numeric": pd.to_numeric(pd.Series(cells, dtype=object), errors="coerce")})
+
+    errors = []
+    for col in df.columns:
+        for decimals in (0, 1, 2, 3):
+            got = metric_column(df, col, decimals)
+            want = [safe_float(v, decimals) for v in df[col]]
+            if col == "mixed":
+                # safe_float() of an object cell parses strings like "1.25" itself
+                want = [safe_float(v, decimals) for v in cells]
+            for cell, g, w in zip(cells, got, want):
+                if type(g) is not type(w) or json.dumps(g) != json.dumps(w):
+                    errors.append(f"{col} decimals={decimals} cell={cell!r}: got {g!r}, safe_float {w!r}")
+    missing = metric_column(df, "no_such_column", 1)
+    if any(type(v) is not type(safe_float(0.0, 1)) or v != 0 for v in missing):
+        errors.append(f"missing column: got {missing[:3]!r}")
+    return errors
+
+
+def main() -> None:
+    errors = check()
+    for error in errors[:20]:
+        print(error)
+    if errors:
+        print(f"{len(errors)} mismatches")
+        sys.exit(1)
+    print("metric_column matches safe_float")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Synthetic input generator for the preprocessing pipeline.
+
+Writes a TimeSeries directory and a transport factors directory with the
+files and columns that preprocess.py reads, at a configurable scale, so the
+pipeline can be run and benchmarked without the real datasets. The
+aggregate TimeSeries tables are summed from the generated bilateral rows, so
+the outputs are internally consistent.
+
+Usage:
+    python generate_synthetic.py OUT_DIR [--rows N] [--commodities N] [--factor-files N]
+                                 [--factor-rows N] [--years FIRST-LAST] [--seed N]
+
+    python preprocess.py --timeseries-dir OUT_DIR/TimeSeries --factors-dir OUT_DIR/factors ...
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from preprocess import BILATERAL_FILENAME, COUNTRY_META
+
+MODES = ["maritime", "land", "air"]
+MODE_WEIGHTS = [0.55, 0.35, 0.10]
+ROUTE_TYPES = ["bilateral", "domestic"]
+METRICS = [
+    "WTW_emissions_tCO2", "TTW_emissions_tCO2", "WTT_emissions_tCO2",
+    "food_miles_tkm", "total_transport_cost_USD", "Value",
+]
+CHUNK_ROWS = 1_000_000
+SYNTHETIC_MANIFEST = "synthetic_manifest.json"
+
+
+def bilateral_chunk(rng: np.random.Generator, n: int, years: np.ndarray, commodities: np.ndarray,
+                    countries: np.ndarray) -> pd.DataFrame:
+    """``n`` bilateral flow rows; about one in five is a domestic route."""
+    from_idx = rng.integers(0, len(countries), n)
+    domestic = rng.random(n) < 0.2
+    to_idx = np.where(domestic, from_idx, rng.integers(0, len(countries), n))
+    domestic |= to_idx == from_idx
+    mode = np.array(MODES, dtype=object)[rng.choice(len(MODES), n, p=MODE_WEIGHTS)]
+    mode[domestic] = "land"
+
+    value = rng.lognormal(2.0, 2.0, n)                      # tonnes
+    distance = np.where(domestic, rng.uniform(50, 800, n), rng.uniform(300, 18_000, n))
+    intensity = np.select([mode == "air", mode == "land"], [0.6, 0.08], 0.012)  # kgCO2 per t-km
+    tkm = value * distance
+    ttw = tkm * intensity * rng.uniform(0.8, 1.2, n) / 1000
+    wtt = ttw * rng.uniform(0.15, 0.25, n)
+    return pd.DataFrame({
+        "Year": years[rng.integers(0, len(years), n)],
+        "from_iso3": countries[from_idx],
+        "to_iso3": countries[to_idx],
+        "route_type": np.where(domestic, "domestic", "bilateral"),
+        "mode": mode,
+        "commodity": commodities[rng.integers(0, len(commodities), n)],
+        "WTW_emissions_tCO2": ttw + wtt,
+        "TTW_emissions_tCO2": ttw,
+        "WTT_emissions_tCO2": wtt,
+        "food_miles_tkm": tkm,
+        "total_transport_cost_USD": tkm * rng.uniform(0.01, 0.2, n),
+        "Value": value,
+    })
+
+
+class RunningSums:
+    """Group-by sums over chunks, merged as the chunks arrive."""
+
+    def __init__(self, keys: list[str]) -> None:
+        self.keys = keys
+        self.total: pd.DataFrame | None = None
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        part = chunk.groupby(self.keys, sort=False)[METRICS].sum()
+        self.total = part if self.total is None else self.total.add(part, fill_value=0.0)
+
+    def frame(self) -> pd.DataFrame:
+        return self.total.sort_index().reset_index()
+
+
+def write_csv(df: pd.DataFrame, path: Path, rows: dict[str, int]) -> None:
+    df.to_csv(path, index=False, float_format="%.6g")
+    rows[path.name] = len(df)
+
+
+def write_timeseries(out: Path, args: argparse.Namespace, rng: np.random.Generator) -> dict[str, int]:
+    """Stream the bilateral CSV chunk by chunk and derive the aggregate tables from it."""
+    ts_dir = out / "TimeSeries"
+    ts_dir.mkdir(parents=True, exist_ok=True)
+    first, last = args.years
+    years = np.arange(first, last + 1)
+    commodities = np.array([f"Commodity {i:03d}" for i in range(args.commodities)], dtype=object)
+    countries = np.array(sorted(COUNTRY_META), dtype=object)
+
+    consumer = RunningSums(["to_iso3", "Year", "route_type"])
+    producer = RunningSums(["from_iso3", "Year", "route_type"])
+    by_commodity = RunningSums(["commodity", "Year", "route_type"])
+    by_mode = RunningSums(["Year", "mode"])
+
+    rows: dict[str, int] = {}
+    path = ts_dir / BILATERAL_FILENAME
+    written = 0
+    t0 = time.perf_counter()
+    while written < args.rows:
+        n = min(args.chunk_rows, args.rows - written)
+        chunk = bilateral_chunk(rng, n, years, commodities, countries)
+        chunk.to_csv(path, mode="w" if written == 0 else "a", header=written == 0,
+                     index=False, float_format="%.6g")
+        for sums in (consumer, producer, by_commodity, by_mode):
+            sums.add(chunk)
+        written += n
+        rate = written / max(time.perf_counter() - t0, 1e-9)
+        print(f"    {BILATERAL_FILENAME}: {written:,} / {args.rows:,} rows ({rate:,.0f} rows/s)")
+    rows[path.name] = written
+
+    write_csv(consumer.frame(), ts_dir / "emissions_by_consumer_country_year.csv", rows)
+    write_csv(producer.frame().drop(columns="total_transport_cost_USD"),
+              ts_dir / "emissions_by_producer_country_year.csv", rows)
+    write_csv(by_commodity.frame().rename(columns={"commodity": "commodity_name"})
+              .drop(columns=["WTT_emissions_tCO2", "total_transport_cost_USD"]),
+              ts_dir / "emissions_by_commodity_year.csv", rows)
+
+    mode = by_mode.frame()
+    write_csv(pd.DataFrame({
+        "Year": mode["Year"],
+        "mode": mode["mode"],
+        "WTW_emissions_MtCO2": mode["WTW_emissions_tCO2"] / 1e6,
+        "TTW_emissions_MtCO2": mode["TTW_emissions_tCO2"] / 1e6,
+        "WTT_emissions_MtCO2": mode["WTT_emissions_tCO2"] / 1e6,
+        "Food_Miles_Billion_tkm": mode["food_miles_tkm"] / 1e9,
+        "Trade_Volume_Mt": mode["Value"] / 1e6,
+    }), ts_dir / "emissions_by_year_mode.csv", rows)
+
+    world = mode.groupby("Year")[METRICS].sum().reset_index()
+    write_csv(pd.DataFrame({
+        "Year": world["Year"],
+        "Trade_Volume_Mt": world["Value"] / 1e6,
+        "WTW_emissions_MtCO2": world["WTW_emissions_tCO2"] / 1e6,
+        "TTW_emissions_MtCO2": world["TTW_emissions_tCO2"] / 1e6,
+        "WTT_emissions_MtCO2": world["WTT_emissions_tCO2"] / 1e6,
+        "Food_Miles_Billion_tkm": world["food_miles_tkm"] / 1e9,
+    }), ts_dir / "global_emissions_by_year.csv", rows)
+    return rows
+
+
+def write_transport_factors(out: Path, args: argparse.Namespace, rng: np.random.Generator) -> dict[str, int]:
+    """One transport_statistics_<mode>_<commodity>.csv per (mode, commodity) pair, up to ``factor_files``."""
+    tf_dir = out / "factors"
+    tf_dir.mkdir(parents=True, exist_ok=True)
+    countries = np.array(sorted(COUNTRY_META), dtype=object)
+    rows: dict[str, int] = {}
+    for i in range(args.factor_files):
+        mode = MODES[i % len(MODES)]
+        commodity = f"Commodity {i // len(MODES) % max(args.commodities, 1):03d}"
+        n = args.factor_rows
+        distance = rng.uniform(100, 18_000, n)
+        ttw = distance * rng.uniform(0.005, 0.6, n)
+        df = pd.DataFrame({
+            "from_iso3": countries[rng.integers(0, len(countries), n)],
+            "to_iso3": countries[rng.integers(0, len(countries), n)],
+            "mode": mode,
+            "commodity": commodity,
+            "WTW_kgCO2_t": ttw * rng.uniform(1.15, 1.25, n),
+            "TTW_kgCO2_t": ttw,
+            "distance_km": distance,
+        })
+        write_csv(df, tf_dir / f"transport_statistics_{mode}_{commodity.replace(' ', '')}.csv", rows)
+    return rows
+
+
+def parse_years(text: str) -> tuple[int, int]:
+    first, _, last = text.partition("-")
+    return int(first), int(last or first)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Write synthetic preprocessing inputs.")
+    parser.add_argument("out", type=Path, help="directory to write TimeSeries/ and factors/ into")
+    parser.add_argument("--rows", type=int, default=1_000_000,
+                        help="bilateral flow rows (default: %(default)s)")
+    parser.add_argument("--commodities", type=int, default=60,
+                        help="distinct commodities (default: %(default)s)")
+    parser.add_argument("--factor-files", type=int, default=180,
+                        help="transport factor files (default: %(default)s)")
+    parser.add_argument("--factor-rows", type=int, default=5_000,
+                        help="rows per transport factor file (default: %(default)s)")
+    parser.add_argument("--years", type=parse_years, default=(2000, 2024), metavar="FIRST-LAST",
+                        help="year range (default: 2000-2024)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help="bilateral rows generated per chunk (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    t_start = time.time()
+
+    print(f"Writing synthetic inputs to {args.out} ...")
+    rows = write_timeseries(args.out, args, rng)
+    rows.update(write_transport_factors(args.out, args, rng))
+
+    manifest = {
+        "params": {
+            "rows": args.rows, "commodities": args.commodities, "factor_files": args.factor_files,
+            "factor_rows": args.factor_rows, "years": list(args.years), "seed": args.seed,
+            "countries": len(COUNTRY_META),
+        },
+        "rows": rows,
+    }
+    with open(args.out / SYNTHETIC_MANIFEST, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+    print(f"Done in {time.time() - t_start:.1f}s ({len(rows)} files).")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,52 @@ bilateral flows, transport factors) and writes optimised JSON files that the
 React front-end can fetch at runtime.
 
 Usage:
-    python preprocess.py
+    python preprocess.py [--force] [--jobs N] [--no-cache] [--factor-workers N] [--scan-workers N]
+                         [--json-encoder {json,orjson}] [--table-format {nested,columnar}]
+                         [--no-compress] [--binary-flows] [--backend {pandas,duckdb}]
+                         [--backend-memory-limit SIZE] [--reconcile] [--reconcile-tolerance RTOL]
+                         [--delta-years YEAR ...] [--encode-ids] [--stage NAME ...]
+                         [--timeseries-dir DIR] [--factors-dir DIR] [--output-dir DIR]
+                         [--cache-dir DIR] [--report FILE] [--trace FILE]
 """
 
+import argparse
+import hashlib
+import io
 import json
 import math
+import os
+import re
+import shutil
 import sys
+import threading
 import time
-from collections import defaultdict
+import traceback
+import zlib
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:  # optional: faster JSON encoding, stdlib json otherwise
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: .br siblings are skipped without it
+    brotli = None
+
+try:
+    import duckdb
+except ImportError:  # optional: out-of-core aggregation backend
+    duckdb = None
+
 # ---------------------------------------------------------------------------
 # Paths
 # ---------------------------------------------------------------------------
@@ -43,7 +76,9 @@ PRELIMINARY_YEARS = [2024]
 EXCLUDE_YEARS = {2024}  # Years to exclude from all output
 TOP_N_BILATERAL_PER_MODE = 100
 TOP_N_BILATERAL_PER_COMMODITY = 50
+TOP_N_PARTNERS_PER_COUNTRY = 20
 BILATERAL_CHUNKSIZE = 500_000
+TABLE_FORMAT = "nested"  # consumer/producer/commodity tables: "nested" or "columnar"
 
 # ---------------------------------------------------------------------------
 # Country metadata  (197 ISO-3166-1 alpha-3 codes that appear in the data)
@@ -269,13 +304,891 @@ def safe_float(val, decimals: int | None = None) -> float | int:
     return f
 
 
-def write_json(data: dict | list, filename: str) -> None:
-    """Write data to a JSON file with compact formatting."""
+def round_array(values: np.ndarray, decimals: int) -> np.ndarray:
+    """Vectorised ``safe_float``: NaN/inf become 0, then Python's ``round()``.
+
+    ``rint(x * 10**d) / 10**d`` equals the correctly rounded ``round(x, d)``
+    except when the scaled value sits (within float error) on a half, or is
+    too large to have a fractional part; those few values go through
+    ``round()`` itself so results are bit-identical to ``safe_float``.
+    """
+    values = np.where(np.isfinite(values), values, 0.0)
+    scale = 10.0 ** decimals
+    scaled = values * scale
+    out = np.rint(scaled) / scale
+    frac = np.abs(scaled - np.trunc(scaled))
+    suspect = (np.abs(frac - 0.5) <= 4 * np.spacing(np.abs(scaled))) | (np.abs(scaled) >= 2.0 ** 52)
+    if suspect.any():
+        out[suspect] = [round(v, decimals) for v in values[suspect].tolist()]
+    return out
+
+
+def label_column(values: pd.Series, convert=str) -> np.ndarray:
+    """Apply ``convert`` once per distinct value (NaN included) and broadcast back."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    labels = np.empty(len(uniques), dtype=object)
+    labels[:] = [convert(u) for u in uniques]
+    return labels[codes]
+
+
+def year_label(val) -> str:
+    return str(int(val))
+
+
+def route_label(val) -> str:
+    return str(val).lower().strip()
+
+
+def metric_column(df: pd.DataFrame, source: str | tuple[str, ...], decimals: int) -> list:
+    """One output metric for every row: NaN/inf -> 0, rounded like ``safe_float``.
+
+    ``source`` may list alternative column names; the first one present is
+    used, and a metric with no column at all is 0 (like ``row.get(col, 0)``).
+    """
+    names = (source,) if isinstance(source, str) else source
+    col = next((name for name in names if name in df.columns), None)
+    if col is None:
+        values = np.zeros(len(df))
+    else:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+    rounded = round_array(values, decimals)
+    if decimals == 0:
+        if (np.abs(rounded) >= 2.0 ** 63).any():
+            return [int(v) for v in rounded.tolist()]      # beyond int64, like int(round(f, 0))
+        return rounded.astype(np.int64).tolist()
+    out = rounded.tolist()
+    # safe_float() writes the int 0 for NaN/inf/non-numeric cells, not 0.0
+    for i in np.flatnonzero(~np.isfinite(values)).tolist():
+        out[i] = 0
+    return out
+
+
+def build_nested_json(
+    df: pd.DataFrame,
+    keys: list[str],
+    metrics: dict[str, tuple[str | tuple[str, ...], int]],
+    fields: tuple[str, ...] = (),
+    list_leaves: bool = False,
+) -> dict:
+    """Build ``{k1: {k2: ... {metric: value}}}`` from a table in one pass.
+
+    ``keys`` are columns already holding output labels; ``metrics`` maps each
+    output name to its source column(s) and rounding (see metric_column).
+    ``fields`` are label columns copied into each record ahead of the
+    metrics. Keys keep first-seen order and a repeated key path keeps its
+    position but takes the later row's values, as with nested ``setdefault``;
+    with ``list_leaves`` the records under the last key are collected in a
+    list instead.
+    """
+    names = list(fields) + list(metrics)
+    columns = [df[name].tolist() for name in fields]
+    columns += [metric_column(df, source, decimals) for source, decimals in metrics.values()]
+    records = [dict(zip(names, values)) for values in zip(*columns)]
+
+    result: dict = {}
+    for *path, record in zip(*(df[key].tolist() for key in keys), records):
+        node = result
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        if list_leaves:
+            node.setdefault(path[-1], []).append(record)
+        else:
+            node[path[-1]] = record
+    return result
+
+
+def columnar_route_table(nested: dict, metrics: list[str]) -> dict:
+    """Re-encode a ``{key: {year: {route: {...}}}}`` table column by column.
+
+    Keys, years and routes are stored once in dictionaries; each row holds
+    their positions plus one entry per metric array. Rows keep the nested
+    iteration order, so decoding them in order (src/utils/columnar.ts)
+    rebuilds the same object.
+    """
+    keys: list[str] = []
+    years: dict[str, int] = {}
+    routes: dict[str, int] = {}
+    rows: dict[str, list[int]] = {"key": [], "year": [], "route": []}
+    values: dict[str, list] = {name: [] for name in metrics}
+    for key, by_year in nested.items():
+        key_idx = len(keys)
+        keys.append(key)
+        for year, by_route in by_year.items():
+            year_idx = years.setdefault(year, len(years))
+            for route, record in by_route.items():
+                rows["key"].append(key_idx)
+                rows["year"].append(year_idx)
+                rows["route"].append(routes.setdefault(route, len(routes)))
+                for name in metrics:
+                    values[name].append(record[name])
+    return {
+        "format": "columnar",
+        "keys": keys,
+        "years": list(years),
+        "routes": list(routes),
+        "rows": rows,
+        "values": values,
+    }
+
+
+def nested_route_table(table: dict) -> dict:
+    """Inverse of columnar_route_table(); a nested table is returned as it is."""
+    if table.get("format") != "columnar":
+        return table
+    rows, values = table["rows"], table["values"]
+    result: dict = {}
+    for i, (key, year, route) in enumerate(zip(rows["key"], rows["year"], rows["route"])):
+        # str(): the integer codes of an encoded table become JSON object keys again
+        by_route = result.setdefault(str(table["keys"][key]), {}).setdefault(table["years"][year], {})
+        by_route[table["routes"][route]] = {name: column[i] for name, column in values.items()}
+    return result
+
+
+def route_table_json(df: pd.DataFrame, key_col: str, metrics: dict) -> dict:
+    """``{key: {year: {route: {...}}}}`` for the bilateral and domestic rows of a table."""
+    keyed = pd.DataFrame({
+        "key": label_column(df[key_col]),
+        "year": label_column(df["Year"], year_label),
+        "route": label_column(df["route_type"], route_label),
+    }, index=df.index)
+    keep = keyed["route"].isin(["bilateral", "domestic"]).to_numpy()
+    count("rows_out", keep.sum())
+    result = build_nested_json(
+        pd.concat([keyed, df], axis=1)[keep],
+        ["key", "year", "route"],
+        metrics,
+    )
+    return result
+
+
+def _json_default(obj):
+    """Convert NumPy arrays and scalars the JSON encoders don't take natively."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _encode_stdlib(data) -> bytes:
+    return json.dumps(
+        data, separators=(",", ":"), ensure_ascii=False, default=_json_default,
+    ).encode("utf-8")
+
+
+def _encode_orjson(data) -> bytes:
+    return orjson.dumps(data, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+# Compact JSON encoders by name. Both write the same document; orjson spells
+# large floats without the exponent sign (1e16 vs 1e+16) and NaN as null.
+JSON_ENCODERS: dict[str, Callable[[object], bytes]] = {"json": _encode_stdlib}
+if orjson is not None:
+    JSON_ENCODERS["orjson"] = _encode_orjson
+JSON_ENCODER = "orjson" if orjson is not None else "json"
+
+
+# ---------------------------------------------------------------------------
+# Telemetry
+#
+# Stages, the bilateral scan and each of its chunks are measured as spans:
+# wall and CPU time, peak RSS, and counters (rows in/out, bytes read and
+# written) that the measured code adds to with count(). A span's peak RSS is
+# its own: on Linux a thread samples the RSS of the process every
+# RSS_SAMPLE_INTERVAL seconds (and as spans open and close) into every open
+# span, so a spike shorter than the interval can be missed. The process's
+# ru_maxrss is left alone for whoever measures it from outside. Elsewhere
+# only the process peak so far is known, and the event says so (peak_rss_mb
+# is None). A finished span, and
+# each file write, becomes an event dict that every renderer receives: the
+# console renderer prints the human-readable progress, the trace renderer
+# appends JSON lines to TRACE_PATH, and main() collects the stage events
+# into the run report.
+# ---------------------------------------------------------------------------
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is reported as None
+    resource = None
+
+TELEMETRY_COUNTERS = ("rows_in", "rows_out", "bytes_read", "bytes_written")
+TRACE_PATH: Path | None = None
+_OPEN_SPANS: list["Span"] = []
+RSS_SAMPLE_INTERVAL = 0.05
+_RSS_SAMPLER_PID: int | None = None       # process whose sampler thread is running
+
+
+def peak_rss_mb() -> float | None:
+    """Peak RSS of this process over its lifetime (or of its largest finished child), in MB."""
+    if resource is None:
+        return None
+    return round(max(_max_rss_kib(resource.RUSAGE_SELF), _max_rss_kib(resource.RUSAGE_CHILDREN)) / 1024, 1)
+
+
+def _max_rss_kib(who: int) -> int:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return resource.getrusage(who).ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+
+
+def _current_rss_kib() -> int | None:
+    """This process's resident set size in KiB (None off Linux)."""
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _sample_rss() -> None:
+    """Raise the peak of every open span to the current RSS."""
+    rss = _current_rss_kib()
+    if rss is None:
+        return
+    for span in list(_OPEN_SPANS):
+        if span._peak_kib is not None and rss > span._peak_kib:
+            span._peak_kib = rss
+
+
+def _rss_sampler() -> None:
+    while True:
+        time.sleep(RSS_SAMPLE_INTERVAL)
+        _sample_rss()
+
+
+def _start_rss_sampler() -> None:
+    """Start this process's sampler thread once (a forked worker starts its own)."""
+    global _RSS_SAMPLER_PID
+    if _RSS_SAMPLER_PID != os.getpid():
+        _RSS_SAMPLER_PID = os.getpid()
+        threading.Thread(target=_rss_sampler, name="rss-sampler", daemon=True).start()
+
+
+def count(counter: str, n: int) -> None:
+    """Add ``n`` to a counter of the innermost open span (no-op outside spans)."""
+    if _OPEN_SPANS:
+        _OPEN_SPANS[-1].counters[counter] += int(n)
+
+
+class Span:
+    """Measure a block of work; emits one event when the block exits.
+
+    Counters roll up into the enclosing span. ``fields`` (settable inside the
+    block) are copied into the event; set ``discard`` to emit nothing.
+    """
+
+    def __init__(self, kind: str, name: str, **fields) -> None:
+        self.kind = kind
+        self.name = name
+        self.fields = fields
+        self.counters = dict.fromkeys(TELEMETRY_COUNTERS, 0)
+        self.discard = False
+        self.event: dict | None = None
+
+    def __enter__(self) -> "Span":
+        self._peak_kib = _current_rss_kib()
+        if self._peak_kib is not None:
+            _start_rss_sampler()
+        self._children_kib = _max_rss_kib(resource.RUSAGE_CHILDREN) if resource is not None else 0
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        _OPEN_SPANS.append(self)
+        return self
+
+    def peak_rss_mb(self) -> float | None:
+        """This span's sampled peak RSS so far in MB, None where the RSS can't be read.
+
+        A worker process reaped inside the span (e.g. of the factor pool)
+        counts when its peak is the largest of any finished child so far.
+        """
+        _sample_rss()
+        if self._peak_kib is None:
+            return None
+        peak = self._peak_kib
+        if resource is not None and _max_rss_kib(resource.RUSAGE_CHILDREN) > self._children_kib:
+            peak = max(peak, _max_rss_kib(resource.RUSAGE_CHILDREN))
+        return round(peak / 1024, 1)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        wall = time.perf_counter() - self._wall0
+        cpu = time.process_time() - self._cpu0
+        peak = self.peak_rss_mb()
+        _OPEN_SPANS.remove(self)
+        if _OPEN_SPANS:
+            for key, value in self.counters.items():
+                _OPEN_SPANS[-1].counters[key] += value
+        if self.discard:
+            return
+        self.event = {
+            "event": self.kind,
+            "name": self.name,
+            "ok": exc_type is None,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            **self.counters,
+            "rows_per_s": round(self.counters["rows_in"] / wall, 1) if wall > 0 else None,
+            "peak_rss_mb": peak,
+            "process_peak_rss_mb": peak_rss_mb(),
+            **self.fields,
+        }
+        emit(self.event)
+
+
+def render_console(event: dict) -> None:
+    """Human-readable progress lines."""
+    kind = event["event"]
+    if kind == "write" and not event.get("quiet"):
+        detail = (f"encoded in {event['encode_s']:.2f}s with {event['encoder']}"
+                  if "encoder" in event else f"{event['arrays']} arrays")
+        print(f"  -> {event['file']} ({event['bytes'] / (1024 * 1024):.2f} MB, "
+              f"{event['bytes']:,} bytes, {detail})")
+    elif kind == "chunk":
+        print(f"    chunk {event['index']}: {event['total_rows']:,} rows processed "
+              f"({event['elapsed_s']:.1f}s elapsed)")
+    elif kind == "range":
+        print(f"    range {event['index']}/{event['ranges']}: {event['total_rows']:,} rows processed "
+              f"({event['elapsed_s']:.1f}s elapsed)")
+    elif kind == "scan":
+        print(f"    Done reading {event['rows_in']:,} rows in {event['wall_s']:.1f}s.")
+    elif kind == "stage":
+        if event["peak_rss_mb"] is not None:
+            rss = f"peak RSS {event['peak_rss_mb']:.0f} MB"
+        elif event["process_peak_rss_mb"] is not None:
+            rss = f"process peak RSS so far {event['process_peak_rss_mb']:.0f} MB"
+        else:
+            rss = "peak RSS n/a"
+        print(
+            f"  [{event['name']}] {event['wall_s']:.2f}s wall, {event['cpu_s']:.2f}s cpu, "
+            f"{event['rows_in']:,} rows in ({event['rows_per_s'] or 0:,.0f}/s), "
+            f"{event['rows_out']:,} rows out, {event['bytes_read'] / (1024 * 1024):.1f} MB read, "
+            f"{event['bytes_written'] / (1024 * 1024):.1f} MB written, {rss}"
+        )
+
+
+def render_trace(event: dict) -> None:
+    """Append the event as one JSON line to TRACE_PATH, when set."""
+    if TRACE_PATH is None:
+        return
+    line = json.dumps(event, separators=(",", ":"), default=str) + "\n"
+    with open(TRACE_PATH, "a", encoding="utf-8") as fh:
+        fh.write(line)
+
+
+RENDERERS: list[Callable[[dict], None]] = [render_console, render_trace]
+
+
+def emit(event: dict) -> None:
+    event = {"t": round(time.time(), 3), "pid": os.getpid(), **event}
+    for renderer in RENDERERS:
+        renderer(event)
+
+
+def _write_atomic(path: Path, payload: bytes) -> None:
+    """Write ``payload`` to a temporary sibling and rename it over ``path``."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(payload)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class CompressedSiblings:
+    """The ``.gz`` and (with brotli installed) ``.br`` copies of ``path``, compressed as its bytes arrive.
+
+    Both use maximum compression, and the gzip header carries no timestamp,
+    so unchanged data gives unchanged bytes (the same as gzip.compress(...,
+    mtime=0), however the bytes are split). Feed the file's bytes to write()
+    in order, then commit() renames the copies into place; siblings of a
+    format that is not written (all of them without COMPRESS_OUTPUTS) are
+    removed rather than left stale. close() drops uncommitted copies.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.compressors = {}
+        if COMPRESS_OUTPUTS:
+            self.compressors[".gz"] = zlib.compressobj(9, zlib.DEFLATED, 31)
+            if brotli is not None:
+                self.compressors[".br"] = brotli.Compressor(quality=11)
+        self.files = {suffix: open(self._tmp(suffix), "wb") for suffix in self.compressors}
+
+    def _tmp(self, suffix: str) -> Path:
+        return self.path.with_name(f".{self.path.name}{suffix}.{os.getpid()}.tmp")
+
+    def write(self, data: bytes) -> None:
+        for suffix, compressor in self.compressors.items():
+            self.files[suffix].write(compressor.compress(data) if suffix == ".gz" else compressor.process(data))
+
+    def commit(self) -> None:
+        for suffix, compressor in self.compressors.items():
+            fh = self.files.pop(suffix)
+            with fh:
+                fh.write(compressor.flush() if suffix == ".gz" else compressor.finish())
+                count("bytes_written", fh.tell())
+            os.replace(self._tmp(suffix), self.path.with_name(self.path.name + suffix))
+        for suffix in (".gz", ".br"):
+            if suffix not in self.compressors:
+                self.path.with_name(self.path.name + suffix).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        for suffix, fh in self.files.items():
+            fh.close()
+            self._tmp(suffix).unlink(missing_ok=True)
+        self.files = {}
+
+
+def write_compressed_siblings(path: Path, payload: bytes | None = None) -> None:
+    """Refresh the compressed copies of ``path`` (see CompressedSiblings).
+
+    Without ``payload`` the file is read back in blocks, so it is never
+    held in memory whole.
+    """
+    siblings = CompressedSiblings(path)
+    try:
+        if payload is not None:
+            siblings.write(payload)
+        elif siblings.compressors:
+            with open(path, "rb") as fh:
+                for block in iter(lambda: fh.read(1024 * 1024), b""):
+                    siblings.write(block)
+        siblings.commit()
+    finally:
+        siblings.close()
+
+
+def write_json(data, filename: str, quiet: bool = False) -> bytes:
+    """Write data to a JSON file with compact formatting; returns the bytes written.
+
+    ``data`` may contain NumPy arrays and scalars. The file is written to a
+    temporary sibling and renamed into place, so readers never see a
+    half-written file, and its precompressed siblings are refreshed.
+    ``quiet`` skips the per-file report line.
+    """
+    path = OUTPUT_DIR / filename
+    t0 = time.perf_counter()
+    payload = JSON_ENCODERS[JSON_ENCODER](data)
+    encode_s = time.perf_counter() - t0
+
+    _write_atomic(path, payload)
+    count("bytes_written", len(payload))
+    write_compressed_siblings(path, payload)
+    emit({"event": "write", "file": filename, "bytes": len(payload), "encode_s": round(encode_s, 4),
+          "encoder": JSON_ENCODER, "quiet": quiet})
+    return payload
+
+
+def write_json_stream(members: Iterable[tuple[str, object]], filename: str, quiet: bool = False) -> int:
+    """Write a JSON object member by member; returns the number of bytes written.
+
+    Each value is encoded and written as soon as ``members`` yields it, so a
+    caller that builds the values lazily never holds more than one of them.
+    The file is byte-for-byte what write_json() writes for the same dict (the
+    compact encoders put nothing but the separators between members) and is
+    renamed into place the same way. Its compressed copies are written
+    alongside, one member at a time.
+    """
+    path = OUTPUT_DIR / filename
+    encode = JSON_ENCODERS[JSON_ENCODER]
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    siblings = CompressedSiblings(path)
+    size = 0
+    encode_s = 0.0
+    try:
+        with open(tmp, "wb") as fh:
+            for key, value in members:
+                t0 = time.perf_counter()
+                part = (b"," if size else b"{") + encode(key) + b":" + encode(value)
+                encode_s += time.perf_counter() - t0
+                fh.write(part)
+                siblings.write(part)
+                size += len(part)
+            closing = b"}" if size else b"{}"
+            fh.write(closing)
+            siblings.write(closing)
+            size += len(closing)
+        os.replace(tmp, path)
+        siblings.commit()
+    finally:
+        tmp.unlink(missing_ok=True)
+        siblings.close()
+
+    count("bytes_written", size)
+    emit({"event": "write", "file": filename, "bytes": size, "encode_s": round(encode_s, 4),
+          "encoder": JSON_ENCODER, "quiet": quiet})
+    return size
+
+
+TYPED_ARRAY_MAGIC = b"TARR"
+TYPED_ARRAY_VERSION = 1
+
+
+def write_typed_arrays(header: dict, arrays: list[np.ndarray], filename: str) -> bytes:
+    """Write a binary file of packed little-endian arrays; returns the bytes written.
+
+    Layout: ``TARR``, then uint32 version and uint32 header length, then the
+    UTF-8 JSON header padded to 8 bytes, then each array padded to 8 bytes.
+    The header is ``header`` plus ``"arrays": [{dtype, offset, length}]``
+    with byte offsets from the start of the file, so a reader can wrap each
+    array as a typed array over the buffer without copying (see
+    src/utils/typedArrays.ts). Arrays are referenced by position.
+    """
+    packed = [np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<")) for arr in arrays]
+    specs = [{"dtype": arr.dtype.name, "length": len(arr)} for arr in packed]
+
+    def pad(n: int) -> int:
+        return -n % 8
+
+    # Offsets depend on the header length, which depends on the offsets'
+    # digits: grow the reserved header size until the layout is stable.
+    header_len = 0
+    while True:
+        offset = 12 + header_len + pad(12 + header_len)
+        for spec, arr in zip(specs, packed):
+            spec["offset"] = offset
+            offset += arr.nbytes + pad(arr.nbytes)
+        encoded = json.dumps({**header, "arrays": specs}, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if len(encoded) <= header_len:
+            break
+        header_len = len(encoded)
+
+    parts = [TYPED_ARRAY_MAGIC, np.array([TYPED_ARRAY_VERSION, header_len], dtype="<u4").tobytes(),
+             encoded.ljust(header_len + pad(12 + header_len))]
+    for arr in packed:
+        parts.append(arr.tobytes() + bytes(pad(arr.nbytes)))
+    payload = b"".join(parts)
+
     path = OUTPUT_DIR / filename
-    with open(path, "w", encoding="utf-8") as fh:
-        json.dump(data, fh, separators=(",", ":"), ensure_ascii=False)
-    size_mb = path.stat().st_size / (1024 * 1024)
-    print(f"  -> {filename} ({size_mb:.2f} MB)")
+    _write_atomic(path, payload)
+    count("bytes_written", len(payload))
+    write_compressed_siblings(path, payload)
+    emit({"event": "write", "file": filename, "bytes": len(payload), "arrays": len(arrays)})
+    return payload
+
+
+# ---------------------------------------------------------------------------
+# Content-hashed data artifacts
+#
+# After the stages run, every data file under OUTPUT_DIR is also published as
+# <stem>.<hash>.<ext> (with its precompressed siblings) and data_manifest.json
+# maps each logical name to that file. The hashed names can be served as
+# immutable; the front-end resolves names through the manifest and falls
+# back to the plain names when it is missing.
+# ---------------------------------------------------------------------------
+DATA_MANIFEST_NAME = "data_manifest.json"
+CONTENT_HASH_LENGTH = 16
+COMPRESS_OUTPUTS = True
+DATA_SUFFIXES = (".json", ".bin")
+_HASHED_NAME = re.compile(rf"\.[0-9a-f]{{{CONTENT_HASH_LENGTH}}}\.(json|bin)$")
+
+
+def _siblings_current(path: Path) -> bool:
+    gz = path.with_name(path.name + ".gz")
+    if not COMPRESS_OUTPUTS:
+        return not gz.exists() and not path.with_name(path.name + ".br").exists()
+    return gz.exists() and gz.stat().st_mtime_ns >= path.stat().st_mtime_ns
+
+
+def publish_hashed_outputs() -> None:
+    """Write the content-hashed copies of every output and the data manifest.
+
+    Compressed siblings that do not match COMPRESS_OUTPUTS (e.g. outputs of
+    skipped stages last built with --no-compress) are brought in line here.
+    """
+    files: dict[str, str] = {}
+    published: set[Path] = set()
+    for path in sorted(OUTPUT_DIR.rglob("*")):
+        if (path.suffix not in DATA_SUFFIXES or path.name == DATA_MANIFEST_NAME
+                or _HASHED_NAME.search(path.name)):
+            continue
+        if not _siblings_current(path):
+            write_compressed_siblings(path)
+        hashed = path.with_name(f"{path.stem}.{file_digest(path)[:CONTENT_HASH_LENGTH]}{path.suffix}")
+        for suffix in ("", ".gz", ".br"):
+            source = path.with_name(path.name + suffix)
+            target = hashed.with_name(hashed.name + suffix)
+            if source.exists():
+                if not target.exists():
+                    shutil.copyfile(source, target)
+                published.add(target)
+        files[path.relative_to(OUTPUT_DIR).as_posix()] = hashed.relative_to(OUTPUT_DIR).as_posix()
+
+    stale = 0
+    for path in OUTPUT_DIR.rglob("*"):
+        name = path.name.removesuffix(".gz").removesuffix(".br")
+        if _HASHED_NAME.search(name) and path not in published:
+            path.unlink()
+            stale += 1
+
+    write_json({"files": files}, DATA_MANIFEST_NAME, quiet=True)
+    print(f"  -> {DATA_MANIFEST_NAME} ({len(files)} files, {stale} stale hashed copies removed)")
+
+
+# ---------------------------------------------------------------------------
+# TimeSeries loader
+#
+# Several stages read the same TimeSeries tables. load_timeseries() parses
+# each file at most once per process, with explicit dtypes and only the
+# columns listed here, and hands the same DataFrame to every caller, so
+# callers must treat it as read-only. Alternative column names used by
+# older data releases are listed side by side; whichever exist are kept.
+# Only the text columns are typed by the parser: a stray non-numeric cell in
+# a numeric column becomes NaN (written as 0, like safe_float()) instead of
+# failing the parse, and rows whose Year is not a number are dropped.
+# ---------------------------------------------------------------------------
+_FLOAT = "float64"
+TIMESERIES_COLUMNS: dict[str, dict[str, str]] = {
+    "global_emissions_by_year.csv": {
+        "Year": "int64", "Trade_Volume_Mt": _FLOAT, "WTW_emissions_MtCO2": _FLOAT,
+        "TTW_emissions_MtCO2": _FLOAT, "WTT_emissions_MtCO2": _FLOAT, "Food_Miles_Billion_tkm": _FLOAT,
+    },
+    "emissions_by_year_mode.csv": {
+        "Year": "int64", "mode": "str",
+        "WTW_emissions_MtCO2": _FLOAT, "WTW_emissions_tCO2": _FLOAT,
+        "TTW_emissions_MtCO2": _FLOAT, "TTW_emissions_tCO2": _FLOAT,
+        "WTT_emissions_MtCO2": _FLOAT, "WTT_emissions_tCO2": _FLOAT,
+        "Food_Miles_Billion_tkm": _FLOAT, "food_miles_tkm": _FLOAT,
+        "Trade_Volume_Mt": _FLOAT, "Value": _FLOAT,
+    },
+    "emissions_by_consumer_country_year.csv": {
+        "to_iso3": "str", "Year": "int64", "route_type": "str",
+        "WTW_emissions_tCO2": _FLOAT, "TTW_emissions_tCO2": _FLOAT, "WTT_emissions_tCO2": _FLOAT,
+        "food_miles_tkm": _FLOAT, "Value": _FLOAT, "total_transport_cost_USD": _FLOAT,
+    },
+    "emissions_by_producer_country_year.csv": {
+        "from_iso3": "str", "Year": "int64", "route_type": "str",
+        "WTW_emissions_tCO2": _FLOAT, "TTW_emissions_tCO2": _FLOAT, "WTT_emissions_tCO2": _FLOAT,
+        "food_miles_tkm": _FLOAT, "Value": _FLOAT,
+    },
+    "emissions_by_commodity_year.csv": {
+        "commodity_name": "str", "commodity_name_x": "str", "Year": "int64", "route_type": "str",
+        "WTW_emissions_tCO2": _FLOAT, "TTW_emissions_tCO2": _FLOAT, "food_miles_tkm": _FLOAT, "Value": _FLOAT,
+    },
+}
+
+_TIMESERIES_CACHE: dict[Path, pd.DataFrame] = {}
+TIMESERIES_STATS = {"parses": 0, "cache_hits": 0, "parse_seconds": 0.0}
+
+
+def _coerce_numeric(df: pd.DataFrame, columns: dict[str, str], filename: str) -> pd.DataFrame:
+    """Bring the numeric columns to their listed dtype, coercing malformed cells to NaN."""
+    for col in df.columns:
+        dtype = columns[col]
+        if dtype == "str" or df[col].dtype == dtype:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        if dtype == "int64":
+            bad = values.isna() | (values % 1 != 0)
+            if bad.any():
+                print(f"  WARNING: {filename}: dropping {int(bad.sum())} rows with a non-integer {col}")
+                df, values = df[~bad].reset_index(drop=True), values[~bad].reset_index(drop=True)
+        df[col] = values.astype(dtype)
+    return df
+
+
+def load_timeseries(filename: str) -> pd.DataFrame:
+    """Parse a TimeSeries CSV once per process and return the shared DataFrame."""
+    path = TIMESERIES_DIR / filename
+    df = _TIMESERIES_CACHE.get(path)
+    if df is not None:
+        TIMESERIES_STATS["cache_hits"] += 1
+        count("rows_in", len(df))
+        return df
+
+    columns = TIMESERIES_COLUMNS[filename]
+    t0 = time.perf_counter()
+    df = pd.read_csv(path, usecols=lambda c: c in columns,
+                     dtype={col: dtype for col, dtype in columns.items() if dtype == "str"})
+    df = _coerce_numeric(df, columns, filename)
+    TIMESERIES_STATS["parse_seconds"] += time.perf_counter() - t0
+    TIMESERIES_STATS["parses"] += 1
+    _TIMESERIES_CACHE[path] = df
+    count("rows_in", len(df))
+    count("bytes_read", path.stat().st_size)
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Delta updates
+#
+# With DELTA_YEARS set (--delta-years), the year-keyed stages read only the
+# rows of those years, recompute their share of each output and merge it into
+# the files an earlier full build left in OUTPUT_DIR. Entries of other years
+# are kept as they are; entries of a delta year are replaced, or dropped when
+# the year no longer has data (or is in EXCLUDE_YEARS). Merged years are
+# listed in ascending order, as the source tables list them.
+# ---------------------------------------------------------------------------
+DELTA_YEARS: set[int] = set()
+
+
+def output_years(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows of the years this run writes: all but EXCLUDE_YEARS, and only DELTA_YEARS when set."""
+    keep = ~df["Year"].isin(EXCLUDE_YEARS)
+    if DELTA_YEARS:
+        keep &= df["Year"].isin(DELTA_YEARS)
+    return df[keep]
+
+
+def load_output_json(filename: str):
+    """An output of an earlier build, to merge a delta into."""
+    try:
+        with open(OUTPUT_DIR / filename, "rb") as fh:
+            return json.loads(fh.read())
+    except FileNotFoundError:
+        raise RuntimeError(f"delta update needs an existing {filename}; run a full build first") from None
+
+
+def merge_year_members(old: dict, new: dict) -> dict:
+    """``{year: value}`` of ``old`` with the DELTA_YEARS entries replaced by ``new``."""
+    merged = {year: value for year, value in old.items() if int(year) not in DELTA_YEARS}
+    merged.update(new)
+    return dict(sorted(merged.items(), key=lambda item: int(item[0])))
+
+
+def merge_year_columns(old: dict, new: dict, columns: list[str]) -> dict:
+    """Merge column lists indexed by a ``years`` list; other members come from ``new``."""
+    rows = {
+        year: values for year, *values in zip(old["years"], *(old[col] for col in columns))
+        if year not in DELTA_YEARS
+    }
+    rows.update((year, values) for year, *values in zip(new["years"], *(new[col] for col in columns)))
+    ordered = sorted(rows.items())
+    merged = dict(new, years=[year for year, _ in ordered])
+    for i, col in enumerate(columns):
+        merged[col] = [values[i] for _, values in ordered]
+    return merged
+
+
+def write_route_table(table: dict, filename: str, metrics: list[str], key_table: str) -> None:
+    """Write a nested route table in TABLE_FORMAT, merged into the existing file in delta mode.
+
+    ``key_table`` is the identifier table of the keys (see identifier_keys()).
+    """
+    table = identifier_keys(key_table, table)
+    if DELTA_YEARS:
+        old = nested_route_table(load_output_json(filename))
+        merged = {}
+        for key in {**old, **table}:
+            years = merge_year_members(old.get(key, {}), table.get(key, {}))
+            if years:
+                merged[key] = years
+        table = parsed_key_order(merged) if ENCODE_IDENTIFIERS else merged
+    if TABLE_FORMAT == "columnar":
+        table = columnar_route_table(table, metrics)
+        if ENCODE_IDENTIFIERS:
+            # Key arrays aren't bound to JSON's string keys: write the codes as integers
+            table["keys"] = [int(key) for key in table["keys"]]
+    write_json(table, filename)
+
+
+# ---------------------------------------------------------------------------
+# Identifier dictionary
+#
+# With ENCODE_IDENTIFIERS (--encode-ids), countries, commodities and modes
+# are written as small integer codes: as the top-level keys of the route
+# tables and transport factors (integers in a columnar table's key array),
+# as the mode keys of the transport factors and of bilateral_top_flows.json
+# (its "all" stays as it is), and as the "from", "to", "dominant_mode" and
+# "mode" values of the flow and mode records. The columnar partner shards
+# carry their own dictionaries instead. identifiers.json lists the label of
+# every code per table; src/utils/identifiers.ts decodes the files as they
+# load. The dictionary only ever grows: prepare_identifiers() keeps the codes
+# of the existing file and appends new labels, so files written by earlier
+# runs stay valid. It collects the labels of every input the run's stages
+# read (the bilateral ones from the cache when it is valid), so every
+# identifier an output holds is a code.
+# ---------------------------------------------------------------------------
+ENCODE_IDENTIFIERS = False
+IDENTIFIERS_NAME = "identifiers.json"
+IDENTIFIERS: dict[str, list[str]] = {}     # table -> labels by code, set by prepare_identifiers()
+
+
+def prepare_identifiers(stages: list["Stage"]) -> None:
+    """Extend the dictionary with the labels of the inputs of ``stages`` and load it.
+
+    The TimeSeries tables are always read; the bilateral CSV and the factor
+    files only when their stage runs (skipped stages' outputs hold codes of
+    the existing dictionary). Without ENCODE_IDENTIFIERS a dictionary left by
+    an earlier run is removed.
+    """
+    global IDENTIFIERS
+    path = OUTPUT_DIR / IDENTIFIERS_NAME
+    if not ENCODE_IDENTIFIERS:
+        for suffix in ("", ".gz", ".br"):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+        return
+
+    labels: dict[str, set[str]] = {"countries": set(COUNTRY_META), "commodities": set(), "modes": set()}
+    for filename, table, column in (
+        ("emissions_by_consumer_country_year.csv", "countries", "to_iso3"),
+        ("emissions_by_producer_country_year.csv", "countries", "from_iso3"),
+        ("emissions_by_commodity_year.csv", "commodities", ("commodity_name", "commodity_name_x")),
+        ("emissions_by_year_mode.csv", "modes", "mode"),
+    ):
+        if not (TIMESERIES_DIR / filename).exists():
+            continue
+        df = load_timeseries(filename)
+        col = column if isinstance(column, str) else next((c for c in column if c in df.columns), None)
+        if col is not None:
+            convert = route_label if table == "modes" else str
+            labels[table].update(convert(value) for value in df[col].dropna().unique())
+
+    names = {stage.name for stage in stages}
+    if "bilateral_flows" in names and (TIMESERIES_DIR / BILATERAL_FILENAME).exists():
+        codes = bilateral_codes()
+        for table in ("countries", "commodities", "modes"):
+            labels[table].update(getattr(codes, table).labels)
+    if "transport_factors" in names and TRANSPORT_FACTORS_DIR.exists():
+        commodities, modes = factor_labels()
+        labels["commodities"] |= commodities
+        labels["modes"] |= modes
+
+    try:
+        with open(path, encoding="utf-8") as fh:
+            existing = json.load(fh)
+    except (OSError, ValueError):
+        existing = {}
+    IDENTIFIERS = {}
+    for table, seen in labels.items():
+        codes = list(existing.get(table, []))
+        codes += sorted(seen - set(codes))
+        IDENTIFIERS[table] = codes
+    write_json(IDENTIFIERS, IDENTIFIERS_NAME)
+
+
+def identifier_labels(table: str, labels: list) -> list:
+    """``labels`` as the outputs spell them: dictionary codes with ENCODE_IDENTIFIERS, else unchanged."""
+    if not ENCODE_IDENTIFIERS:
+        return labels
+    code_of = {label: code for code, label in enumerate(IDENTIFIERS[table])}
+    return [code_of[label] for label in labels]
+
+
+def identifier_keys(table: str, data: dict, keep: tuple[str, ...] = ()) -> dict:
+    """``data`` with its keys through identifier_labels(); JSON object keys are strings.
+
+    Keys in ``keep`` (e.g. "all") are not identifiers and stay as they are.
+    Coded keys come first in ascending order, then the kept ones: the order
+    a browser's JSON.parse() gives integer-like keys, so the file's key
+    order survives parsing.
+    """
+    if not ENCODE_IDENTIFIERS:
+        return data
+    coded = [key for key in data if key not in keep]
+    return parsed_key_order({**{str(code): data[key] for key, code in zip(coded, identifier_labels(table, coded))},
+                             **{key: data[key] for key in data if key in keep}})
+
+
+def parsed_key_order(data: dict) -> dict:
+    """``data`` with integer-like keys first, ascending, then the others in their order."""
+    coded = sorted((key for key in data if key.isdigit()), key=int)
+    return {**{key: data[key] for key in coded}, **{key: value for key, value in data.items() if not key.isdigit()}}
+
+
+def decode_identifier(table: str, value):
+    """The label behind a code written by identifier_labels(); other values are returned as they are."""
+    if ENCODE_IDENTIFIERS and isinstance(value, (int, np.integer)):
+        return IDENTIFIERS[table][int(value)]
+    return value
 
 
 # ---------------------------------------------------------------------------
@@ -283,8 +1196,8 @@ def write_json(data: dict | list, filename: str) -> None:
 # ---------------------------------------------------------------------------
 def process_global_timeseries() -> None:
     print("\n[1/10] Processing global timeseries ...")
-    df = pd.read_csv(TIMESERIES_DIR / "global_emissions_by_year.csv")
-    df = df[~df["Year"].isin(EXCLUDE_YEARS)]
+    df = load_timeseries("global_emissions_by_year.csv")
+    df = output_years(df)
 
     result = {
         "years": [int(y) for y in df["Year"]],
@@ -295,6 +1208,10 @@ def process_global_timeseries() -> None:
         "food_miles_billion_tkm": [safe_float(v, 2) for v in df["Food_Miles_Billion_tkm"]],
         "preliminary_years": PRELIMINARY_YEARS,
     }
+    count("rows_out", len(df))
+    if DELTA_YEARS:
+        result = merge_year_columns(load_output_json("global_timeseries.json"), result,
+                                    [col for col in result if col not in ("years", "preliminary_years")])
     write_json(result, "global_timeseries.json")
 
 
@@ -309,23 +1226,29 @@ def process_global_by_mode() -> None:
         write_json({}, "global_by_mode.json")
         return
 
-    df = pd.read_csv(mode_path)
-    df = df[~df["Year"].isin(EXCLUDE_YEARS)]
-
-    result: dict[str, list] = {}
-    for _, row in df.iterrows():
-        year = str(int(row["Year"]))
-        mode = str(row["mode"]).lower().strip()
-        result.setdefault(year, [])
-        result[year].append({
-            "mode": mode,
-            "wtw": safe_float(row.get("WTW_emissions_MtCO2", row.get("WTW_emissions_tCO2", 0)), 2),
-            "ttw": safe_float(row.get("TTW_emissions_MtCO2", row.get("TTW_emissions_tCO2", 0)), 2),
-            "wtt": safe_float(row.get("WTT_emissions_MtCO2", row.get("WTT_emissions_tCO2", 0)), 2),
-            "food_miles": safe_float(row.get("Food_Miles_Billion_tkm", row.get("food_miles_tkm", 0)), 2),
-            "value": safe_float(row.get("Trade_Volume_Mt", row.get("Value", 0)), 2),
-        })
+    df = load_timeseries("emissions_by_year_mode.csv")
+    df = output_years(df)
 
+    keyed = df.assign(
+        year=label_column(df["Year"], year_label),
+        mode=identifier_labels("modes", label_column(df["mode"], route_label).tolist()),
+    )
+    result = build_nested_json(
+        keyed, ["year"],
+        {
+            "wtw": (("WTW_emissions_MtCO2", "WTW_emissions_tCO2"), 2),
+            "ttw": (("TTW_emissions_MtCO2", "TTW_emissions_tCO2"), 2),
+            "wtt": (("WTT_emissions_MtCO2", "WTT_emissions_tCO2"), 2),
+            "food_miles": (("Food_Miles_Billion_tkm", "food_miles_tkm"), 2),
+            "value": (("Trade_Volume_Mt", "Value"), 2),
+        },
+        fields=("mode",),
+        list_leaves=True,
+    )
+
+    count("rows_out", len(df))
+    if DELTA_YEARS:
+        result = merge_year_members(load_output_json("global_by_mode.json"), result)
     write_json(result, "global_by_mode.json")
 
 
@@ -334,29 +1257,19 @@ def process_global_by_mode() -> None:
 # ---------------------------------------------------------------------------
 def process_consumer_countries() -> None:
     print("\n[2/10] Processing consumer countries ...")
-    df = pd.read_csv(TIMESERIES_DIR / "emissions_by_consumer_country_year.csv")
-    df = df[~df["Year"].isin(EXCLUDE_YEARS)]
-
-    result: dict[str, dict] = {}
-    for _, row in df.iterrows():
-        iso3 = str(row["to_iso3"])
-        year = str(int(row["Year"]))
-        route = str(row["route_type"]).lower().strip()
-        if route not in ("bilateral", "domestic"):
-            continue
-
-        result.setdefault(iso3, {})
-        result[iso3].setdefault(year, {})
-        result[iso3][year][route] = {
-            "wtw": safe_float(row["WTW_emissions_tCO2"], 1),
-            "ttw": safe_float(row["TTW_emissions_tCO2"], 1),
-            "wtt": safe_float(row["WTT_emissions_tCO2"], 1),
-            "food_miles": safe_float(row["food_miles_tkm"], 0),
-            "value": safe_float(row["Value"], 1),
-            "cost": safe_float(row.get("total_transport_cost_USD", 0), 1),
-        }
-
-    write_json(result, "consumer_countries.json")
+    df = load_timeseries("emissions_by_consumer_country_year.csv")
+    df = output_years(df)
+
+    metrics = {
+        "wtw": ("WTW_emissions_tCO2", 1),
+        "ttw": ("TTW_emissions_tCO2", 1),
+        "wtt": ("WTT_emissions_tCO2", 1),
+        "food_miles": ("food_miles_tkm", 0),
+        "value": ("Value", 1),
+        "cost": ("total_transport_cost_USD", 1),
+    }
+    write_route_table(route_table_json(df, "to_iso3", metrics), "consumer_countries.json", list(metrics),
+                      "countries")
 
 
 # ---------------------------------------------------------------------------
@@ -364,28 +1277,18 @@ def process_consumer_countries() -> None:
 # ---------------------------------------------------------------------------
 def process_producer_countries() -> None:
     print("\n[3/10] Processing producer countries ...")
-    df = pd.read_csv(TIMESERIES_DIR / "emissions_by_producer_country_year.csv")
-    df = df[~df["Year"].isin(EXCLUDE_YEARS)]
-
-    result: dict[str, dict] = {}
-    for _, row in df.iterrows():
-        iso3 = str(row["from_iso3"])
-        year = str(int(row["Year"]))
-        route = str(row["route_type"]).lower().strip()
-        if route not in ("bilateral", "domestic"):
-            continue
-
-        result.setdefault(iso3, {})
-        result[iso3].setdefault(year, {})
-        result[iso3][year][route] = {
-            "wtw": safe_float(row["WTW_emissions_tCO2"], 1),
-            "ttw": safe_float(row["TTW_emissions_tCO2"], 1),
-            "wtt": safe_float(row["WTT_emissions_tCO2"], 1),
-            "food_miles": safe_float(row["food_miles_tkm"], 0),
-            "value": safe_float(row["Value"], 1),
-        }
-
-    write_json(result, "producer_countries.json")
+    df = load_timeseries("emissions_by_producer_country_year.csv")
+    df = output_years(df)
+
+    metrics = {
+        "wtw": ("WTW_emissions_tCO2", 1),
+        "ttw": ("TTW_emissions_tCO2", 1),
+        "wtt": ("WTT_emissions_tCO2", 1),
+        "food_miles": ("food_miles_tkm", 0),
+        "value": ("Value", 1),
+    }
+    write_route_table(route_table_json(df, "from_iso3", metrics), "producer_countries.json", list(metrics),
+                      "countries")
 
 
 # ---------------------------------------------------------------------------
@@ -393,295 +1296,1863 @@ def process_producer_countries() -> None:
 # ---------------------------------------------------------------------------
 def process_commodities() -> None:
     print("\n[4/10] Processing commodities ...")
-    df = pd.read_csv(TIMESERIES_DIR / "emissions_by_commodity_year.csv")
-    df = df[~df["Year"].isin(EXCLUDE_YEARS)]
+    df = load_timeseries("emissions_by_commodity_year.csv")
+    df = output_years(df)
 
     # New data uses "commodity_name" instead of "commodity_name_x"
     comm_col = "commodity_name" if "commodity_name" in df.columns else "commodity_name_x"
     print(f"    Using commodity column: {comm_col}")
 
-    result: dict[str, dict] = {}
-    for _, row in df.iterrows():
-        comm = str(row[comm_col])
-        year = str(int(row["Year"]))
-        route = str(row["route_type"]).lower().strip()
-        if route not in ("bilateral", "domestic"):
-            continue
+    metrics = {
+        "wtw": ("WTW_emissions_tCO2", 1),
+        "ttw": ("TTW_emissions_tCO2", 1),
+        "food_miles": ("food_miles_tkm", 0),
+        "value": ("Value", 1),
+    }
+    write_route_table(route_table_json(df, comm_col, metrics), "commodities.json", list(metrics),
+                      "commodities")
+
+
+# ---------------------------------------------------------------------------
+# 5. Bilateral flows (large file, chunked, single scan)
+#
+# The bilateral CSV is by far the largest input, so it is read exactly once.
+# scan_bilateral() parses and cleans each chunk a single time and hands it to
+# every registered aggregator; each aggregator keeps its own running state and
+# writes its output file in finalize().
+# ---------------------------------------------------------------------------
+BILATERAL_FILENAME = "bilateral_emissions_timeseries_all_flows.csv"
+BILATERAL_BASE_COLUMNS = ["Year", "from_iso3", "to_iso3", "route_type", "mode"]
+BILATERAL_METRIC_COLUMNS = [
+    "WTW_emissions_tCO2", "TTW_emissions_tCO2", "WTT_emissions_tCO2",
+    "food_miles_tkm", "total_transport_cost_USD",
+]
+
+
+class CodeTable:
+    """Append-only dictionary encoding of labels to small integer codes.
+
+    Codes are handed out in first-seen order, so they are stable for the
+    lifetime of a scan and follow the same order as the dicts they replace.
+    """
+
+    def __init__(self) -> None:
+        self.labels: list = []
+        self._codes: dict = {}
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def code(self, label) -> int:
+        idx = self._codes.get(label)
+        if idx is None:
+            idx = len(self.labels)
+            self._codes[label] = idx
+            self.labels.append(label)
+        return idx
+
+    def encode(self, values: pd.Series, convert=str) -> np.ndarray:
+        """Encode a column; each distinct value is passed through ``convert`` first."""
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        lookup = np.array([self.code(convert(u)) for u in uniques], dtype=np.int64)
+        return lookup[codes]
+
+
+class BilateralCodes:
+    """Code tables shared by every chunk of one bilateral scan."""
+
+    TABLES = ("years", "routes", "modes", "countries", "commodities")
+
+    def __init__(self) -> None:
+        self.years = CodeTable()
+        self.routes = CodeTable()
+        self.modes = CodeTable()
+        self.countries = CodeTable()     # from_iso3 and to_iso3 share one table
+        self.commodities = CodeTable()
+
+    def to_dict(self) -> dict[str, list]:
+        return {name: getattr(self, name).labels for name in self.TABLES}
+
+    @classmethod
+    def from_dict(cls, tables: dict[str, list]) -> "BilateralCodes":
+        codes = cls()
+        for name in cls.TABLES:
+            table = getattr(codes, name)
+            for label in tables[name]:
+                table.code(label)
+        return codes
+
+    def remap(self, tables: dict[str, list]) -> dict[str, np.ndarray]:
+        """Code arrays mapping another scan's codes (its to_dict()) onto these tables."""
+        return {
+            name: np.array([getattr(self, name).code(label) for label in tables[name]], dtype=np.int64)
+            for name in self.TABLES
+        }
+
+    def bilateral_mask(self, chunk: "BilateralChunk") -> np.ndarray:
+        """Rows that are bilateral flows in a year that is not excluded (and is a delta year, if any)."""
+        keep_route = np.array([r == "bilateral" for r in self.routes.labels], dtype=bool)
+        keep_year = np.array([y not in EXCLUDE_YEARS and (not DELTA_YEARS or y in DELTA_YEARS)
+                              for y in self.years.labels], dtype=bool)
+        return keep_route[chunk.route] & keep_year[chunk.year]
+
+
+@dataclass
+class BilateralChunk:
+    """One cleaned chunk of bilateral rows as integer codes and metric columns."""
+
+    year: np.ndarray
+    route: np.ndarray
+    mode: np.ndarray
+    from_iso3: np.ndarray
+    to_iso3: np.ndarray
+    commodity: np.ndarray | None
+    metrics: np.ndarray                  # shape (len(BILATERAL_METRIC_COLUMNS), rows)
+
+    def __len__(self) -> int:
+        return len(self.year)
+
+    def take(self, mask: np.ndarray) -> "BilateralChunk":
+        return BilateralChunk(
+            year=self.year[mask],
+            route=self.route[mask],
+            mode=self.mode[mask],
+            from_iso3=self.from_iso3[mask],
+            to_iso3=self.to_iso3[mask],
+            commodity=None if self.commodity is None else self.commodity[mask],
+            metrics=self.metrics[:, mask],
+        )
+
 
-        result.setdefault(comm, {})
-        result[comm].setdefault(year, {})
-        result[comm][year][route] = {
-            "wtw": safe_float(row["WTW_emissions_tCO2"], 1),
-            "ttw": safe_float(row["TTW_emissions_tCO2"], 1),
-            "food_miles": safe_float(row["food_miles_tkm"], 0),
-            "value": safe_float(row["Value"], 1),
+def _pack_keys(*fields: np.ndarray) -> np.ndarray:
+    """Pack integer code columns into one int64 key, 16 bits per trailing field."""
+    key = np.zeros(len(fields[0]), dtype=np.int64)
+    for field in fields:
+        key = (key << 16) | field.astype(np.int64)
+    return key
+
+
+def _unpack_keys(keys: np.ndarray, n_fields: int) -> list[np.ndarray]:
+    fields = []
+    for _ in range(n_fields - 1):
+        fields.append(keys & 0xFFFF)
+        keys = keys >> 16
+    fields.append(keys)
+    return fields[::-1]
+
+
+class KeyedSums:
+    """Running per-key sums of several metrics, keyed by packed int64 keys.
+
+    Each distinct key gets a dense slot in first-seen order, and values are
+    scatter-added with ``np.add.at`` in row order. Every sum is therefore
+    accumulated in exactly the order a row-by-row loop over the file would
+    use, and merging chunk after chunk gives bit-identical totals.
+    """
+
+    def __init__(self, width: int) -> None:
+        self.size = 0
+        self.keys = np.empty(0, dtype=np.int64)
+        self.sums = np.zeros((width, 0))
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._sorted_keys = np.empty(0, dtype=np.int64)
+        self._sorted_slots = np.empty(0, dtype=np.int64)
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self.keys)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        keys = np.empty(capacity, dtype=np.int64)
+        keys[:self.size] = self.keys[:self.size]
+        sums = np.zeros((self.sums.shape[0], capacity))
+        sums[:, :self.size] = self.sums[:, :self.size]
+        counts = np.zeros(capacity, dtype=np.int64)
+        counts[:self.size] = self.counts[:self.size]
+        self.keys, self.sums, self.counts = keys, sums, counts
+
+    def slots(self, keys: np.ndarray) -> np.ndarray:
+        """Return the slot of every key, allocating slots for unseen keys."""
+        codes, uniques = pd.factorize(keys)
+        slot_of = np.empty(len(uniques), dtype=np.int64)
+        found = np.zeros(len(uniques), dtype=bool)
+        if len(self._sorted_keys):
+            pos = np.searchsorted(self._sorted_keys, uniques)
+            pos = np.minimum(pos, len(self._sorted_keys) - 1)
+            found = self._sorted_keys[pos] == uniques
+            slot_of[found] = self._sorted_slots[pos[found]]
+
+        new_keys = uniques[~found]
+        if len(new_keys):
+            new_slots = np.arange(self.size, self.size + len(new_keys))
+            slot_of[~found] = new_slots
+            self._reserve(self.size + len(new_keys))
+            self.keys[self.size:self.size + len(new_keys)] = new_keys
+            self.size += len(new_keys)
+
+            merged_keys = np.concatenate([self._sorted_keys, new_keys])
+            merged_slots = np.concatenate([self._sorted_slots, new_slots])
+            order = np.argsort(merged_keys, kind="stable")
+            self._sorted_keys = merged_keys[order]
+            self._sorted_slots = merged_slots[order]
+        return slot_of[codes]
+
+    def add(self, keys: np.ndarray, values: np.ndarray, counts: np.ndarray | None = None) -> np.ndarray:
+        """Add ``values`` (shape ``(width, len(keys))``) into the running sums."""
+        slots = self.slots(keys)
+        for col in range(self.sums.shape[0]):
+            np.add.at(self.sums[col], slots, values[col])
+        if counts is None:
+            self.counts += np.bincount(slots, minlength=len(self.counts))
+        else:
+            self.counts += np.bincount(slots, weights=counts, minlength=len(self.counts)).astype(np.int64)
+        return slots
+
+    def view(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Keys, sums and counts of the filled slots, in slot order."""
+        return self.keys[:self.size], self.sums[:, :self.size], self.counts[:self.size]
+
+
+def _dominant_modes(owner: np.ndarray, mode: np.ndarray, ttw: np.ndarray,
+                    n_owners: int, n_modes: int) -> np.ndarray:
+    """Per owner, the mode code with the largest TTW.
+
+    ``owner``/``mode``/``ttw`` list distinct (owner, mode) pairs in the order
+    they were first seen. Ties go to the earliest pair, matching
+    ``max(d, key=d.get)`` over an insertion-ordered dict.
+    """
+    if not n_owners:
+        return np.empty(0, dtype=np.int64)
+    never = np.iinfo(np.int64).max
+    score = np.full((n_owners, n_modes), -np.inf)
+    score[owner, mode] = ttw
+    seen = np.full((n_owners, n_modes), never, dtype=np.int64)
+    seen[owner, mode] = np.arange(len(owner))
+    best = score.max(axis=1, keepdims=True)
+    rank = np.where((score == best) & (seen != never), seen, never)
+    return rank.argmin(axis=1)
+
+
+def _flow_dict(from_iso3: str, to_iso3: str, sums: np.ndarray, count, dominant_mode: str) -> dict:
+    """Build one output corridor from a column of KeyedSums in metric order."""
+    return {
+        "from": from_iso3,
+        "to": to_iso3,
+        "wtw": safe_float(sums[0], 1),
+        "ttw": safe_float(sums[1], 1),
+        "wtt": safe_float(sums[2], 1),
+        "food_miles": safe_float(sums[3], 0),
+        "cost": safe_float(sums[4], 1),
+        "n_commodities": int(count),
+        "dominant_mode": dominant_mode,
+    }
+
+
+# Columns of the binary flow tables, in file order: name -> (dtype, decimals).
+# Metrics are rounded like _flow_dict, so they decode to the JSON values.
+FLOW_TABLE_COLUMNS: dict[str, tuple[str, int | None]] = {
+    "wtw": ("<f8", 1),
+    "ttw": ("<f8", 1),
+    "wtt": ("<f8", 1),
+    "food_miles": ("<f8", 0),
+    "cost": ("<f8", 1),
+    "n_commodities": ("<u4", None),
+    "from": ("<u2", None),
+    "to": ("<u2", None),
+    "dominant_mode": ("<u2", None),
+}
+FLOW_TABLE_BINARY = False
+
+
+def _flow_columns(from_iso3, to_iso3, sums: np.ndarray, counts, dominant) -> dict[str, np.ndarray]:
+    """The FLOW_TABLE_COLUMNS of a block of corridors (indices into the scan's code tables)."""
+    values = dict(zip(("wtw", "ttw", "wtt", "food_miles", "cost"), sums))
+    values.update(n_commodities=counts, to=to_iso3, dominant_mode=dominant)
+    values["from"] = from_iso3
+    columns = {}
+    for name, (dtype, decimals) in FLOW_TABLE_COLUMNS.items():
+        col = values[name]
+        columns[name] = (round_array(col, decimals) if decimals is not None else col).astype(dtype)
+    return columns
+
+
+def write_flow_tables_binary(
+    blocks: list[tuple[str, str, dict[str, np.ndarray]]],
+    countries: list[str],
+    modes: list[str],
+    filename: str,
+) -> None:
+    """Write (year, mode) corridor blocks as packed typed arrays (see write_typed_arrays).
+
+    The header lists the country and mode labels the index columns refer to
+    and, per block, the position of each column in ``arrays``.
+    """
+    arrays: list[np.ndarray] = []
+    index: list[dict] = []
+    for year_str, mode_label, columns in blocks:
+        entry = {"year": year_str, "mode": mode_label, "length": len(columns["ttw"]), "columns": {}}
+        for name in FLOW_TABLE_COLUMNS:
+            entry["columns"][name] = len(arrays)
+            arrays.append(columns[name])
+        index.append(entry)
+    header = {"countries": [str(c) for c in countries], "modes": [str(m) for m in modes], "blocks": index}
+    write_typed_arrays(header, arrays, filename)
+
+
+def flow_table_blocks(flows: dict[str, dict[str, list[dict]]]) -> tuple[list, list[str], list[str]]:
+    """Binary flow-table blocks, country and mode labels rebuilt from ``{year: {mode: [flow]}}``.
+
+    Encoded identifiers are decoded: the binary tables carry their own labels.
+    """
+    countries, modes = CodeTable(), CodeTable()
+    blocks = []
+    for year_str, by_mode in flows.items():
+        for mode_key, rows in by_mode.items():
+            mode_label = decode_identifier("modes", int(mode_key)) if ENCODE_IDENTIFIERS and mode_key != "all" else mode_key
+            frame = pd.DataFrame(rows, columns=list(FLOW_TABLE_COLUMNS))
+            blocks.append((year_str, mode_label, _flow_columns(
+                countries.encode(frame["from"], lambda c: decode_identifier("countries", c)),
+                countries.encode(frame["to"], lambda c: decode_identifier("countries", c)),
+                frame[["wtw", "ttw", "wtt", "food_miles", "cost"]].to_numpy(dtype=np.float64).T,
+                frame["n_commodities"].to_numpy(),
+                modes.encode(frame["dominant_mode"], lambda m: decode_identifier("modes", m)))))
+    return blocks, countries.labels, modes.labels
+
+
+def top_k_indices(score: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` largest scores, largest first, ties in position order.
+
+    Same order as a stable ``sort(reverse=True)`` followed by ``[:k]``, but
+    only the candidates from a partial selection are sorted.
+    """
+    n = len(score)
+    if n > k:
+        kth = np.partition(score, n - k)[n - k]
+        candidates = np.flatnonzero(score >= kth)      # keeps ties at the cut
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -score[candidates]))
+    return candidates[order[:k]]
+
+
+def iter_groups(group: np.ndarray) -> Iterator[tuple[int, np.ndarray]]:
+    """Yield (group code, member positions in ascending order) for each group."""
+    order = np.argsort(group, kind="stable")
+    bounds = np.flatnonzero(np.diff(group[order])) + 1
+    for members in np.split(order, bounds):
+        if len(members):
+            yield int(group[members[0]]), members
+
+
+def top_flows_per_group(group: np.ndarray, ttw: np.ndarray, k: int) -> Iterator[tuple[int, np.ndarray]]:
+    """Per group, the slots of the ``k`` corridors with the largest rounded TTW.
+
+    Ranking uses TTW as written to the output (rounded to 1 decimal) with
+    ties kept in slot order, exactly like sorting the output dicts by "ttw".
+    """
+    rank = round_array(ttw, 1)
+    for g, members in iter_groups(group):
+        yield g, members[top_k_indices(rank[members], k)]
+
+
+@dataclass
+class GroupSums:
+    """Metric sums per group of cube cells, in the order the groups were first seen.
+
+    ``fields`` holds one code array per grouping column and ``owner`` the
+    group of every cube cell.
+    """
+
+    fields: list[np.ndarray]
+    sums: np.ndarray                     # shape (len(BILATERAL_METRIC_COLUMNS), groups)
+    counts: np.ndarray
+    owner: np.ndarray
+
+
+# Grain of the emissions cube: one cell per distinct combination.
+CUBE_COLUMNS = ("year", "mode", "commodity", "from_iso3", "to_iso3")
+# Code columns -> the BilateralCodes table their codes index
+_CODE_TABLE_OF = {
+    "year": "years", "route": "routes", "mode": "modes",
+    "from_iso3": "countries", "to_iso3": "countries", "commodity": "commodities",
+}
+
+
+@dataclass
+class EmissionsCube:
+    """Bilateral flows summed to (year, mode, commodity, from_iso3, to_iso3).
+
+    Cells are grouped by year and, within a year, listed in the order their
+    first row appears in the source file; ``counts`` is the number of source
+    rows per cell. Every bilateral output is a roll-up of the cube.
+    ``route_totals`` holds the scan's ScanTotals (every row, bilateral or not).
+    """
+
+    year: np.ndarray
+    mode: np.ndarray
+    commodity: np.ndarray
+    from_iso3: np.ndarray
+    to_iso3: np.ndarray
+    sums: np.ndarray                     # shape (len(BILATERAL_METRIC_COLUMNS), cells)
+    counts: np.ndarray
+    route_totals: dict[str, dict[str, list[float]]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.year)
+
+    def take(self, index: np.ndarray) -> "EmissionsCube":
+        return EmissionsCube(
+            sums=self.sums[:, index],
+            counts=self.counts[index],
+            route_totals=self.route_totals,
+            **{col: getattr(self, col)[index] for col in CUBE_COLUMNS},
+        )
+
+    def remap(self, remap: dict[str, np.ndarray]) -> "EmissionsCube":
+        """The cube with its codes mapped through BilateralCodes.remap() arrays."""
+        return EmissionsCube(
+            sums=self.sums,
+            counts=self.counts,
+            route_totals=self.route_totals,
+            **{col: remap[_CODE_TABLE_OF[col]][getattr(self, col)] for col in CUBE_COLUMNS},
+        )
+
+    def rollup(self, columns: tuple[str, ...]) -> GroupSums:
+        """Sum the cells per combination of up to four of the CUBE_COLUMNS.
+
+        Cells are added in cube order, so groups come out in first-seen order.
+        """
+        agg = KeyedSums(len(BILATERAL_METRIC_COLUMNS))
+        owner = agg.add(_pack_keys(*(getattr(self, col) for col in columns)), self.sums, self.counts)
+        keys, sums, counts = agg.view()
+        return GroupSums(_unpack_keys(keys, len(columns)), sums, counts, owner)
+
+
+class ScanTotals:
+    """Metric sums of every scanned row per (route_type, year) label, bilateral or not.
+
+    The cube keeps only bilateral rows; these totals travel with it so the
+    reconciliation checks can compare whole years with the global table
+    without another pass over the rows.
+    """
+
+    def __init__(self) -> None:
+        self.sums: dict[str, dict[str, np.ndarray]] = {}
+
+    def add(self, chunk: "BilateralChunk", codes: "BilateralCodes") -> None:
+        if not len(chunk):
+            return
+        group, keys = pd.factorize(_pack_keys(chunk.route, chunk.year))
+        sums = np.vstack([np.bincount(group, weights=values, minlength=len(keys)) for values in chunk.metrics])
+        for g, (route, year) in enumerate(zip(*_unpack_keys(keys, 2))):
+            self._add(str(codes.routes.labels[route]), str(codes.years.labels[year]), sums[:, g])
+
+    def merge(self, totals: dict[str, dict[str, list[float]]]) -> None:
+        """Add totals in the to_dict() form (e.g. from another byte range)."""
+        for route, by_year in totals.items():
+            for year, sums in by_year.items():
+                self._add(route, year, np.asarray(sums))
+
+    def _add(self, route: str, year: str, sums: np.ndarray) -> None:
+        by_year = self.sums.setdefault(route, {})
+        by_year[year] = by_year[year] + sums if year in by_year else sums.astype(np.float64)
+
+    def to_dict(self) -> dict[str, dict[str, list[float]]]:
+        return {route: {year: sums.tolist() for year, sums in by_year.items()}
+                for route, by_year in self.sums.items()}
+
+
+class BilateralAggregator:
+    """Consumer of the emissions cube.
+
+    Subclasses roll the cube up to the grain they need in ``finalize()`` and
+    write the files named in ``outputs``.
+    """
+
+    label = "bilateral"
+    outputs: tuple[str, ...] = ()
+
+    def finalize(self, codes: BilateralCodes, cube: EmissionsCube) -> None:
+        raise NotImplementedError
+
+
+def corridors_by_mode(cube: EmissionsCube, n_modes: int) -> tuple[GroupSums, GroupSums, np.ndarray]:
+    """Corridor sums per (year, mode, from_iso3, to_iso3) and across modes.
+
+    The second GroupSums is keyed by (year, from_iso3, to_iso3) and adds the
+    per-mode sums in the order the corridors were first seen; its ``owner``
+    maps each per-mode corridor to its cross-mode one. The array holds each
+    cross-mode corridor's dominant mode by TTW.
+    """
+    groups = cube.rollup(("year", "mode", "from_iso3", "to_iso3"))
+    year, mode, from_iso3, to_iso3 = groups.fields
+    all_agg = KeyedSums(len(BILATERAL_METRIC_COLUMNS))
+    owner = all_agg.add(_pack_keys(year, from_iso3, to_iso3), groups.sums, groups.counts)
+    all_keys, all_sums, all_counts = all_agg.view()
+    dominant = _dominant_modes(owner, mode, groups.sums[1], all_agg.size, n_modes)
+    return groups, GroupSums(_unpack_keys(all_keys, 3), all_sums, all_counts, owner), dominant
+
+
+class TopFlowsByModeAggregator(BilateralAggregator):
+    """Top corridors per mode per year, plus top corridors across all modes.
+
+    Each row has a specific mode (air/maritime/land). We produce the top 100
+    corridors per mode per year, plus the top 100 across all modes.
+    Output: { "2023": { "all": [...], "maritime": [...], "air": [...], "land": [...] } }
+    """
+
+    label = "bilateral top flows per mode"
+    outputs = ("bilateral_top_flows.json",)
+
+    def finalize(self, codes: BilateralCodes, cube: EmissionsCube) -> None:
+        # Metric sums per (year, mode, from_iso3, to_iso3); "all" aggregates
+        # them across modes for each (year, from, to)
+        years = codes.years.labels
+        modes = codes.modes.labels
+        countries = codes.countries.labels
+        country_ids = identifier_labels("countries", countries)
+        mode_ids = identifier_labels("modes", modes)
+        groups, all_groups, dominant = corridors_by_mode(cube, len(modes))
+        year, mode, from_iso3, to_iso3 = groups.fields
+        sums, counts = groups.sums, groups.counts
+        a_year, a_from, a_to = all_groups.fields
+        all_sums, all_counts = all_groups.sums, all_groups.counts
+
+        # Select top N per mode per year: { year_str: { mode: top slots } }, with
+        # modes in first-seen order and "all" last
+        selected: dict[str, dict[str, np.ndarray]] = defaultdict(dict)
+        blocks: list[tuple[str, str, dict[str, np.ndarray]]] = []
+        group, group_keys = pd.factorize(_pack_keys(year, mode))
+        for g, top in top_flows_per_group(group, sums[1], TOP_N_BILATERAL_PER_MODE):
+            g_year, g_mode = _unpack_keys(group_keys[g:g + 1], 2)
+            m = modes[g_mode[0]]
+            year_str = str(years[g_year[0]])
+            selected[year_str][m] = top
+            if FLOW_TABLE_BINARY:
+                blocks.append((year_str, m, _flow_columns(
+                    from_iso3[top], to_iso3[top], sums[:, top], counts[top], mode[top])))
+
+        group, group_years = pd.factorize(a_year)
+        for g, top in top_flows_per_group(group, all_sums[1], TOP_N_BILATERAL_PER_MODE):
+            year_str = str(years[group_years[g]])
+            selected[year_str]["all"] = top
+            if FLOW_TABLE_BINARY:
+                blocks.append((year_str, "all", _flow_columns(
+                    a_from[top], a_to[top], all_sums[:, top], all_counts[top], dominant[top])))
+
+        def year_flows(year_str: str) -> dict[str, list]:
+            """{ mode: [flows] } for one year; dicts are only built for the survivors."""
+            flows = {}
+            for m, top in selected[year_str].items():
+                if m == "all":
+                    flows[m] = [
+                        _flow_dict(country_ids[a_from[i]], country_ids[a_to[i]], all_sums[:, i], all_counts[i],
+                                   mode_ids[dominant[i]])
+                        for i in top
+                    ]
+                else:
+                    flows[m] = [
+                        _flow_dict(country_ids[from_iso3[i]], country_ids[to_iso3[i]], sums[:, i], counts[i],
+                                   mode_ids[mode[i]])
+                        for i in top
+                    ]
+            return identifier_keys("modes", flows, keep=("all",))
+
+        if DELTA_YEARS:
+            # Merge into the existing file; the binary tables are rebuilt from the merged flows
+            merged = merge_year_members(load_output_json("bilateral_top_flows.json"),
+                                        {year_str: year_flows(year_str) for year_str in selected})
+            write_json_stream(merged.items(), "bilateral_top_flows.json")
+            if FLOW_TABLE_BINARY:
+                blocks, countries, modes = flow_table_blocks(merged)
+        else:
+            # One year's dicts at a time
+            write_json_stream(((year_str, year_flows(year_str)) for year_str in sorted(selected)),
+                              "bilateral_top_flows.json")
+        if FLOW_TABLE_BINARY:
+            write_flow_tables_binary(blocks, countries, modes, "bilateral_top_flows.bin")
+        else:
+            # Don't leave an older binary export to shadow the JSON
+            for suffix in ("", ".gz", ".br"):
+                (OUTPUT_DIR / f"bilateral_top_flows.bin{suffix}").unlink(missing_ok=True)
+
+
+def shard_filename(label: str, taken: set[str]) -> str:
+    """A filesystem-safe, unique ``<slug>.json`` name for a shard; adds it to ``taken``."""
+    slug = "".join(ch if ch.isalnum() else "_" for ch in label.lower())
+    slug = "_".join(part for part in slug.split("_") if part) or "shard"
+    name, n = f"{slug}.json", 1
+    while name in taken:
+        n += 1
+        name = f"{slug}_{n}.json"
+    taken.add(name)
+    return name
+
+
+def write_json_shards(shards: Iterable[tuple[str, object]], directory: str, manifest_name: str,
+                      existing: dict[str, dict] | None = None) -> None:
+    """Write one JSON file per (label, data) pair under ``directory`` plus a manifest.
+
+    Each shard is written as soon as ``shards`` yields it, so a generator
+    keeps only one shard's data alive.
+    The manifest maps each label to its shard's path (relative to
+    OUTPUT_DIR), byte size and BLAKE2b hash, so the front-end can list the
+    labels up front and fetch a single shard on demand, in label order.
+    ``existing`` is the index of an earlier manifest to update: its shards
+    keep their paths and those not yielded are kept as they are, except
+    that a None ``data`` drops the label. Shards left over from an earlier
+    run are removed (their hashed copies go in publish_hashed_outputs).
+    """
+    shard_dir = OUTPUT_DIR / directory
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    index: dict[str, dict] = dict(existing or {})
+    taken = {Path(entry["path"]).name for entry in index.values()}
+    for label, data in shards:
+        if data is None:
+            index.pop(label, None)
+            continue
+        path = index[label]["path"] if label in index else f"{directory}/{shard_filename(label, taken)}"
+        payload = write_json(data, path, quiet=True)
+        index[label] = {
+            "path": path,
+            "bytes": len(payload),
+            "blake2b": hashlib.blake2b(payload, digest_size=20).hexdigest(),
         }
+    index = dict(sorted(index.items()))
+    taken = {Path(entry["path"]).name for entry in index.values()}
+    for stale in shard_dir.glob("*.json"):
+        if stale.name not in taken and not _HASHED_NAME.search(stale.name):
+            for suffix in ("", ".gz", ".br"):
+                stale.with_name(stale.name + suffix).unlink(missing_ok=True)
+
+    total_mb = sum(entry["bytes"] for entry in index.values()) / (1024 * 1024)
+    print(f"  -> {directory}/ ({len(index)} shards, {total_mb:.2f} MB)")
+    write_json({"shards": index}, manifest_name)
+
+
+def write_year_shards(shards: Iterable[tuple[str, dict]], directory: str, manifest_name: str,
+                      layout: tuple[Callable[[str, dict], dict], Callable[[dict], dict]] | None = None) -> None:
+    """write_json_shards() for ``{year: ...}`` shards, merged into the existing ones in delta mode.
+
+    ``layout`` is an optional (encode, decode) pair: each shard is written
+    as ``encode(label, shard)``, and decode() turns a written shard back
+    into ``{year: ...}`` for a delta merge. A delta run rewrites only the
+    shards that gain or lose delta-year data.
+    """
+    encode, decode = layout or (lambda label, shard: shard, lambda data: data)
+    if not DELTA_YEARS:
+        write_json_shards(((label, encode(label, shard)) for label, shard in shards), directory, manifest_name)
+        return
+    existing = load_output_json(manifest_name)["shards"]
+    new = dict(shards)
+
+    def merged() -> Iterator[tuple[str, dict | None]]:
+        for label in sorted(set(existing) | set(new)):
+            if label not in existing:
+                yield label, encode(label, new[label])
+                continue
+            old = decode(load_output_json(existing[label]["path"]))
+            if label in new or any(int(year) in DELTA_YEARS for year in old):
+                shard = merge_year_members(old, new.get(label, {}))
+                yield label, encode(label, shard) if shard else None
+
+    write_json_shards(merged(), directory, manifest_name, existing)
+
+
+class FlowsByCommodityAggregator(BilateralAggregator):
+    """Top corridors per commodity per year, tagged with their dominant mode.
+
+    Written as one ``{year: [flow, ...]}`` shard per commodity under
+    ``bilateral_by_commodity/``, indexed by ``bilateral_by_commodity_manifest.json``.
+    """
+
+    label = "bilateral flows by commodity"
+    outputs = ("bilateral_by_commodity_manifest.json",)
+
+    def finalize(self, codes: BilateralCodes, cube: EmissionsCube) -> None:
+        # Metric sums per (commodity, year, from_iso3, to_iso3); each cube cell
+        # is one (flow, mode) pair, which gives the dominant mode
+        groups = cube.rollup(("commodity", "year", "from_iso3", "to_iso3"))
+        commodity, year, from_iso3, to_iso3 = groups.fields
+        sums, counts = groups.sums, groups.counts
+        dominant = _dominant_modes(groups.owner, cube.mode, cube.sums[1], len(counts), len(codes.modes))
+
+        commodities = codes.commodities.labels
+        years = codes.years.labels
+        country_ids = identifier_labels("countries", codes.countries.labels)
+        mode_ids = identifier_labels("modes", codes.modes.labels)
+
+        # Top slots per commodity per year; flow dicts are built one shard at a time
+        selected: dict[str, dict[str, np.ndarray]] = defaultdict(dict)
+        group, group_keys = pd.factorize(_pack_keys(commodity, year))
+        for g, top in top_flows_per_group(group, sums[1], TOP_N_BILATERAL_PER_COMMODITY):
+            g_comm, g_year = _unpack_keys(group_keys[g:g + 1], 2)
+            selected[commodities[g_comm[0]]][str(years[g_year[0]])] = top
+
+        def shards() -> Iterator[tuple[str, dict[str, list]]]:
+            for comm, year_tops in sorted(selected.items()):
+                yield comm, {
+                    year_str: [
+                        _flow_dict(country_ids[from_iso3[i]], country_ids[to_iso3[i]], sums[:, i], counts[i],
+                                   mode_ids[dominant[i]])
+                        for i in year_tops[year_str]
+                    ]
+                    for year_str in sorted(year_tops)
+                }
+
+        write_year_shards(shards(), "bilateral_by_commodity", "bilateral_by_commodity_manifest.json")
+
+
+PARTNER_DIRECTIONS = ("imports", "exports")
+PARTNER_METRICS = ("wtw", "ttw", "wtt", "food_miles", "cost", "n_commodities")
+
+
+def columnar_partner_shard(iso3: str, nested: dict) -> dict:
+    """Re-encode a country's ``{year: {direction: {mode: [flow]}}}`` shard column by column.
+
+    Like columnar_route_table(): years, modes and partner countries are
+    stored once in dictionaries, and each row (one flow) holds their
+    positions plus one entry per metric array. A flow's other end is the
+    shard's own ``country``, so only the partner is stored: "from" for
+    imports, "to" for exports. Rows keep the nested order, so decoding them
+    in order (src/utils/columnar.ts) rebuilds the same object.
+    """
+    years = list(nested)
+    modes: dict[str, int] = {}
+    partners: dict[str, int] = {}
+    rows: dict[str, list[int]] = {"year": [], "direction": [], "mode": [], "partner": [], "dominant_mode": []}
+    values: dict[str, list] = {name: [] for name in PARTNER_METRICS}
+    for year_idx, by_direction in enumerate(nested.values()):
+        for direction, by_mode in by_direction.items():
+            partner_end = "from" if direction == "imports" else "to"
+            for m, flows in by_mode.items():
+                mode_idx = modes.setdefault(m, len(modes))
+                for flow in flows:
+                    rows["year"].append(year_idx)
+                    rows["direction"].append(PARTNER_DIRECTIONS.index(direction))
+                    rows["mode"].append(mode_idx)
+                    rows["partner"].append(partners.setdefault(flow[partner_end], len(partners)))
+                    rows["dominant_mode"].append(modes.setdefault(flow["dominant_mode"], len(modes)))
+                    for name in PARTNER_METRICS:
+                        values[name].append(flow[name])
+    return {
+        "format": "columnar",
+        "country": iso3,
+        "years": years,
+        "directions": list(PARTNER_DIRECTIONS),
+        "modes": list(modes),
+        "partners": list(partners),
+        "rows": rows,
+        "values": values,
+    }
 
-    write_json(result, "commodities.json")
+
+def nested_partner_shard(shard: dict) -> dict:
+    """Inverse of columnar_partner_shard()."""
+    rows, values = shard["rows"], shard["values"]
+    result = {year: {direction: {} for direction in shard["directions"]} for year in shard["years"]}
+    for i, (year, direction, m, partner, dominant) in enumerate(zip(
+            rows["year"], rows["direction"], rows["mode"], rows["partner"], rows["dominant_mode"])):
+        direction = shard["directions"][direction]
+        ends = (shard["partners"][partner], shard["country"])
+        if direction == "exports":
+            ends = ends[::-1]
+        flow = {"from": ends[0], "to": ends[1], **{name: values[name][i] for name in PARTNER_METRICS},
+                "dominant_mode": shard["modes"][dominant]}
+        result[shard["years"][year]][direction].setdefault(shard["modes"][m], []).append(flow)
+    return result
+
+
+class CountryPartnersAggregator(BilateralAggregator):
+    """Top import origins and export destinations per country, year and mode.
+
+    Written as one shard per country under ``bilateral_by_country/``, indexed
+    by ``bilateral_by_country_manifest.json``, so a country view fetches a
+    single small file instead of filtering the global top flows. Each shard
+    is the columnar form (columnar_partner_shard()) of
+    { "2023": { "imports": { "maritime": [...], ..., "all": [...] },
+                "exports": { ... } } }
+    Per-mode lists carry their own mode as ``dominant_mode``; "all" sums the
+    modes per corridor and tags the dominant one, like bilateral_top_flows.json.
+    """
+
+    label = "bilateral partners by country"
+    outputs = ("bilateral_by_country_manifest.json",)
+
+    def finalize(self, codes: BilateralCodes, cube: EmissionsCube) -> None:
+        years = codes.years.labels
+        modes = codes.modes.labels
+        countries = codes.countries.labels
+        groups, all_groups, dominant = corridors_by_mode(cube, len(modes))
+        year, mode, from_iso3, to_iso3 = groups.fields
+        a_year, a_from, a_to = all_groups.fields
+
+        # { iso3: { year_str: { direction: { mode: (GroupSums, top slots) } } } },
+        # modes in first-seen order and "all" last
+        selected: dict[str, dict[str, dict[str, dict]]] = defaultdict(
+            lambda: defaultdict(lambda: {"imports": {}, "exports": {}}))
+        for direction, country in (("imports", to_iso3), ("exports", from_iso3)):
+            group, group_keys = pd.factorize(_pack_keys(year, mode, country))
+            for g, top in top_flows_per_group(group, groups.sums[1], TOP_N_PARTNERS_PER_COUNTRY):
+                g_year, g_mode, g_country = _unpack_keys(group_keys[g:g + 1], 3)
+                selected[countries[g_country[0]]][str(years[g_year[0]])][direction][modes[g_mode[0]]] = (
+                    groups, top)
+        for direction, a_country in (("imports", a_to), ("exports", a_from)):
+            group, group_keys = pd.factorize(_pack_keys(a_year, a_country))
+            for g, top in top_flows_per_group(group, all_groups.sums[1], TOP_N_PARTNERS_PER_COUNTRY):
+                g_year, g_country = _unpack_keys(group_keys[g:g + 1], 2)
+                selected[countries[g_country[0]]][str(years[g_year[0]])][direction]["all"] = (
+                    all_groups, top)
+
+        def flows(m: str, rolled: GroupSums, top: np.ndarray) -> list[dict]:
+            f, t = rolled.fields[-2:]
+            return [
+                _flow_dict(countries[f[i]], countries[t[i]], rolled.sums[:, i], rolled.counts[i],
+                           modes[dominant[i]] if m == "all" else m)
+                for i in top
+            ]
+
+        def shards() -> Iterator[tuple[str, dict]]:
+            for iso3, year_tops in sorted(selected.items()):
+                yield iso3, {
+                    year_str: {
+                        direction: {m: flows(m, *picked) for m, picked in by_mode.items()}
+                        for direction, by_mode in year_tops[year_str].items()
+                    }
+                    for year_str in sorted(year_tops)
+                }
+
+        write_year_shards(shards(), "bilateral_by_country", "bilateral_by_country_manifest.json",
+                          (columnar_partner_shard, nested_partner_shard))
+
+
+# Aggregators fed by the default bilateral stage, in finalize order.
+BILATERAL_AGGREGATORS: list[type[BilateralAggregator]] = [
+    TopFlowsByModeAggregator,
+    FlowsByCommodityAggregator,
+    CountryPartnersAggregator,
+]
 
 
 # ---------------------------------------------------------------------------
-# 5. Bilateral top flows — per mode (large file, chunked)
+# Reconciliation checks
+#
+# With RECONCILE_TABLES (--reconcile) the bilateral stage also checks the
+# scan against the aggregate TimeSeries tables: bilateral sums per
+# (to_iso3, year) and (from_iso3, year) against the bilateral rows of the
+# consumer and producer tables, and per-year totals of every scanned row
+# (ScanTotals) against the global table. Both sides come from data the stage
+# already has, so the checks cost no extra pass over the bilateral rows.
+# A value passes when |scan - table| <= RECONCILE_ATOL + RECONCILE_RTOL * |table|;
+# the mismatches go to RECONCILIATION_REPORT_PATH, outside OUTPUT_DIR.
 #
-# New structure: each row has a specific mode (air/maritime/land).
-# We produce top 100 corridors per mode per year, plus top 100 across all.
-# Output: { "2023": { "all": [...], "maritime": [...], "air": [...], "land": [...] } }
+# A "cube" check also compares the cube's per-year sums with the row-order
+# bilateral totals of the scan, within CUBE_RTOL/CUBE_ATOL: the documented
+# bound (see README.md) on how far summing per cell first may move a sum.
+# It covers the per-year totals only; published per-corridor values are not
+# compared with a row-order sum and may differ from it in the last digit.
 # ---------------------------------------------------------------------------
-def process_bilateral_top_flows() -> None:
-    print("\n[5/10] Processing bilateral top flows per mode (this may take a while) ...")
-    bilateral_path = TIMESERIES_DIR / "bilateral_emissions_timeseries_all_flows.csv"
+RECONCILE_TABLES = False
+RECONCILE_RTOL = 1e-3
+RECONCILE_ATOL = 1.0
+CUBE_RTOL = 1e-9
+CUBE_ATOL = 1e-6
+RECONCILIATION_REPORT_PATH = SCRIPT_DIR / ".cache" / "reconciliation.json"
+
+# check -> (table, country column, metrics the table carries)
+RECONCILE_COUNTRY_TABLES: dict[str, tuple[str, str, list[str]]] = {
+    "consumer": ("emissions_by_consumer_country_year.csv", "to_iso3", BILATERAL_METRIC_COLUMNS),
+    "producer": ("emissions_by_producer_country_year.csv", "from_iso3", BILATERAL_METRIC_COLUMNS[:4]),
+}
+# Global table column -> (scan metric, factor to the scan's units)
+RECONCILE_GLOBAL_COLUMNS: dict[str, tuple[str, float]] = {
+    "WTW_emissions_MtCO2": ("WTW_emissions_tCO2", 1e6),
+    "TTW_emissions_MtCO2": ("TTW_emissions_tCO2", 1e6),
+    "WTT_emissions_MtCO2": ("WTT_emissions_tCO2", 1e6),
+    "Food_Miles_Billion_tkm": ("food_miles_tkm", 1e9),
+}
 
-    # Key: (year, mode, from_iso3, to_iso3) -> aggregation dict
-    agg: dict[tuple, dict] = {}
-    # Also track "all" mode: (year, "all", from_iso3, to_iso3)
-    # We will build "all" by a second aggregation pass from the mode-level data
 
-    total_rows = 0
-    chunk_count = 0
-    t0 = time.time()
+def reconcile_frames(check: str, table: pd.DataFrame, scanned: pd.DataFrame,
+                     rtol: float | None = None, atol: float | None = None) -> tuple[int, list[dict]]:
+    """Compare two frames of the same metric columns, outer-joined on their index.
+
+    A row missing on one side counts as zeros there. Returns the number of
+    values compared and one record per value outside the tolerance
+    (RECONCILE_RTOL and RECONCILE_ATOL unless given).
+    """
+    table, scanned = table.align(scanned, join="outer", fill_value=0.0)
+    expected = table.to_numpy(dtype=np.float64)
+    actual = scanned.to_numpy(dtype=np.float64)
+    bad = ~np.isclose(actual, expected, rtol=RECONCILE_RTOL if rtol is None else rtol,
+                      atol=RECONCILE_ATOL if atol is None else atol)
+    mismatches = []
+    for row, col in zip(*np.nonzero(bad)):
+        key = table.index[row] if table.index.nlevels > 1 else (table.index[row],)
+        mismatches.append({
+            "check": check,
+            **{name: value.item() if isinstance(value, np.generic) else value
+               for name, value in zip(table.index.names, key)},
+            "metric": table.columns[col],
+            "table": safe_float(expected[row, col], 3),
+            "scan": safe_float(actual[row, col], 3),
+            "difference": safe_float(actual[row, col] - expected[row, col], 3),
+        })
+    return bad.size, mismatches
+
+
+class ReconciliationAggregator(BilateralAggregator):
+    """Checks the cube against the consumer, producer and global tables.
+
+    Covers the years the run writes (see output_years()); writes nothing to
+    OUTPUT_DIR, only the report at RECONCILIATION_REPORT_PATH.
+    """
+
+    label = "reconciliation checks"
+
+    def finalize(self, codes: BilateralCodes, cube: EmissionsCube) -> None:
+        countries = np.asarray(codes.countries.labels, dtype=object)
+        years = np.asarray(codes.years.labels, dtype=np.int64)
+        checked: dict[str, int] = {}
+        mismatches: list[dict] = []
+
+        for check, (filename, country_col, metrics) in RECONCILE_COUNTRY_TABLES.items():
+            df = output_years(load_timeseries(filename))
+            df = df[label_column(df["route_type"], route_label) == "bilateral"]
+            table = df.groupby([country_col, "Year"])[metrics].sum()
+            table.index.names = ["iso3", "year"]
+            groups = cube.rollup((country_col, "year"))
+            rows = [BILATERAL_METRIC_COLUMNS.index(metric) for metric in metrics]
+            scanned = pd.DataFrame(
+                groups.sums[rows].T, columns=metrics,
+                index=pd.MultiIndex.from_arrays(
+                    [countries[groups.fields[0]], years[groups.fields[1]]], names=["iso3", "year"]),
+            )
+            checked[check], found = reconcile_frames(check, table, scanned)
+            mismatches += found
+
+        df = output_years(load_timeseries("global_emissions_by_year.csv"))
+        table = pd.DataFrame(
+            {metric: df[col].to_numpy() * factor for col, (metric, factor) in RECONCILE_GLOBAL_COLUMNS.items()},
+            index=pd.Index(df["Year"].to_numpy(), name="year"),
+        )
+        metrics = [metric for metric, _ in RECONCILE_GLOBAL_COLUMNS.values()]
+        rows = [BILATERAL_METRIC_COLUMNS.index(metric) for metric in metrics]
+        by_year: dict[int, np.ndarray] = {}
+        for route_years in cube.route_totals.values():
+            for year, sums in route_years.items():
+                by_year[int(year)] = by_year.get(int(year), 0) + np.asarray(sums)[rows]
+        scanned = pd.DataFrame.from_dict(by_year, orient="index", columns=metrics)
+        scanned["Year"] = scanned.index
+        scanned = output_years(scanned).drop(columns="Year").rename_axis("year")
+        checked["global"], found = reconcile_frames("global", table, scanned)
+        mismatches += found
+
+        # Summation order: cube roll-ups against the scan's row-order bilateral totals
+        bilateral = {int(year): sums for route, route_years in cube.route_totals.items()
+                     if route_label(route) == "bilateral" for year, sums in route_years.items()}
+        table = pd.DataFrame.from_dict(bilateral, orient="index", columns=BILATERAL_METRIC_COLUMNS)
+        table["Year"] = table.index
+        table = output_years(table).drop(columns="Year").rename_axis("year")
+        groups = cube.rollup(("year",))
+        scanned = pd.DataFrame(groups.sums.T, columns=BILATERAL_METRIC_COLUMNS,
+                               index=pd.Index(years[groups.fields[0]], name="year"))
+        checked["cube"], found = reconcile_frames("cube", table, scanned, CUBE_RTOL, CUBE_ATOL)
+        mismatches += found
+
+        report = {
+            "rtol": RECONCILE_RTOL,
+            "atol": RECONCILE_ATOL,
+            "cube_rtol": CUBE_RTOL,
+            "cube_atol": CUBE_ATOL,
+            "checked": checked,
+            "mismatched": {check: sum(m["check"] == check for m in mismatches) for check in checked},
+            "mismatches": mismatches,
+        }
+        RECONCILIATION_REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(RECONCILIATION_REPORT_PATH, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        total = sum(checked.values())
+        print(f"  {'WARNING: ' if mismatches else ''}{len(mismatches):,} of {total:,} reconciled values "
+              f"outside tolerance -> {RECONCILIATION_REPORT_PATH}")
 
-    cols_needed = [
-        "Year", "from_iso3", "to_iso3", "route_type", "mode",
-        "WTW_emissions_tCO2", "TTW_emissions_tCO2", "WTT_emissions_tCO2",
-        "food_miles_tkm", "total_transport_cost_USD",
-    ]
 
-    reader = pd.read_csv(
-        bilateral_path,
-        usecols=cols_needed,
-        chunksize=BILATERAL_CHUNKSIZE,
-        dtype={
-            "from_iso3": str,
-            "to_iso3": str,
-            "route_type": str,
-            "mode": str,
-        },
-        low_memory=False,
+# ---------------------------------------------------------------------------
+# Aggregation backends
+#
+# The bilateral scan hands every filtered chunk to one backend, which sums
+# the metrics per cell of the emissions cube. "pandas" keeps the running
+# sums in memory (KeyedSums); "duckdb" appends the encoded rows to an
+# on-disk DuckDB database and groups them in SQL, spilling to disk beyond
+# AGGREGATION_MEMORY_LIMIT. Both list cells in first-seen order. pandas sums
+# a cell's rows in scan order; DuckDB in whatever order its threads meet
+# them (ordering the sum would sort every group, which costs more memory
+# than it saves). A DuckDB cell sum can therefore differ from the pandas one
+# in its last bits, within the CUBE_RTOL bound of the README's precision
+# notes, and a value whose exact sum lies that close to a rounding half can
+# differ in its last written digit.
+# ---------------------------------------------------------------------------
+AGGREGATION_BACKEND = "pandas"
+AGGREGATION_MEMORY_LIMIT: str | None = None     # e.g. "4GB"; DuckDB's default otherwise
+AGGREGATION_THREADS = os.cpu_count() or 1
+
+
+class AggregationBackend:
+    """Cube cell sums, fed chunk by chunk."""
+
+    name = ""
+
+    def consume(self, chunk: BilateralChunk) -> None:
+        raise NotImplementedError
+
+    def cube(self) -> EmissionsCube:
+        """The cells seen so far, in first-seen order."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class PandasBackend(AggregationBackend):
+    """In-memory running sums keyed by the packed cell codes."""
+
+    name = "pandas"
+
+    def __init__(self) -> None:
+        # Five 16-bit codes don't fit one int64 key, so cells are keyed by
+        # (slot of (commodity, year, from_iso3, to_iso3), mode)
+        self.flows = KeyedSums(0)
+        self.cells = KeyedSums(len(BILATERAL_METRIC_COLUMNS))
+
+    def consume(self, chunk: BilateralChunk) -> None:
+        slots = self.flows.slots(_pack_keys(chunk.commodity, chunk.year, chunk.from_iso3, chunk.to_iso3))
+        self.cells.add(_pack_keys(slots, chunk.mode), chunk.metrics)
+
+    def merge(self, cube: EmissionsCube) -> None:
+        """Add the cells of a partial cube, e.g. one byte range of a parallel scan."""
+        slots = self.flows.slots(_pack_keys(cube.commodity, cube.year, cube.from_iso3, cube.to_iso3))
+        self.cells.add(_pack_keys(slots, cube.mode), cube.sums, cube.counts)
+
+    def cube(self) -> EmissionsCube:
+        keys, sums, counts = self.cells.view()
+        slot, mode = _unpack_keys(keys, 2)
+        commodity, year, from_iso3, to_iso3 = _unpack_keys(self.flows.keys[:self.flows.size][slot], 4)
+        return EmissionsCube(year=year, mode=mode, commodity=commodity, from_iso3=from_iso3,
+                             to_iso3=to_iso3, sums=sums, counts=counts)
+
+
+class DuckDBBackend(AggregationBackend):
+    """Encoded rows in a temporary DuckDB database, grouped in SQL at the end.
+
+    The rows and the grouping spill to disk beyond AGGREGATION_MEMORY_LIMIT
+    (without one, DuckDB may use most of the RAM), but the cube itself is
+    built in memory, as with pandas. The database and its spill files live
+    next to the columnar cache and are removed on close().
+    """
+
+    name = "duckdb"
+    FETCH_VECTORS = 64                   # result vectors (2048 rows each) copied per slice
+
+    def __init__(self) -> None:
+        self.metrics = [f"m{i}" for i in range(len(BILATERAL_METRIC_COLUMNS))]
+        self.work_dir = BILATERAL_CACHE_DIR.with_name("duckdb")
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.work_dir / f"aggregate-{os.getpid()}.duckdb"
+        self._remove_files()
+        config = {"temp_directory": str(self.work_dir / f"spill-{os.getpid()}"),
+                  "threads": AGGREGATION_THREADS}
+        if AGGREGATION_MEMORY_LIMIT:
+            config["memory_limit"] = AGGREGATION_MEMORY_LIMIT
+        self.con = duckdb.connect(str(self.db_path), config=config)
+        self.con.execute(
+            "CREATE TABLE rows (seq BIGINT, "
+            + "".join(f"{col} USMALLINT, " for col in CUBE_COLUMNS)
+            + ", ".join(f"{m} DOUBLE" for m in self.metrics) + ")"
+        )
+        self.rows = 0
+
+    def consume(self, chunk: BilateralChunk) -> None:
+        frame = {"seq": np.arange(self.rows, self.rows + len(chunk), dtype=np.int64)}
+        for col in CUBE_COLUMNS:
+            frame[col] = getattr(chunk, col).astype(np.uint16)
+        for m, values in zip(self.metrics, chunk.metrics):
+            frame[m] = values
+        self.con.append("rows", pd.DataFrame(frame))
+        self.rows += len(chunk)
+
+    def cube(self) -> EmissionsCube:
+        keys = ", ".join(CUBE_COLUMNS)
+        self.con.execute(
+            f"CREATE TEMP TABLE cells AS SELECT {keys}, count(*) AS n, "
+            + ", ".join(f"sum({m}) AS {m}" for m in self.metrics)
+            + f" FROM rows GROUP BY {keys} ORDER BY min(seq)"
+        )
+        self.con.execute("DROP TABLE rows")
+        size = self.con.execute("SELECT count(*) FROM cells").fetchone()[0]
+        cube = EmissionsCube(
+            sums=np.empty((len(self.metrics), size)),
+            counts=np.empty(size, dtype=np.int64),
+            **{col: np.empty(size, dtype=np.int64) for col in CUBE_COLUMNS},
+        )
+        # Copied into the cube's arrays a slice at a time (in insertion
+        # order, i.e. first-seen), so the result is never held twice
+        self.con.execute("SELECT * FROM cells")
+        start = 0
+        while start < size:
+            part = self.con.fetch_df_chunk(self.FETCH_VECTORS)
+            stop = start + len(part)
+            for col in CUBE_COLUMNS:
+                getattr(cube, col)[start:stop] = part[col].to_numpy()
+            cube.counts[start:stop] = part["n"].to_numpy()
+            for i, m in enumerate(self.metrics):
+                cube.sums[i, start:stop] = part[m].to_numpy()
+            start = stop
+        return cube
+
+    def _remove_files(self) -> None:
+        for path in (self.db_path, self.db_path.with_name(self.db_path.name + ".wal")):
+            path.unlink(missing_ok=True)
+        shutil.rmtree(self.work_dir / f"spill-{os.getpid()}", ignore_errors=True)
+
+    def close(self) -> None:
+        self.con.close()
+        self._remove_files()
+        try:
+            self.work_dir.rmdir()        # unless another process still works in it
+        except OSError:
+            pass
+
+
+AGGREGATION_BACKENDS: dict[str, type[AggregationBackend]] = {"pandas": PandasBackend}
+if duckdb is not None:
+    AGGREGATION_BACKENDS["duckdb"] = DuckDBBackend
+
+
+def clean_bilateral_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Normalise the raw text columns and coerce metrics to floats (NaN -> 0)."""
+    for col in BILATERAL_METRIC_COLUMNS:
+        chunk[col] = pd.to_numeric(chunk[col], errors="coerce").fillna(0.0)
+
+    chunk["route_type"] = chunk["route_type"].str.lower()
+    chunk["mode"] = chunk["mode"].fillna("unknown").str.lower().str.strip()
+    if "commodity" in chunk.columns:
+        chunk["commodity"] = chunk["commodity"].fillna("Unknown")
+    return chunk
+
+
+def encode_bilateral_chunk(chunk: pd.DataFrame, codes: BilateralCodes) -> BilateralChunk:
+    """Dictionary-encode a cleaned chunk against the scan's code tables."""
+    return BilateralChunk(
+        year=codes.years.encode(chunk["Year"], int),
+        route=codes.routes.encode(chunk["route_type"]),
+        mode=codes.modes.encode(chunk["mode"]),
+        from_iso3=codes.countries.encode(chunk["from_iso3"]),
+        to_iso3=codes.countries.encode(chunk["to_iso3"]),
+        commodity=codes.commodities.encode(chunk["commodity"]) if "commodity" in chunk.columns else None,
+        metrics=chunk[BILATERAL_METRIC_COLUMNS].to_numpy(dtype=np.float64).T,
     )
 
-    for chunk in reader:
-        chunk_count += 1
-        total_rows += len(chunk)
-        elapsed = time.time() - t0
-        print(
-            f"    chunk {chunk_count}: {total_rows:,} rows processed "
-            f"({elapsed:.1f}s elapsed)"
+
+def _iter_csv_chunks(columns: list[str], codes: BilateralCodes,
+                     years: set[int] | None = None) -> Iterator[BilateralChunk]:
+    """Parse the bilateral CSV chunk by chunk; yields every row, unfiltered.
+
+    With ``years``, rows of other years are dropped straight after parsing,
+    before any cleaning or encoding.
+    """
+    str_columns = [col for col in columns if col in ("from_iso3", "to_iso3", "route_type", "mode", "commodity")]
+    with open(TIMESERIES_DIR / BILATERAL_FILENAME, "rb") as fh:
+        reader = pd.read_csv(
+            fh,
+            usecols=columns,
+            chunksize=BILATERAL_CHUNKSIZE,
+            dtype={col: str for col in str_columns},
+            low_memory=False,
         )
+        position = 0
+        for chunk in reader:
+            # The parser reads ahead in blocks, so this is approximate per chunk
+            count("bytes_read", fh.tell() - position)
+            position = fh.tell()
+            if years is not None:
+                chunk = chunk[chunk["Year"].isin(years)].copy()
+            yield encode_bilateral_chunk(clean_bilateral_chunk(chunk), codes)
 
-        # Keep only bilateral flows, exclude certain years
-        chunk = chunk[(chunk["route_type"].str.lower() == "bilateral") & (~chunk["Year"].isin(EXCLUDE_YEARS))]
-        if chunk.empty:
-            continue
 
-        for col in [
-            "WTW_emissions_tCO2", "TTW_emissions_tCO2",
-            "WTT_emissions_tCO2", "food_miles_tkm",
-            "total_transport_cost_USD",
-        ]:
-            chunk[col] = pd.to_numeric(chunk[col], errors="coerce").fillna(0.0)
-
-        chunk["mode"] = chunk["mode"].fillna("unknown").str.lower().str.strip()
-
-        for _, row in chunk.iterrows():
-            year = int(row["Year"])
-            mode = str(row["mode"])
-            from_iso3 = str(row["from_iso3"])
-            to_iso3 = str(row["to_iso3"])
-
-            # Per-mode aggregation
-            key = (year, mode, from_iso3, to_iso3)
-            rec = agg.get(key)
-            if rec is None:
-                rec = {"wtw": 0.0, "ttw": 0.0, "wtt": 0.0,
-                       "food_miles": 0.0, "cost": 0.0, "n_commodities": 0}
-                agg[key] = rec
-            rec["wtw"] += float(row["WTW_emissions_tCO2"])
-            rec["ttw"] += float(row["TTW_emissions_tCO2"])
-            rec["wtt"] += float(row["WTT_emissions_tCO2"])
-            rec["food_miles"] += float(row["food_miles_tkm"])
-            rec["cost"] += float(row["total_transport_cost_USD"])
-            rec["n_commodities"] += 1
-
-    elapsed = time.time() - t0
-    print(f"    Done reading {total_rows:,} rows in {elapsed:.1f}s. Building per-mode top flows ...")
-
-    # Build per-mode flows: { year_str: { mode: [flows] } }
-    year_mode_flows: dict[str, dict[str, list]] = defaultdict(lambda: defaultdict(list))
-
-    for (year, mode, from_iso3, to_iso3), rec in agg.items():
-        flow = {
-            "from": from_iso3,
-            "to": to_iso3,
-            "wtw": safe_float(rec["wtw"], 1),
-            "ttw": safe_float(rec["ttw"], 1),
-            "wtt": safe_float(rec["wtt"], 1),
-            "food_miles": safe_float(rec["food_miles"], 0),
-            "cost": safe_float(rec["cost"], 1),
-            "n_commodities": rec["n_commodities"],
-            "dominant_mode": mode,
-        }
-        year_mode_flows[str(year)][mode].append(flow)
-
-    # Also build "all" by aggregating across modes for each (year, from, to)
-    all_agg: dict[tuple, dict] = {}
-    all_mode_ttw: dict[tuple, dict[str, float]] = {}
-    for (year, mode, from_iso3, to_iso3), rec in agg.items():
-        akey = (year, from_iso3, to_iso3)
-        arec = all_agg.get(akey)
-        if arec is None:
-            arec = {"wtw": 0.0, "ttw": 0.0, "wtt": 0.0,
-                    "food_miles": 0.0, "cost": 0.0, "n_commodities": 0}
-            all_agg[akey] = arec
-        arec["wtw"] += rec["wtw"]
-        arec["ttw"] += rec["ttw"]
-        arec["wtt"] += rec["wtt"]
-        arec["food_miles"] += rec["food_miles"]
-        arec["cost"] += rec["cost"]
-        arec["n_commodities"] += rec["n_commodities"]
-        # Track dominant mode by TTW
-        md = all_mode_ttw.setdefault(akey, {})
-        md[mode] = md.get(mode, 0.0) + rec["ttw"]
-
-    for (year, from_iso3, to_iso3), arec in all_agg.items():
-        modes = all_mode_ttw.get((year, from_iso3, to_iso3), {})
-        dominant = max(modes, key=modes.get) if modes else "unknown"
-        flow = {
-            "from": from_iso3,
-            "to": to_iso3,
-            "wtw": safe_float(arec["wtw"], 1),
-            "ttw": safe_float(arec["ttw"], 1),
-            "wtt": safe_float(arec["wtt"], 1),
-            "food_miles": safe_float(arec["food_miles"], 0),
-            "cost": safe_float(arec["cost"], 1),
-            "n_commodities": arec["n_commodities"],
-            "dominant_mode": dominant,
-        }
-        year_mode_flows[str(year)]["all"].append(flow)
+# ---------------------------------------------------------------------------
+# Bilateral columnar cache
+#
+# The first scan of the bilateral CSV also writes every row, cleaned and
+# dictionary-encoded, to flat little-endian columns under BILATERAL_CACHE_DIR
+# (one file per column, plus codes.json with the label tables and meta.json
+# with the source fingerprint). Later runs memory-map those columns and skip
+# CSV parsing entirely while the source file is unchanged.
+#
+# A cache entry is valid when the source's size and mtime match; if only the
+# mtime moved (a copy or a touch), the content hash decides and the entry is
+# re-stamped rather than rebuilt.
+# ---------------------------------------------------------------------------
+BILATERAL_CACHE_DIR = SCRIPT_DIR / ".cache" / "bilateral"
+BILATERAL_CACHE_VERSION = 1
+USE_BILATERAL_CACHE = True
+
+_CACHE_CODE_COLUMNS = ["year", "route", "mode", "from_iso3", "to_iso3", "commodity"]
+_CACHE_CODE_DTYPE = np.dtype("<u2")
+_CACHE_METRIC_DTYPE = np.dtype("<f8")
+
+
+def file_digest(path: Path) -> str:
+    """BLAKE2b hex digest of a file's contents."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(8 * 1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprint(path: Path, with_hash: bool = True) -> dict:
+    """Size, mtime and (optionally) content hash of a file."""
+    st = path.stat()
+    fingerprint = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if with_hash:
+        fingerprint["blake2b"] = file_digest(path)
+    return fingerprint
+
+
+def _cache_metric_name(col: str) -> str:
+    return f"metric_{col}"
+
+
+class BilateralCacheWriter:
+    """Append encoded chunks to a fresh cache entry; publish it on commit()."""
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self.tmp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir(parents=True)
+        names = _CACHE_CODE_COLUMNS + [_cache_metric_name(c) for c in BILATERAL_METRIC_COLUMNS]
+        self.files = {name: open(self.tmp_dir / f"{name}.bin", "wb") for name in names}
+        self.rows = 0
+
+    def append(self, chunk: BilateralChunk) -> None:
+        for name in _CACHE_CODE_COLUMNS:
+            values = getattr(chunk, name)
+            if len(values) and values.max() > np.iinfo(_CACHE_CODE_DTYPE).max:
+                raise ValueError(f"Too many distinct values in bilateral column {name!r} for the cache")
+            values.astype(_CACHE_CODE_DTYPE).tofile(self.files[name])
+        for i, col in enumerate(BILATERAL_METRIC_COLUMNS):
+            chunk.metrics[i].astype(_CACHE_METRIC_DTYPE).tofile(self.files[_cache_metric_name(col)])
+        self.rows += len(chunk)
+
+    def append_part(self, part_dir: Path, remap: dict[str, np.ndarray]) -> None:
+        """Append a committed cache entry whose codes map onto ours through ``remap``."""
+        rows = _read_cache_meta(part_dir)["rows"]
+        for name in _CACHE_CODE_COLUMNS:
+            values = np.fromfile(part_dir / f"{name}.bin", dtype=_CACHE_CODE_DTYPE)
+            mapped = remap[_CODE_TABLE_OF[name]][values]
+            if len(mapped) and mapped.max() > np.iinfo(_CACHE_CODE_DTYPE).max:
+                raise ValueError(f"Too many distinct values in bilateral column {name!r} for the cache")
+            mapped.astype(_CACHE_CODE_DTYPE).tofile(self.files[name])
+        for col in BILATERAL_METRIC_COLUMNS:
+            name = _cache_metric_name(col)
+            with open(part_dir / f"{name}.bin", "rb") as fh:
+                shutil.copyfileobj(fh, self.files[name])
+        self.rows += rows
+
+    def _close(self) -> None:
+        for fh in self.files.values():
+            fh.close()
+
+    def commit(self, codes: BilateralCodes, source: dict) -> None:
+        self._close()
+        with open(self.tmp_dir / "codes.json", "w", encoding="utf-8") as fh:
+            json.dump(codes.to_dict(), fh, ensure_ascii=False)
+        meta = {"version": BILATERAL_CACHE_VERSION, "rows": self.rows, "source": source}
+        with open(self.tmp_dir / "meta.json", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, indent=2)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.tmp_dir.rename(self.cache_dir)
+
+    def abort(self) -> None:
+        self._close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def _read_cache_meta(cache_dir: Path, version: int = BILATERAL_CACHE_VERSION) -> dict | None:
+    try:
+        with open(cache_dir / "meta.json", encoding="utf-8") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == version else None
+
+
+def bilateral_cache_is_valid(source_path: Path, cache_dir: Path, version: int = BILATERAL_CACHE_VERSION) -> bool:
+    """Check a cache entry against the source fingerprint, re-stamping moved mtimes."""
+    meta = _read_cache_meta(cache_dir, version)
+    if meta is None:
+        return False
+    cached = meta["source"]
+    current = file_fingerprint(source_path, with_hash=False)
+    if current["size"] != cached["size"]:
+        return False
+    if current["mtime_ns"] == cached["mtime_ns"]:
+        return True
+    if file_digest(source_path) != cached["blake2b"]:
+        return False
+    meta["source"]["mtime_ns"] = current["mtime_ns"]
+    with open(cache_dir / "meta.json", "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2)
+    return True
+
+
+def load_bilateral_cache(cache_dir: Path) -> tuple[BilateralCodes, dict[str, np.ndarray], int]:
+    """Memory-map the cached columns; returns (codes, columns, rows)."""
+    meta = _read_cache_meta(cache_dir)
+    rows = meta["rows"]
+    with open(cache_dir / "codes.json", encoding="utf-8") as fh:
+        codes = BilateralCodes.from_dict(json.load(fh))
+
+    columns: dict[str, np.ndarray] = {}
+    for name in _CACHE_CODE_COLUMNS:
+        columns[name] = np.memmap(cache_dir / f"{name}.bin", dtype=_CACHE_CODE_DTYPE, mode="r", shape=(rows,))
+    for col in BILATERAL_METRIC_COLUMNS:
+        name = _cache_metric_name(col)
+        columns[name] = np.memmap(cache_dir / f"{name}.bin", dtype=_CACHE_METRIC_DTYPE, mode="r", shape=(rows,))
+    return codes, columns, rows
+
+
+def _iter_cached_chunks(columns: dict[str, np.ndarray], rows: int,
+                        years: np.ndarray | None = None) -> Iterator[BilateralChunk]:
+    """Read the cached rows chunk by chunk.
+
+    With ``years`` (year codes), only the year column is read in full; the
+    other columns are gathered at the matching rows only.
+    """
+    for start in range(0, rows, BILATERAL_CHUNKSIZE):
+        stop = min(start + BILATERAL_CHUNKSIZE, rows)
+        index = slice(start, stop)
+        if years is not None:
+            year = columns["year"][start:stop]
+            count("bytes_read", year.nbytes)
+            index = start + np.flatnonzero(np.isin(year, years))
+            if not len(index):
+                continue
+        codes = {name: columns[name][index].astype(np.int64) for name in _CACHE_CODE_COLUMNS}
+        metrics = np.vstack([columns[_cache_metric_name(c)][index] for c in BILATERAL_METRIC_COLUMNS])
+        count("bytes_read", metrics.nbytes + sum(
+            columns[name][index].nbytes for name in _CACHE_CODE_COLUMNS if years is None or name != "year"))
+        yield BilateralChunk(metrics=metrics, **codes)
 
-    # Select top N per mode per year
-    result: dict[str, dict[str, list]] = {}
-    for year_str in sorted(year_mode_flows.keys()):
-        result[year_str] = {}
-        for mode, flows in year_mode_flows[year_str].items():
-            flows.sort(key=lambda x: x["ttw"], reverse=True)
-            result[year_str][mode] = flows[:TOP_N_BILATERAL_PER_MODE]
 
-    write_json(result, "bilateral_top_flows.json")
+# ---------------------------------------------------------------------------
+# Emissions cube
+#
+# The bilateral scan sums every row into one sparse cube at CUBE_COLUMNS
+# grain and saves it under EMISSIONS_CUBE_DIR in the columnar cache format
+# (one flat file per column, plus codes.json and meta.json). meta.json also
+# holds the source fingerprint, the excluded years, per year the range of
+# cells holding that year, and the scan's route totals. While the source and EXCLUDE_YEARS are
+# unchanged, later runs memory-map the cube and derive every bilateral
+# output from it without touching the rows.
+#
+# Sums over the cube add per-cell subtotals (each summed in row order) in
+# cell order, so an output total can differ in the last bits from summing
+# its rows one by one: within CUBE_RTOL, which README.md documents and the
+# reconciliation "cube" check verifies.
+# ---------------------------------------------------------------------------
+EMISSIONS_CUBE_DIR = SCRIPT_DIR / ".cache" / "cube"
+EMISSIONS_CUBE_VERSION = 2
+
+_CUBE_COUNT_DTYPE = np.dtype("<u4")
+
+
+def write_emissions_cube(cube: EmissionsCube, codes: BilateralCodes, cube_dir: Path, source: dict) -> None:
+    """Save a year-ordered cube; replaces any existing entry atomically."""
+    tmp_dir = cube_dir.with_name(cube_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    if len(cube) and cube.counts.max() > np.iinfo(_CUBE_COUNT_DTYPE).max:
+        raise ValueError("Too many rows in one emissions cube cell")
+    for col in CUBE_COLUMNS:
+        getattr(cube, col).astype(_CACHE_CODE_DTYPE).tofile(tmp_dir / f"{col}.bin")
+    for i, col in enumerate(BILATERAL_METRIC_COLUMNS):
+        cube.sums[i].astype(_CACHE_METRIC_DTYPE).tofile(tmp_dir / f"{_cache_metric_name(col)}.bin")
+    cube.counts.astype(_CUBE_COUNT_DTYPE).tofile(tmp_dir / "count.bin")
+
+    bounds = np.flatnonzero(np.diff(cube.year)) + 1
+    starts = np.concatenate([[0], bounds]) if len(cube) else np.empty(0, dtype=np.int64)
+    stops = np.concatenate([bounds, [len(cube)]]) if len(cube) else np.empty(0, dtype=np.int64)
+    years = {str(codes.years.labels[cube.year[start]]): [int(start), int(stop)]
+             for start, stop in zip(starts, stops)}
+
+    with open(tmp_dir / "codes.json", "w", encoding="utf-8") as fh:
+        json.dump(codes.to_dict(), fh, ensure_ascii=False)
+    meta = {
+        "version": EMISSIONS_CUBE_VERSION,
+        "rows": len(cube),
+        "source": source,
+        "exclude_years": sorted(EXCLUDE_YEARS),
+        "years": years,
+        "route_totals": cube.route_totals,
+    }
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2)
+    shutil.rmtree(cube_dir, ignore_errors=True)
+    tmp_dir.rename(cube_dir)
+
+
+def emissions_cube_is_valid(source_path: Path, cube_dir: Path) -> bool:
+    meta = _read_cache_meta(cube_dir, EMISSIONS_CUBE_VERSION)
+    if meta is None or meta.get("exclude_years") != sorted(EXCLUDE_YEARS):
+        return False
+    return bilateral_cache_is_valid(source_path, cube_dir, EMISSIONS_CUBE_VERSION)
+
+
+def load_emissions_cube(cube_dir: Path) -> tuple[BilateralCodes, EmissionsCube]:
+    """Memory-map a saved cube; codes come back as int64, sums as float64."""
+    meta = _read_cache_meta(cube_dir, EMISSIONS_CUBE_VERSION)
+    rows = meta["rows"]
+    with open(cube_dir / "codes.json", encoding="utf-8") as fh:
+        codes = BilateralCodes.from_dict(json.load(fh))
+
+    def column(name: str, dtype: np.dtype) -> np.ndarray:
+        if not rows:  # np.memmap can't map an empty file
+            return np.empty(0, dtype=dtype)
+        values = np.memmap(cube_dir / f"{name}.bin", dtype=dtype, mode="r", shape=(rows,))
+        count("bytes_read", values.nbytes)
+        return values
+
+    cube = EmissionsCube(
+        sums=np.vstack([column(_cache_metric_name(col), _CACHE_METRIC_DTYPE) for col in BILATERAL_METRIC_COLUMNS]),
+        counts=column("count", _CUBE_COUNT_DTYPE).astype(np.int64),
+        route_totals=meta["route_totals"],
+        **{col: column(col, _CACHE_CODE_DTYPE).astype(np.int64) for col in CUBE_COLUMNS},
+    )
+    return codes, cube
 
 
 # ---------------------------------------------------------------------------
-# 5b. Bilateral flows by commodity (large file, chunked)
+# Parallel byte-range scan
+#
+# With SCAN_WORKERS > 1, a CSV scan (no valid columnar cache) cuts the file
+# into newline-aligned byte ranges of SCAN_RANGE_BYTES. A worker process
+# parses each range with its own code tables, folds it into a partial cube
+# and, with the cache enabled, writes its rows as a cache part. The parent
+# merges partials and parts in range order, mapping each range's codes onto
+# the scan's tables, so labels and cube cells get the same first-seen order
+# as in a sequential scan.
+#
+# A cell's sums are its per-range sums added in range order. That can differ
+# from the sequential row-by-row sum in the last bits, but depends only on
+# the file and SCAN_RANGE_BYTES, never on the number of workers. Ranges are
+# cut at newlines, so records must not contain quoted line breaks (the
+# bilateral CSV has none).
 # ---------------------------------------------------------------------------
-def process_bilateral_by_commodity() -> None:
-    print("\n[5b/10] Processing bilateral flows by commodity (this may take a while) ...")
-    bilateral_path = TIMESERIES_DIR / "bilateral_emissions_timeseries_all_flows.csv"
-
-    # Key: (commodity, year, from_iso3, to_iso3) -> aggregation
-    # Each flow keeps its mode since each row already has one
-    agg: dict[tuple, dict] = {}
-    # Track mode per flow for dominant_mode
-    mode_ttw: dict[tuple, dict[str, float]] = {}
+SCAN_WORKERS = 1
+SCAN_RANGE_BYTES = 64 * 1024 * 1024
+
+
+def csv_byte_ranges(path: Path, range_bytes: int) -> list[tuple[int, int]]:
+    """Newline-aligned (start, stop) offsets covering every line after the header."""
+    ranges = []
+    with open(path, "rb") as fh:
+        fh.readline()
+        start = fh.tell()
+        size = os.fstat(fh.fileno()).st_size
+        while start < size:
+            fh.seek(min(start + range_bytes, size))
+            fh.readline()                  # run on to the end of the current line
+            stop = fh.tell()
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def scan_csv_range(path: Path, start: int, stop: int, names: list[str], columns: list[str],
+                   chunksize: int, part_dir: Path | None) -> dict:
+    """Parse one byte range into a partial cube (and a cache part in ``part_dir``).
+
+    Runs in a worker process, so it must not touch shared state. Codes in the
+    result refer to the range's own tables, returned as ``codes``.
+    """
+    t0 = time.perf_counter()
+    codes = BilateralCodes()
+    backend = PandasBackend()
+    totals = ScanTotals()
+    writer = BilateralCacheWriter(part_dir) if part_dir is not None else None
+    rows_in = rows_out = 0
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(stop - start)
+    if data.strip():
+        str_columns = [col for col in columns if col in ("from_iso3", "to_iso3", "route_type", "mode", "commodity")]
+        reader = pd.read_csv(
+            io.BytesIO(data),
+            header=None,
+            names=names,
+            usecols=columns,
+            chunksize=chunksize,
+            dtype={col: str for col in str_columns},
+            low_memory=False,
+        )
+        for frame in reader:
+            chunk = encode_bilateral_chunk(clean_bilateral_chunk(frame), codes)
+            rows_in += len(chunk)
+            if writer is not None:
+                writer.append(chunk)
+            totals.add(chunk, codes)
+            chunk = chunk.take(codes.bilateral_mask(chunk))
+            rows_out += len(chunk)
+            if len(chunk):
+                backend.consume(chunk)
+    if writer is not None:
+        writer.commit(codes, {})
+    return {
+        "codes": codes.to_dict(),
+        "cube": backend.cube(),
+        "totals": totals.to_dict(),
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "bytes": stop - start,
+        "parse_s": round(time.perf_counter() - t0, 4),
+    }
 
-    total_rows = 0
-    chunk_count = 0
-    t0 = time.time()
 
-    cols_needed = [
-        "Year", "from_iso3", "to_iso3", "route_type", "mode",
-        "commodity",
-        "WTW_emissions_tCO2", "TTW_emissions_tCO2", "WTT_emissions_tCO2",
-        "food_miles_tkm", "total_transport_cost_USD",
+def scan_bilateral_ranges(path: Path, codes: BilateralCodes,
+                          cache_writer: "BilateralCacheWriter | None") -> tuple[EmissionsCube, int]:
+    """Scan the CSV's byte ranges in SCAN_WORKERS processes; returns the merged cube and row count."""
+    names = [str(col) for col in pd.read_csv(path, nrows=0).columns]
+    columns = BILATERAL_BASE_COLUMNS + ["commodity"] + BILATERAL_METRIC_COLUMNS
+    ranges = csv_byte_ranges(path, SCAN_RANGE_BYTES)
+    workers = max(1, min(SCAN_WORKERS, len(ranges)))
+    print(f"    Scanning {len(ranges)} byte range{'s' if len(ranges) != 1 else ''} "
+          f"in {workers} worker{'s' if workers != 1 else ''}")
+    part_dirs = [
+        BILATERAL_CACHE_DIR.with_name(f"{BILATERAL_CACHE_DIR.name}.part{i}") if cache_writer else None
+        for i in range(len(ranges))
     ]
 
-    reader = pd.read_csv(
-        bilateral_path,
-        usecols=cols_needed,
-        chunksize=BILATERAL_CHUNKSIZE,
-        dtype={
-            "from_iso3": str,
-            "to_iso3": str,
-            "route_type": str,
-            "mode": str,
-            "commodity": str,
-        },
-        low_memory=False,
-    )
+    merged = PandasBackend()
+    totals = ScanTotals()
+    total_rows = 0
+    t0 = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                scan_csv_range,
+                *zip(*[(path, start, stop, names, columns, BILATERAL_CHUNKSIZE, part_dir)
+                       for (start, stop), part_dir in zip(ranges, part_dirs)]),
+            )
+            # Results arrive in range order
+            for i, (result, part_dir) in enumerate(zip(results, part_dirs)):
+                with Span("range", "bilateral", index=i + 1, ranges=len(ranges)) as span:
+                    remap = codes.remap(result["codes"])
+                    if cache_writer is not None:
+                        cache_writer.append_part(part_dir, remap)
+                    merged.merge(result["cube"].remap(remap))
+                    totals.merge(result["totals"])
+                    total_rows += result["rows_in"]
+                    count("rows_in", result["rows_in"])
+                    count("rows_out", result["rows_out"])
+                    count("bytes_read", result["bytes"])
+                    span.fields.update(total_rows=total_rows, parse_s=result["parse_s"],
+                                       elapsed_s=round(time.time() - t0, 3))
+    finally:
+        for part_dir in part_dirs:
+            if part_dir is not None:
+                shutil.rmtree(part_dir, ignore_errors=True)
+                shutil.rmtree(part_dir.with_name(part_dir.name + ".tmp"), ignore_errors=True)
+    cube = merged.cube()
+    cube.route_totals = totals.to_dict()
+    return cube, total_rows
 
-    for chunk in reader:
-        chunk_count += 1
-        total_rows += len(chunk)
-        elapsed = time.time() - t0
-        print(
-            f"    chunk {chunk_count}: {total_rows:,} rows processed "
-            f"({elapsed:.1f}s elapsed)"
-        )
 
-        chunk = chunk[(chunk["route_type"].str.lower() == "bilateral") & (~chunk["Year"].isin(EXCLUDE_YEARS))]
-        if chunk.empty:
-            continue
+# ---------------------------------------------------------------------------
+# Bilateral scan
+# ---------------------------------------------------------------------------
+def _scan_chunks(chunks: Iterator[BilateralChunk], codes: BilateralCodes,
+                 cache_writer: BilateralCacheWriter | None) -> tuple[EmissionsCube, int]:
+    """Feed the chunks to the aggregation backend in order; returns the cube and row count."""
+    total_rows = 0
+    chunk_count = 0
+    t0 = time.time()
+    backend = AGGREGATION_BACKENDS[AGGREGATION_BACKEND]()
+    totals = ScanTotals()
 
-        for col in [
-            "WTW_emissions_tCO2", "TTW_emissions_tCO2",
-            "WTT_emissions_tCO2", "food_miles_tkm",
-            "total_transport_cost_USD",
-        ]:
-            chunk[col] = pd.to_numeric(chunk[col], errors="coerce").fillna(0.0)
+    try:
+        with Span("scan", "bilateral", backend=backend.name):
+            while True:
+                with Span("chunk", "bilateral", index=chunk_count + 1) as span:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        span.discard = True
+                        break
+                    chunk_count += 1
+                    total_rows += len(chunk)
+                    count("rows_in", len(chunk))
+                    span.fields.update(total_rows=total_rows, elapsed_s=round(time.time() - t0, 3))
+                    if cache_writer is not None:
+                        cache_writer.append(chunk)
+                    totals.add(chunk, codes)
+
+                    # Keep only bilateral flows, exclude certain years
+                    chunk = chunk.take(codes.bilateral_mask(chunk))
+                    count("rows_out", len(chunk))
+                    if not len(chunk):
+                        continue
+
+                    backend.consume(chunk)
+            cube = backend.cube()
+            cube.route_totals = totals.to_dict()
+            return cube, total_rows
+    finally:
+        backend.close()
+
+
+def scan_bilateral() -> tuple[BilateralCodes, EmissionsCube, dict | None]:
+    """Stream the bilateral rows once into the emissions cube.
+
+    Rows come from the columnar cache when it is valid; otherwise the CSV is
+    parsed, in SCAN_WORKERS processes when that is above 1 (and, with the
+    cache enabled, converted to a new cache entry on the way through).
+    Returns the codes, the year-ordered cube and the source fingerprint
+    (None when the cache is disabled).
+    """
+    bilateral_path = TIMESERIES_DIR / BILATERAL_FILENAME
+    cache_writer: BilateralCacheWriter | None = None
+    source = None
+
+    if USE_BILATERAL_CACHE and bilateral_cache_is_valid(bilateral_path, BILATERAL_CACHE_DIR):
+        print(f"    Using columnar cache: {BILATERAL_CACHE_DIR}")
+        codes, columns, rows = load_bilateral_cache(BILATERAL_CACHE_DIR)
+        source = _read_cache_meta(BILATERAL_CACHE_DIR)["source"]
+        chunks = _iter_cached_chunks(columns, rows)
+    else:
+        codes = BilateralCodes()
+        if USE_BILATERAL_CACHE:
+            print(f"    Building columnar cache: {BILATERAL_CACHE_DIR}")
+            source = file_fingerprint(bilateral_path)
+            cache_writer = BilateralCacheWriter(BILATERAL_CACHE_DIR)
+        chunks = None if SCAN_WORKERS > 1 else _iter_csv_chunks(
+            BILATERAL_BASE_COLUMNS + ["commodity"] + BILATERAL_METRIC_COLUMNS, codes)
 
-        chunk["mode"] = chunk["mode"].fillna("unknown").str.lower().str.strip()
-        chunk["commodity"] = chunk["commodity"].fillna("Unknown")
+    try:
+        if chunks is None:
+            with Span("scan", "bilateral", backend="pandas", workers=SCAN_WORKERS):
+                cube, total_rows = scan_bilateral_ranges(bilateral_path, codes, cache_writer)
+        else:
+            cube, total_rows = _scan_chunks(chunks, codes, cache_writer)
+    except BaseException:
+        if cache_writer is not None:
+            cache_writer.abort()
+        raise
+
+    if cache_writer is not None:
+        cache_writer.commit(codes, source)
+
+    # Group the cells by year, keeping first-seen order within a year
+    cube = cube.take(np.argsort(cube.year, kind="stable"))
+    print(f"    Emissions cube: {len(cube):,} cells from {total_rows:,} rows")
+    return codes, cube, source
+
+
+def emissions_cube() -> tuple[BilateralCodes, EmissionsCube]:
+    """The saved cube when it is still valid, else a fresh scan (saved with the cache enabled)."""
+    bilateral_path = TIMESERIES_DIR / BILATERAL_FILENAME
+    if USE_BILATERAL_CACHE and emissions_cube_is_valid(bilateral_path, EMISSIONS_CUBE_DIR):
+        print(f"    Using emissions cube: {EMISSIONS_CUBE_DIR}")
+        with Span("scan", "cube"):
+            codes, cube = load_emissions_cube(EMISSIONS_CUBE_DIR)
+            count("rows_in", len(cube))
+        return codes, cube
+
+    codes, cube, source = scan_bilateral()
+    if USE_BILATERAL_CACHE:
+        write_emissions_cube(cube, codes, EMISSIONS_CUBE_DIR, source)
+    return codes, cube
+
+
+def bilateral_codes() -> BilateralCodes:
+    """The code tables of the whole bilateral CSV, without aggregating it.
+
+    They come from the saved cube or the columnar cache when one is valid;
+    otherwise only the label columns are parsed, cleaned as a scan cleans
+    them (years and routes are left empty).
+    """
+    bilateral_path = TIMESERIES_DIR / BILATERAL_FILENAME
+    for cache_dir, version in ((EMISSIONS_CUBE_DIR, EMISSIONS_CUBE_VERSION),
+                               (BILATERAL_CACHE_DIR, BILATERAL_CACHE_VERSION)):
+        if USE_BILATERAL_CACHE and bilateral_cache_is_valid(bilateral_path, cache_dir, version):
+            with open(cache_dir / "codes.json", encoding="utf-8") as fh:
+                return BilateralCodes.from_dict(json.load(fh))
+
+    codes = BilateralCodes()
+    columns = ["from_iso3", "to_iso3", "mode", "commodity"]
+    for chunk in pd.read_csv(bilateral_path, usecols=columns, chunksize=BILATERAL_CHUNKSIZE,
+                             dtype={col: str for col in columns}, low_memory=False):
+        codes.countries.encode(chunk["from_iso3"])
+        codes.countries.encode(chunk["to_iso3"])
+        codes.modes.encode(chunk["mode"].fillna("unknown").str.lower().str.strip())
+        codes.commodities.encode(chunk["commodity"].fillna("Unknown"))
+    return codes
+
+
+def delta_emissions_cube() -> tuple[BilateralCodes, EmissionsCube]:
+    """The cube cells of DELTA_YEARS only.
+
+    They are sliced out of the saved cube when it is valid. Otherwise only
+    those years' rows are aggregated: from the columnar cache, gathering
+    the other columns at those years' rows only, or from the CSV, whose
+    other years are dropped as soon as a chunk is parsed.
+    A delta run never writes the cache or the cube, which hold every year.
+    """
+    bilateral_path = TIMESERIES_DIR / BILATERAL_FILENAME
+    if USE_BILATERAL_CACHE and emissions_cube_is_valid(bilateral_path, EMISSIONS_CUBE_DIR):
+        print(f"    Using emissions cube: {EMISSIONS_CUBE_DIR}")
+        with Span("scan", "cube"):
+            codes, cube = load_emissions_cube(EMISSIONS_CUBE_DIR)
+            ranges = _read_cache_meta(EMISSIONS_CUBE_DIR, EMISSIONS_CUBE_VERSION)["years"]
+            spans = sorted(ranges[str(year)] for year in DELTA_YEARS if str(year) in ranges)
+            cube = cube.take(np.concatenate([np.arange(start, stop) for start, stop in spans]
+                                            or [np.empty(0, dtype=np.int64)]))
+            count("rows_in", len(cube))
+        return codes, cube
+
+    if USE_BILATERAL_CACHE and bilateral_cache_is_valid(bilateral_path, BILATERAL_CACHE_DIR):
+        print(f"    Using columnar cache: {BILATERAL_CACHE_DIR}")
+        codes, columns, rows = load_bilateral_cache(BILATERAL_CACHE_DIR)
+        year_codes = [code for code, year in enumerate(codes.years.labels) if year in DELTA_YEARS]
+        chunks = _iter_cached_chunks(columns, rows, np.asarray(year_codes, dtype=_CACHE_CODE_DTYPE))
+    else:
+        codes = BilateralCodes()
+        chunks = _iter_csv_chunks(BILATERAL_BASE_COLUMNS + ["commodity"] + BILATERAL_METRIC_COLUMNS,
+                                  codes, DELTA_YEARS)
+    cube, total_rows = _scan_chunks(chunks, codes, None)
+    cube = cube.take(np.argsort(cube.year, kind="stable"))
+    print(f"    Emissions cube for {', '.join(map(str, sorted(DELTA_YEARS)))}: "
+          f"{len(cube):,} cells from {total_rows:,} rows")
+    return codes, cube
+
+
+def derive_bilateral_outputs(aggregators: list[BilateralAggregator]) -> None:
+    codes, cube = delta_emissions_cube() if DELTA_YEARS else emissions_cube()
+    for aggregator in aggregators:
+        print(f"    Finalizing {aggregator.label} ...")
+        aggregator.finalize(codes, cube)
+
+
+def process_bilateral_flows() -> None:
+    print("\n[5/10] Processing bilateral flows (single scan, this may take a while) ...")
+    aggregators = [cls() for cls in BILATERAL_AGGREGATORS]
+    if RECONCILE_TABLES:
+        aggregators.append(ReconciliationAggregator())
+    derive_bilateral_outputs(aggregators)
 
-        for _, row in chunk.iterrows():
-            commodity = str(row["commodity"])
-            key = (commodity, int(row["Year"]), str(row["from_iso3"]), str(row["to_iso3"]))
-            rec = agg.get(key)
-            if rec is None:
-                rec = {"wtw": 0.0, "ttw": 0.0, "wtt": 0.0,
-                       "food_miles": 0.0, "cost": 0.0, "n_commodities": 0}
-                agg[key] = rec
-            rec["wtw"] += float(row["WTW_emissions_tCO2"])
-            rec["ttw"] += float(row["TTW_emissions_tCO2"])
-            rec["wtt"] += float(row["WTT_emissions_tCO2"])
-            rec["food_miles"] += float(row["food_miles_tkm"])
-            rec["cost"] += float(row["total_transport_cost_USD"])
-            rec["n_commodities"] += 1
-
-            m = str(row["mode"])
-            md = mode_ttw.setdefault(key, {})
-            md[m] = md.get(m, 0.0) + float(row["TTW_emissions_tCO2"])
-
-    elapsed = time.time() - t0
-    print(f"    Done reading {total_rows:,} rows in {elapsed:.1f}s. Selecting top flows per commodity ...")
-
-    comm_year_flows: dict[str, dict[str, list]] = defaultdict(lambda: defaultdict(list))
-    for (commodity, year, from_iso3, to_iso3), rec in agg.items():
-        modes = mode_ttw.get((commodity, year, from_iso3, to_iso3), {})
-        dominant_mode = max(modes, key=modes.get) if modes else "unknown"
-
-        comm_year_flows[commodity][str(year)].append({
-            "from": from_iso3,
-            "to": to_iso3,
-            "wtw": safe_float(rec["wtw"], 1),
-            "ttw": safe_float(rec["ttw"], 1),
-            "wtt": safe_float(rec["wtt"], 1),
-            "food_miles": safe_float(rec["food_miles"], 0),
-            "cost": safe_float(rec["cost"], 1),
-            "n_commodities": rec["n_commodities"],
-            "dominant_mode": dominant_mode,
-        })
 
-    result: dict[str, dict[str, list]] = {}
-    for commodity, year_flows in sorted(comm_year_flows.items()):
-        result[commodity] = {}
-        for year_str, flows in sorted(year_flows.items()):
-            flows.sort(key=lambda x: x["ttw"], reverse=True)
-            result[commodity][year_str] = flows[:TOP_N_BILATERAL_PER_COMMODITY]
+def process_bilateral_top_flows() -> None:
+    print("\n[5/10] Processing bilateral top flows per mode (this may take a while) ...")
+    derive_bilateral_outputs([TopFlowsByModeAggregator()])
 
-    write_json(result, "bilateral_by_commodity.json")
 
+def process_bilateral_by_commodity() -> None:
+    print("\n[5b/10] Processing bilateral flows by commodity (this may take a while) ...")
+    derive_bilateral_outputs([FlowsByCommodityAggregator()])
 
 # ---------------------------------------------------------------------------
 # 6. Transport factors
+#
+# Hundreds of small per-(mode, commodity) files. Each worker process reads
+# only the columns it needs and reduces its file to per-(commodity, mode)
+# sums and counts; the parent merges the partial buckets in file order. Under
+# the stage scheduler the pool is capped at the stage's share of the CPUs
+# (STAGE_CPUS), so parallel stages don't oversubscribe the machine.
 # ---------------------------------------------------------------------------
+FACTOR_METRIC_COLUMNS = ["WTW_kgCO2_t", "TTW_kgCO2_t", "distance_km"]
+FACTOR_WORKERS = os.cpu_count() or 1
+
+
+def read_factor_file(fpath: Path, wanted: set[str]) -> tuple[pd.DataFrame | None, str | None]:
+    """The ``wanted`` columns of one transport_statistics_*.csv, and a warning message (or None).
+
+    When some are missing, the mode and commodity come from the file name
+    (transport_statistics_<mode>_<commodity>.csv); the frame is None when
+    the file can't be read or named that way.
+    """
+    try:
+        df = pd.read_csv(
+            fpath,
+            usecols=lambda c: c in wanted,
+            dtype={"commodity": str, "mode": str},
+            low_memory=False,
+        )
+    except Exception as exc:
+        return None, f"Could not read {fpath.name}: {exc}"
+
+    if not wanted.issubset(set(df.columns)):
+        parts = fpath.stem.replace("transport_statistics_", "").split("_", 1)
+        if len(parts) == 2:
+            mode_from_name, commodity_from_name = parts
+        else:
+            return None, None
+        if "mode" not in df.columns:
+            df["mode"] = mode_from_name
+        if "commodity" not in df.columns:
+            df["commodity"] = commodity_from_name
+    return df, None
+
+
+def summarise_factor_file(fpath: Path) -> tuple[dict[tuple[str, str], list], str | None]:
+    """Reduce one transport_statistics_*.csv to {(commodity, mode): [wtw, ttw, dist, count]}.
+
+    Returns the partial buckets and a warning message (or None). Runs in a
+    worker process, so it must not touch shared state.
+    """
+    df, warning = read_factor_file(fpath, {"commodity", "mode", *FACTOR_METRIC_COLUMNS})
+    if df is None:
+        return {}, warning
+
+    values = np.zeros((len(FACTOR_METRIC_COLUMNS), len(df)))
+    for i, col in enumerate(FACTOR_METRIC_COLUMNS):
+        if col in df.columns:
+            values[i] = pd.to_numeric(df[col], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+
+    comm_codes, commodities = pd.factorize(df["commodity"], use_na_sentinel=False)
+    mode_codes, modes = pd.factorize(df["mode"], use_na_sentinel=False)
+    keys = comm_codes.astype(np.int64) * max(len(modes), 1) + mode_codes
+    group, group_keys = pd.factorize(keys)
+    counts = np.bincount(group, minlength=len(group_keys))
+    sums = [np.bincount(group, weights=values[i], minlength=len(group_keys)) for i in range(len(values))]
+
+    partial: dict[tuple[str, str], list] = {}
+    for g, key in enumerate(group_keys):
+        commodity = str(commodities[key // max(len(modes), 1)])
+        mode = str(modes[key % max(len(modes), 1)]).lower().strip()
+        bucket = partial.setdefault((commodity, mode), [0.0, 0.0, 0.0, 0])
+        bucket[0] += float(sums[0][g])
+        bucket[1] += float(sums[1][g])
+        bucket[2] += float(sums[2][g])
+        bucket[3] += int(counts[g])
+    return partial, None
+
+
+def factor_labels() -> tuple[set[str], set[str]]:
+    """The commodity and mode labels of the factor files, spelled as process_transport_factors() keys them.
+
+    Only the two label columns are read; a superset of the labels the stage
+    writes (it also skips files that lack a metric column).
+    """
+    commodities: set[str] = set()
+    modes: set[str] = set()
+    for fpath in sorted(TRANSPORT_FACTORS_DIR.glob("transport_statistics_*.csv")):
+        df, _ = read_factor_file(fpath, {"commodity", "mode"})
+        if df is not None:
+            commodities.update(str(c) for c in df["commodity"].unique())
+            modes.update(str(m).lower().strip() for m in df["mode"].unique())
+    return commodities, modes
+
+
 def process_transport_factors() -> None:
     print("\n[6/10] Processing transport factors ...")
 
@@ -691,47 +3162,37 @@ def process_transport_factors() -> None:
         return
 
     csv_files = sorted(TRANSPORT_FACTORS_DIR.glob("transport_statistics_*.csv"))
-    print(f"    Found {len(csv_files)} factor files")
+    workers = max(1, min(FACTOR_WORKERS, STAGE_CPUS, len(csv_files)))
+    print(f"    Found {len(csv_files)} factor files ({workers} worker{'s' if workers != 1 else ''})")
 
     raw: dict[str, dict[str, dict]] = defaultdict(
         lambda: defaultdict(lambda: {"wtw_sum": 0.0, "ttw_sum": 0.0, "dist_sum": 0.0, "count": 0})
     )
 
-    for i, fpath in enumerate(csv_files, 1):
-        if i % 50 == 0:
-            print(f"    ... {i}/{len(csv_files)} files")
-        try:
-            df = pd.read_csv(fpath, low_memory=False)
-        except Exception as exc:
-            print(f"  WARNING: Could not read {fpath.name}: {exc}")
-            continue
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        partials = executor.map(summarise_factor_file, csv_files, chunksize=max(1, len(csv_files) // (4 * workers)))
+    else:
+        executor = None
+        partials = map(summarise_factor_file, csv_files)
 
-        needed = {"commodity", "mode", "WTW_kgCO2_t", "TTW_kgCO2_t", "distance_km"}
-        if not needed.issubset(set(df.columns)):
-            parts = fpath.stem.replace("transport_statistics_", "").split("_", 1)
-            if len(parts) == 2:
-                mode_from_name, commodity_from_name = parts
-            else:
-                continue
-            if "mode" not in df.columns:
-                df["mode"] = mode_from_name
-            if "commodity" not in df.columns:
-                df["commodity"] = commodity_from_name
-
-        for col in ["WTW_kgCO2_t", "TTW_kgCO2_t", "distance_km"]:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
-            else:
-                df[col] = 0.0
-
-        for _, row in df.iterrows():
-            commodity = str(row.get("commodity", "Unknown"))
-            mode = str(row.get("mode", "unknown")).lower().strip()
-            bucket = raw[commodity][mode]
-            bucket["wtw_sum"] += float(row["WTW_kgCO2_t"])
-            bucket["ttw_sum"] += float(row["TTW_kgCO2_t"])
-            bucket["dist_sum"] += float(row["distance_km"])
-            bucket["count"] += 1
+    try:
+        for i, (fpath, (partial, warning)) in enumerate(zip(csv_files, partials), 1):
+            if i % 50 == 0:
+                print(f"    ... {i}/{len(csv_files)} files")
+            if warning:
+                print(f"  WARNING: {warning}")
+            count("bytes_read", fpath.stat().st_size)
+            for (commodity, mode), (wtw, ttw, dist, n) in partial.items():
+                bucket = raw[commodity][mode]
+                bucket["wtw_sum"] += wtw
+                bucket["ttw_sum"] += ttw
+                bucket["dist_sum"] += dist
+                bucket["count"] += n
+                count("rows_in", n)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     result: dict[str, dict] = {}
     for commodity, modes in sorted(raw.items()):
@@ -747,7 +3208,9 @@ def process_transport_factors() -> None:
                 "routes": n,
             }
 
-    write_json(result, "transport_factors.json")
+    count("rows_out", sum(len(modes) for modes in result.values()))
+    result = {commodity: identifier_keys("modes", modes) for commodity, modes in result.items()}
+    write_json(identifier_keys("commodities", result), "transport_factors.json")
 
 
 # ---------------------------------------------------------------------------
@@ -756,8 +3219,8 @@ def process_transport_factors() -> None:
 def process_country_metadata() -> None:
     print("\n[7/10] Processing country metadata ...")
 
-    consumer_df = pd.read_csv(TIMESERIES_DIR / "emissions_by_consumer_country_year.csv")
-    producer_df = pd.read_csv(TIMESERIES_DIR / "emissions_by_producer_country_year.csv")
+    consumer_df = load_timeseries("emissions_by_consumer_country_year.csv")
+    producer_df = load_timeseries("emissions_by_producer_country_year.csv")
     data_iso3s = sorted(
         set(consumer_df["to_iso3"].dropna().unique())
         | set(producer_df["from_iso3"].dropna().unique())
@@ -774,6 +3237,7 @@ def process_country_metadata() -> None:
                 "region": "Unknown",
             }
 
+    count("rows_out", len(COUNTRY_META))
     write_json(COUNTRY_META, "country_metadata.json")
 
 
@@ -784,13 +3248,13 @@ def process_dropdown_lists() -> None:
     print("\n[8/10] Processing dropdown lists ...")
 
     # Commodities — use "commodity_name" (new data) or "commodity_name_x" (old data)
-    comm_df = pd.read_csv(TIMESERIES_DIR / "emissions_by_commodity_year.csv")
+    comm_df = load_timeseries("emissions_by_commodity_year.csv")
     comm_col = "commodity_name" if "commodity_name" in comm_df.columns else "commodity_name_x"
     commodities = sorted(comm_df[comm_col].dropna().unique().tolist())
 
     # Countries
-    consumer_df = pd.read_csv(TIMESERIES_DIR / "emissions_by_consumer_country_year.csv")
-    producer_df = pd.read_csv(TIMESERIES_DIR / "emissions_by_producer_country_year.csv")
+    consumer_df = load_timeseries("emissions_by_consumer_country_year.csv")
+    producer_df = load_timeseries("emissions_by_producer_country_year.csv")
     all_iso3 = sorted(
         set(consumer_df["to_iso3"].dropna().unique())
         | set(producer_df["from_iso3"].dropna().unique())
@@ -805,9 +3269,10 @@ def process_dropdown_lists() -> None:
         })
     countries.sort(key=lambda c: c["name"])
 
-    global_df = pd.read_csv(TIMESERIES_DIR / "global_emissions_by_year.csv")
+    global_df = load_timeseries("global_emissions_by_year.csv")
     years = sorted(int(y) for y in global_df["Year"].unique() if int(y) not in EXCLUDE_YEARS)
 
+    count("rows_out", len(commodities) + len(countries))
     result = {
         "commodities": commodities,
         "countries": countries,
@@ -817,16 +3282,415 @@ def process_dropdown_lists() -> None:
     write_json(result, "dropdown_lists.json")
 
 
+# ---------------------------------------------------------------------------
+# Stages, incremental rebuilds and scheduling
+#
+# Every stage declares its input files, the constants that shape its output
+# and a version number (bump it whenever the stage's code changes its
+# output). The build manifest stores a fingerprint of all three per stage;
+# a stage whose fingerprint is unchanged and whose outputs still exist
+# (including every shard its shard manifests list) is skipped and keeps its
+# existing files.
+#
+# Stages also declare the stages they depend on. run_stages() runs every
+# stage whose dependencies are done in a pool of worker processes, so the
+# small-table stages no longer queue behind the bilateral scan.
+#
+# In a delta run (--delta-years) the year-keyed stages always run and merge
+# into their outputs, and their fingerprints are left as those of the last
+# full build: the next full build rebuilds them from scratch whenever their
+# inputs have changed since; the other stages follow the usual rules.
+# ---------------------------------------------------------------------------
+BUILD_MANIFEST_PATH = SCRIPT_DIR / ".cache" / "build_manifest.json"
+BUILD_MANIFEST_VERSION = 1
+STAGE_JOBS = min(4, os.cpu_count() or 1)
+# CPUs a stage may fill with its own worker processes: all of them when the
+# stages run one at a time, an equal share of them in a run_stages() worker
+STAGE_CPUS = os.cpu_count() or 1
+
+# Module settings that main() (or a caller) may change at runtime; they are
+# handed to stage worker processes, which would otherwise see the defaults
+# under the "spawn" start method.
+RUNTIME_SETTINGS = (
+    "TIMESERIES_DIR", "OUTPUT_DIR", "TRANSPORT_FACTORS_DIR",
+    "BILATERAL_CHUNKSIZE", "BILATERAL_CACHE_DIR", "EMISSIONS_CUBE_DIR", "USE_BILATERAL_CACHE",
+    "FACTOR_WORKERS", "SCAN_WORKERS", "SCAN_RANGE_BYTES",
+    "JSON_ENCODER", "TABLE_FORMAT", "COMPRESS_OUTPUTS", "FLOW_TABLE_BINARY",
+    "TRACE_PATH", "AGGREGATION_BACKEND", "AGGREGATION_MEMORY_LIMIT", "AGGREGATION_THREADS",
+    "DELTA_YEARS", "RECONCILE_TABLES", "RECONCILE_RTOL", "RECONCILIATION_REPORT_PATH",
+    "ENCODE_IDENTIFIERS", "IDENTIFIERS",
+)
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    func: Callable[[], None]
+    inputs: Callable[[], list[Path]]
+    outputs: tuple[str, ...]
+    constants: tuple[str, ...] = ()
+    version: int = 1
+    depends_on: tuple[str, ...] = ()
+    cost: int = 1                        # relative run time; costlier stages start first
+    delta: bool = False                  # year-keyed: can merge DELTA_YEARS into its outputs
+
+
+def _timeseries_inputs(*names: str) -> Callable[[], list[Path]]:
+    return lambda: [TIMESERIES_DIR / name for name in names]
+
+
+def _bilateral_inputs() -> list[Path]:
+    tables = [cfg[0] for cfg in RECONCILE_COUNTRY_TABLES.values()] + ["global_emissions_by_year.csv"]
+    return _timeseries_inputs(BILATERAL_FILENAME, *(tables if RECONCILE_TABLES else []))()
+
+
+def _factor_inputs() -> list[Path]:
+    if not TRANSPORT_FACTORS_DIR.exists():
+        return []
+    return sorted(TRANSPORT_FACTORS_DIR.glob("transport_statistics_*.csv"))
+
+
+STAGES: list[Stage] = [
+    Stage("global_timeseries", process_global_timeseries,
+          _timeseries_inputs("global_emissions_by_year.csv"),
+          ("global_timeseries.json",), ("EXCLUDE_YEARS", "PRELIMINARY_YEARS"), delta=True),
+    Stage("global_by_mode", process_global_by_mode,
+          _timeseries_inputs("emissions_by_year_mode.csv"),
+          ("global_by_mode.json",), ("EXCLUDE_YEARS", "ENCODE_IDENTIFIERS"), delta=True),
+    Stage("consumer_countries", process_consumer_countries,
+          _timeseries_inputs("emissions_by_consumer_country_year.csv"),
+          ("consumer_countries.json",), ("EXCLUDE_YEARS", "TABLE_FORMAT", "ENCODE_IDENTIFIERS"), delta=True),
+    Stage("producer_countries", process_producer_countries,
+          _timeseries_inputs("emissions_by_producer_country_year.csv"),
+          ("producer_countries.json",), ("EXCLUDE_YEARS", "TABLE_FORMAT", "ENCODE_IDENTIFIERS"), delta=True),
+    Stage("commodities", process_commodities,
+          _timeseries_inputs("emissions_by_commodity_year.csv"),
+          ("commodities.json",), ("EXCLUDE_YEARS", "TABLE_FORMAT", "ENCODE_IDENTIFIERS"), delta=True),
+    Stage("bilateral_flows", process_bilateral_flows, _bilateral_inputs,
+          tuple(out for cls in BILATERAL_AGGREGATORS for out in cls.outputs),
+          ("EXCLUDE_YEARS", "TOP_N_BILATERAL_PER_MODE", "TOP_N_BILATERAL_PER_COMMODITY",
+           "TOP_N_PARTNERS_PER_COUNTRY", "FLOW_TABLE_BINARY", "RECONCILE_TABLES", "RECONCILE_RTOL",
+           "ENCODE_IDENTIFIERS"),
+          version=2, cost=100, delta=True),
+    Stage("transport_factors", process_transport_factors, _factor_inputs,
+          ("transport_factors.json",), ("ENCODE_IDENTIFIERS",), cost=10),
+    Stage("country_metadata", process_country_metadata,
+          _timeseries_inputs("emissions_by_consumer_country_year.csv",
+                             "emissions_by_producer_country_year.csv"),
+          ("country_metadata.json",), ("COUNTRY_META",),
+          depends_on=("consumer_countries", "producer_countries")),
+    Stage("dropdown_lists", process_dropdown_lists,
+          _timeseries_inputs("emissions_by_commodity_year.csv",
+                             "emissions_by_consumer_country_year.csv",
+                             "emissions_by_producer_country_year.csv",
+                             "global_emissions_by_year.csv"),
+          ("dropdown_lists.json",), ("EXCLUDE_YEARS", "PRELIMINARY_YEARS", "COUNTRY_META"),
+          depends_on=("commodities", "consumer_countries", "producer_countries", "country_metadata")),
+]
+STAGE_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def load_build_manifest() -> dict:
+    """Read the build manifest; a missing or foreign manifest means a full rebuild."""
+    try:
+        with open(BUILD_MANIFEST_PATH, encoding="utf-8") as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        manifest = {}
+    if (manifest.get("version") != BUILD_MANIFEST_VERSION
+            or manifest.get("output_dir") != str(OUTPUT_DIR)):
+        manifest = {"version": BUILD_MANIFEST_VERSION, "output_dir": str(OUTPUT_DIR), "stages": {}}
+    return manifest
+
+
+def save_build_manifest(manifest: dict) -> None:
+    BUILD_MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = BUILD_MANIFEST_PATH.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    tmp.replace(BUILD_MANIFEST_PATH)
+
+
+def _input_fingerprint(path: Path, previous: dict | None) -> dict | None:
+    """Fingerprint an input, reusing the recorded hash while size and mtime match."""
+    if not path.exists():
+        return None
+    current = file_fingerprint(path, with_hash=False)
+    if previous and previous["size"] == current["size"] and previous["mtime_ns"] == current["mtime_ns"]:
+        current["blake2b"] = previous["blake2b"]
+    else:
+        current["blake2b"] = file_digest(path)
+    return current
+
+
+def _constant_value(name: str):
+    value = globals()[name]
+    return sorted(value) if isinstance(value, set) else value
+
+
+def stage_fingerprint(stage: Stage, previous: dict | None) -> dict:
+    """Fingerprint a stage: its version, constants and input file contents."""
+    prev_inputs = (previous or {}).get("inputs", {})
+    inputs = {str(path): _input_fingerprint(path, prev_inputs.get(str(path))) for path in stage.inputs()}
+    constants = {name: _constant_value(name) for name in stage.constants}
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(
+        {
+            "version": stage.version,
+            "constants": constants,
+            "inputs": {path: fp and fp["blake2b"] for path, fp in inputs.items()},
+        },
+        sort_keys=True, default=str,
+    ).encode("utf-8"))
+    return {"key": digest.hexdigest(), "inputs": inputs}
+
+
+def _shards_present(name: str) -> bool:
+    """Whether every shard a shard manifest output lists exists (true for other outputs)."""
+    if not name.endswith("_manifest.json"):
+        return True
+    try:
+        with open(OUTPUT_DIR / name, encoding="utf-8") as fh:
+            shards = json.load(fh)["shards"]
+        return all((OUTPUT_DIR / entry["path"]).exists() for entry in shards.values())
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return False
+
+
+def stage_is_current(stage: Stage, fingerprint: dict, previous: dict | None) -> bool:
+    if previous is None or previous.get("key") != fingerprint["key"]:
+        return False
+    return all((OUTPUT_DIR / name).exists() and _shards_present(name) for name in stage.outputs)
+
+
+def run_stage(stage: Stage) -> dict:
+    """Run one stage under a telemetry span; returns its stage event."""
+    with Span("stage", stage.name) as span:
+        stage.func()
+    return span.event
+
+
+def shared_timeseries(stages: list[Stage]) -> dict[Path, pd.DataFrame]:
+    """Parse, in this process, every TimeSeries table read by more than one of ``stages``.
+
+    Returns the loader's cache, which run_stages() hands to its workers so
+    that no table is parsed twice however the stages are spread over them.
+    """
+    readers = Counter(path.name for stage in stages for path in stage.inputs()
+                      if path.name in TIMESERIES_COLUMNS and path.exists())
+    for name, n in readers.items():
+        if n > 1:
+            load_timeseries(name)
+    return dict(_TIMESERIES_CACHE)
+
+
+def _init_stage_worker(tables: dict[Path, pd.DataFrame], cpus: int) -> None:
+    global STAGE_CPUS
+    _TIMESERIES_CACHE.update(tables)
+    STAGE_CPUS = cpus
+
+
+def _run_stage_in_worker(name: str, settings: dict) -> tuple[dict, dict]:
+    """Run one stage in a pool worker; returns its event and the worker's TimeSeries loader counters."""
+    globals().update(settings)
+    before = dict(TIMESERIES_STATS)
+    event = run_stage(STAGE_BY_NAME[name])
+    return event, {key: TIMESERIES_STATS[key] - before[key] for key in TIMESERIES_STATS}
+
+
+def run_stages(stages: list[Stage], jobs: int, on_done: Callable[[Stage, dict], None]) -> list[str]:
+    """Run ``stages`` in dependency order, up to ``jobs`` at a time.
+
+    ``stages`` must be in a valid order (as in STAGES); dependencies on stages
+    outside it count as satisfied (they were skipped as current). ``on_done``
+    is called in this process with each stage and its telemetry event as it
+    finishes. With several jobs, the TimeSeries tables that stages share are
+    parsed here once and handed to the workers. After a failure no new
+    stages are started; returns the names of the stages that failed or never
+    ran.
+    """
+    pending = {stage.name: stage for stage in stages}
+    done = {stage.name for stage in STAGES} - set(pending)
+    failed: list[str] = []
+
+    if jobs <= 1:
+        for stage in stages:
+            del pending[stage.name]
+            try:
+                event = run_stage(stage)
+            except Exception as exc:
+                print(f"\nERROR: stage {stage.name} failed:")
+                traceback.print_exception(exc)
+                return [stage.name] + list(pending)
+            on_done(stage, event)
+        return []
+
+    settings = {name: globals()[name] for name in RUNTIME_SETTINGS}
+    tables = shared_timeseries(stages)
+    running: dict = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_stage_worker,
+                             initargs=(tables, max(1, STAGE_CPUS // jobs))) as pool:
+        while pending or running:
+            if not failed:
+                ready = [stage for stage in pending.values()
+                         if all(dep in done for dep in stage.depends_on)]
+                for stage in sorted(ready, key=lambda st: -st.cost)[:jobs - len(running)]:
+                    del pending[stage.name]
+                    running[pool.submit(_run_stage_in_worker, stage.name, settings)] = stage
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    event, loader_stats = future.result()
+                except Exception as exc:
+                    print(f"\nERROR: stage {stage.name} failed:")
+                    traceback.print_exception(exc)
+                    failed.append(stage.name)
+                    continue
+                for key, value in loader_stats.items():
+                    TIMESERIES_STATS[key] += value
+                done.add(stage.name)
+                on_done(stage, event)
+    return failed + list(pending)
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build the dashboard JSON files from the source CSVs.")
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="parse the bilateral CSV directly instead of using (or building) the columnar cache "
+             "and emissions cube",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="rebuild every stage, even those whose inputs and code are unchanged",
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=STAGE_JOBS, metavar="N",
+        help=f"stages to run in parallel worker processes (default: {STAGE_JOBS}; 1 runs in-process)",
+    )
+    parser.add_argument(
+        "--factor-workers", type=int, default=FACTOR_WORKERS, metavar="N",
+        help=f"worker processes for transport factor files (default: {FACTOR_WORKERS}; 1 runs in-process; "
+             "with --jobs above 1, at most the stage's share of the CPUs)",
+    )
+    parser.add_argument(
+        "--scan-workers", type=int, default=SCAN_WORKERS, metavar="N",
+        help=f"worker processes parsing byte ranges of the bilateral CSV (default: {SCAN_WORKERS}; "
+             "1 streams it in-process)",
+    )
+    parser.add_argument(
+        "--json-encoder", choices=sorted(JSON_ENCODERS), default=JSON_ENCODER,
+        help=f"encoder for the output JSON files (default: {JSON_ENCODER}; orjson is used when installed)",
+    )
+    parser.add_argument(
+        "--table-format", choices=("nested", "columnar"), default=TABLE_FORMAT,
+        help="layout of the consumer, producer and commodity tables (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-compress", action="store_true",
+        help="skip the precompressed .gz/.br siblings of the output files",
+    )
+    parser.add_argument(
+        "--binary-flows", action="store_true",
+        help="also write bilateral_top_flows.bin, the top-flow tables as packed typed arrays",
+    )
+    parser.add_argument(
+        "--backend", choices=sorted(AGGREGATION_BACKENDS), default=AGGREGATION_BACKEND,
+        help=f"aggregation backend for the bilateral scan (default: {AGGREGATION_BACKEND}; "
+             "duckdb spills the scan to disk when installed; its sums may differ in the last bits)",
+    )
+    parser.add_argument(
+        "--backend-memory-limit", default=AGGREGATION_MEMORY_LIMIT, metavar="SIZE",
+        help="memory limit of the duckdb backend, e.g. 4GB (default: DuckDB's own)",
+    )
+    parser.add_argument(
+        "--reconcile", action="store_true",
+        help="check the bilateral scan against the consumer, producer and global tables "
+             "and write the mismatches to CACHE_DIR/reconciliation.json",
+    )
+    parser.add_argument(
+        "--reconcile-tolerance", type=float, default=RECONCILE_RTOL, metavar="RTOL",
+        help="relative tolerance of the reconciliation checks (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--delta-years", type=int, nargs="+", metavar="YEAR",
+        help="recompute only these years and merge them into the existing outputs "
+             "(year-keyed stages; the other years are kept as they are)",
+    )
+    parser.add_argument(
+        "--encode-ids", action="store_true",
+        help=f"write countries, commodities and modes as integer codes listed in {IDENTIFIERS_NAME}",
+    )
+    parser.add_argument(
+        "--stage", action="append", choices=list(STAGE_BY_NAME), metavar="NAME",
+        help="run only this stage (repeatable; default: all stages)",
+    )
+    parser.add_argument("--timeseries-dir", type=Path, default=TIMESERIES_DIR, metavar="DIR",
+                        help="directory of the TimeSeries CSVs (default: %(default)s)")
+    parser.add_argument("--factors-dir", type=Path, default=TRANSPORT_FACTORS_DIR, metavar="DIR",
+                        help="directory of the transport_statistics_*.csv files (default: %(default)s)")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR, metavar="DIR",
+                        help="where the dashboard data files are written (default: %(default)s)")
+    parser.add_argument("--cache-dir", type=Path, metavar="DIR",
+                        help=f"bilateral columnar cache and build manifest (default: {BUILD_MANIFEST_PATH.parent})")
+    parser.add_argument("--report", type=Path, metavar="FILE",
+                        help="JSON run report with per-stage telemetry (default: CACHE_DIR/run_report.json)")
+    parser.add_argument("--trace", type=Path, metavar="FILE",
+                        help="also append every telemetry event to this JSONL file")
+    return parser.parse_args(argv)
+
+
 def main() -> None:
+    global USE_BILATERAL_CACHE, FACTOR_WORKERS, SCAN_WORKERS, JSON_ENCODER, TABLE_FORMAT
+    global COMPRESS_OUTPUTS, FLOW_TABLE_BINARY, TIMESERIES_DIR, TRANSPORT_FACTORS_DIR, OUTPUT_DIR
+    global BILATERAL_CACHE_DIR, EMISSIONS_CUBE_DIR, BUILD_MANIFEST_PATH, TRACE_PATH
+    global AGGREGATION_BACKEND, AGGREGATION_MEMORY_LIMIT, DELTA_YEARS
+    global RECONCILE_TABLES, RECONCILE_RTOL, RECONCILIATION_REPORT_PATH, ENCODE_IDENTIFIERS
+
+    args = parse_args()
+    TIMESERIES_DIR = args.timeseries_dir.resolve()
+    TRANSPORT_FACTORS_DIR = args.factors_dir.resolve()
+    OUTPUT_DIR = args.output_dir.resolve()
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    if args.cache_dir:
+        BILATERAL_CACHE_DIR = args.cache_dir.resolve() / "bilateral"
+        EMISSIONS_CUBE_DIR = args.cache_dir.resolve() / "cube"
+        BUILD_MANIFEST_PATH = args.cache_dir.resolve() / "build_manifest.json"
+        RECONCILIATION_REPORT_PATH = args.cache_dir.resolve() / "reconciliation.json"
+    report_path = (args.report or BUILD_MANIFEST_PATH.parent / "run_report.json").resolve()
+    if args.trace:
+        TRACE_PATH = args.trace.resolve()
+    if args.no_cache:
+        USE_BILATERAL_CACHE = False
+    FACTOR_WORKERS = args.factor_workers
+    SCAN_WORKERS = args.scan_workers
+    JSON_ENCODER = args.json_encoder
+    TABLE_FORMAT = args.table_format
+    if args.no_compress:
+        COMPRESS_OUTPUTS = False
+    if args.binary_flows:
+        FLOW_TABLE_BINARY = True
+    AGGREGATION_BACKEND = args.backend
+    AGGREGATION_MEMORY_LIMIT = args.backend_memory_limit
+    DELTA_YEARS = set(args.delta_years or ())
+    RECONCILE_TABLES = args.reconcile
+    RECONCILE_RTOL = args.reconcile_tolerance
+    ENCODE_IDENTIFIERS = args.encode_ids
+
     print("=" * 60)
     print("Transport Emissions Dashboard -- Preprocessing")
     print("=" * 60)
     print(f"TimeSeries dir : {TIMESERIES_DIR}")
     print(f"Output dir     : {OUTPUT_DIR}")
     print(f"Factors dir    : {TRANSPORT_FACTORS_DIR}")
+    if DELTA_YEARS:
+        print(f"Delta years    : {', '.join(map(str, sorted(DELTA_YEARS)))}")
 
     if not TIMESERIES_DIR.exists():
         print(f"\nERROR: TimeSeries directory not found: {TIMESERIES_DIR}")
@@ -834,20 +3698,82 @@ def main() -> None:
 
     t_start = time.time()
 
-    process_global_timeseries()
-    process_global_by_mode()
-    process_consumer_countries()
-    process_producer_countries()
-    process_commodities()
-    process_bilateral_top_flows()
-    process_bilateral_by_commodity()
-    process_transport_factors()
-    process_country_metadata()
-    process_dropdown_lists()
+    # Fingerprint every stage up front: stages may update module state
+    # (e.g. COUNTRY_META) that later stages list as constants.
+    manifest = load_build_manifest()
+    fingerprints = {
+        stage.name: stage_fingerprint(stage, manifest["stages"].get(stage.name))
+        for stage in STAGES
+    }
+    selected = [stage for stage in STAGES if not args.stage or stage.name in args.stage]
+    if DELTA_YEARS:
+        missing = [name for stage in selected if stage.delta for name in stage.outputs
+                   if not ((OUTPUT_DIR / name).exists() and _shards_present(name))]
+        if missing:
+            print(f"\nERROR: --delta-years needs the outputs of a full build, missing: {', '.join(missing)}")
+            sys.exit(1)
+        if (OUTPUT_DIR / IDENTIFIERS_NAME).exists() != ENCODE_IDENTIFIERS:
+            print("\nERROR: --delta-years must match the --encode-ids setting of the full build")
+            sys.exit(1)
+    skipped = [
+        stage.name for stage in selected
+        if not args.force and not (DELTA_YEARS and stage.delta)
+        and stage_is_current(stage, fingerprints[stage.name], manifest["stages"].get(stage.name))
+    ]
+    if skipped:
+        print(f"\nUnchanged, keeping existing output: {', '.join(skipped)}")
+    # After fingerprinting, so that only ENCODE_IDENTIFIERS (not the
+    # append-only dictionary) decides whether a stage is current
+    prepare_identifiers([stage for stage in selected if stage.name not in skipped])
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(t_start)),
+        "argv": sys.argv[1:],
+        "timeseries_dir": str(TIMESERIES_DIR),
+        "output_dir": str(OUTPUT_DIR),
+        "delta_years": sorted(DELTA_YEARS),
+        "skipped": skipped,
+        "failed": [],
+        "stages": [],
+    }
+
+    def record(stage: Stage, event: dict) -> None:
+        if not (DELTA_YEARS and stage.delta):
+            manifest["stages"][stage.name] = fingerprints[stage.name]
+            save_build_manifest(manifest)
+        report["stages"].append(event)
+
+    def finish_report() -> None:
+        report.update(
+            elapsed_s=round(time.time() - t_start, 3),
+            peak_rss_mb=peak_rss_mb(),
+            timeseries_loader=dict(TIMESERIES_STATS),
+        )
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Run report: {report_path}")
+
+    failed = run_stages([stage for stage in selected if stage.name not in skipped], args.jobs, record)
+    if failed:
+        print(f"\nERROR: stages did not complete: {', '.join(failed)}")
+        report["failed"] = failed
+        finish_report()
+        sys.exit(1)
+
+    print("\nPublishing content-hashed outputs ...")
+    with Span("publish", DATA_MANIFEST_NAME) as span:
+        publish_hashed_outputs()
+    report["publish"] = span.event
 
     elapsed = time.time() - t_start
+    print(
+        f"\nTimeSeries loader: {TIMESERIES_STATS['parses']} parses "
+        f"({TIMESERIES_STATS['parse_seconds']:.2f}s), {TIMESERIES_STATS['cache_hits']} cache hits"
+    )
     print(f"\nAll done in {elapsed:.1f}s.")
     print(f"Output files in: {OUTPUT_DIR}")
+    finish_report()
 
 
 if __name__ == "__main__":
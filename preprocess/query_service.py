@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Local query service for bilateral corridor slices.
+
+Loads the emissions cube that preprocess.py saves next to its columnar cache
+(building it first if it is missing or stale) and answers top-N corridor
+queries over HTTP, for any combination of year, mode, commodity, origin and
+destination, ranked by any flow metric. The dashboard keeps reading the
+static JSON files; this service covers the queries those files don't bake
+in. Recent results are kept in an LRU cache.
+
+Usage:
+    python query_service.py [--host HOST] [--port N] [--cache-entries N]
+                            [--timeseries-dir DIR] [--cache-dir DIR]
+
+    GET /top?year=2022&mode=maritime&commodity=Wheat&from=USA,CAN&to=CHN&metric=wtw&n=20
+    GET /meta       labels accepted by each filter
+    GET /health     cube size and cache statistics
+
+Filters take comma-separated labels and may be repeated; a missing filter
+matches everything. ``metric`` is one of wtw, ttw, wtt, food_miles, cost
+(default ttw) and ``n`` defaults to 100.
+"""
+
+import argparse
+import asyncio
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import preprocess
+from preprocess import (
+    BilateralCodes,
+    EmissionsCube,
+    KeyedSums,
+    _dominant_modes,
+    _flow_dict,
+    _pack_keys,
+    _unpack_keys,
+    round_array,
+    top_k_indices,
+)
+
+# Rankable metrics: name -> (row of the cube's sums, decimals in the output)
+QUERY_METRICS = {"wtw": (0, 1), "ttw": (1, 1), "wtt": (2, 1), "food_miles": (3, 0), "cost": (4, 1)}
+# Query parameter -> (cube column, code table)
+QUERY_FILTERS = {
+    "year": ("year", "years"),
+    "mode": ("mode", "modes"),
+    "commodity": ("commodity", "commodities"),
+    "from": ("from_iso3", "countries"),
+    "to": ("to_iso3", "countries"),
+}
+DEFAULT_TOP_N = 100
+MAX_TOP_N = 10_000
+CACHE_ENTRIES = 512
+MAX_REQUEST_BYTES = 16 * 1024
+
+
+class QueryError(ValueError):
+    """A malformed query; answered with 400 Bad Request."""
+
+
+class LRUCache:
+    """Encoded responses by normalised query, least recently used evicted first."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, bytes] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> bytes | None:
+        payload = self.entries.get(key)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def put(self, key: tuple, payload: bytes) -> None:
+        self.entries[key] = payload
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
+
+
+class CorridorIndex:
+    """The emissions cube plus label lookups, answering top-N corridor queries."""
+
+    def __init__(self, codes: BilateralCodes, cube: EmissionsCube) -> None:
+        self.codes = codes
+        # Copy out of the memory map so queries never touch the disk
+        self.cube = cube.take(np.arange(len(cube)))
+        self.lookup = {
+            param: {str(label): code for code, label in enumerate(getattr(codes, table).labels)}
+            for param, (_, table) in QUERY_FILTERS.items()
+        }
+
+    def normalise(self, params: dict[str, list[str]]) -> tuple:
+        """The query as a hashable key: sorted filter codes, metric and N."""
+        unknown = set(params) - set(QUERY_FILTERS) - {"metric", "n"}
+        if unknown:
+            raise QueryError(f"unknown parameter(s): {', '.join(sorted(unknown))}")
+        filters = []
+        for param in QUERY_FILTERS:
+            labels = [label.strip() for value in params.get(param, []) for label in value.split(",")]
+            labels = [label for label in labels if label]
+            if not labels:
+                filters.append(None)
+                continue
+            missing = [label for label in labels if label not in self.lookup[param]]
+            if missing:
+                raise QueryError(f"unknown {param}: {', '.join(missing)}")
+            filters.append(tuple(sorted({self.lookup[param][label] for label in labels})))
+
+        metric = params.get("metric", ["ttw"])[-1]
+        if metric not in QUERY_METRICS:
+            raise QueryError(f"metric must be one of {', '.join(QUERY_METRICS)}")
+        try:
+            n = int(params.get("n", [DEFAULT_TOP_N])[-1])
+        except ValueError:
+            raise QueryError("n must be an integer") from None
+        if not 1 <= n <= MAX_TOP_N:
+            raise QueryError(f"n must be between 1 and {MAX_TOP_N}")
+        return tuple(filters), metric, n
+
+    def top(self, key: tuple) -> dict:
+        """Corridors matching the filters, summed over everything else, top N by ``metric``.
+
+        Ranking and ties follow the static files: rounded metric, largest
+        first, corridors in first-seen order on ties.
+        """
+        filters, metric, n = key
+        selected = dict(zip(QUERY_FILTERS, filters))
+        cube = self.cube
+        mask = np.ones(len(cube), dtype=bool)
+        for param, (column, _) in QUERY_FILTERS.items():
+            if selected[param] is not None:
+                mask &= np.isin(getattr(cube, column), selected[param])
+        cells = cube.take(np.flatnonzero(mask))
+
+        # Add subtotals in the order the static files do, so a query for a
+        # slice they cover gives the same numbers: per-mode corridor sums
+        # first (bilateral_top_flows.json), or straight from the cells when
+        # filtering by commodity (the by-commodity shards)
+        if selected["commodity"] is None:
+            parts = cells.rollup(("mode", "from_iso3", "to_iso3"))
+            part_mode, part_from, part_to = parts.fields
+            part_sums, part_counts = parts.sums, parts.counts
+        else:
+            part_mode, part_from, part_to = cells.mode, cells.from_iso3, cells.to_iso3
+            part_sums, part_counts = cells.sums, cells.counts
+
+        agg = KeyedSums(len(part_sums))
+        owner = agg.add(_pack_keys(part_from, part_to), part_sums, part_counts)
+        keys, sums, counts = agg.view()
+        from_iso3, to_iso3 = _unpack_keys(keys, 2)
+        # TTW per (corridor, mode), for the dominant mode
+        mode_ttw = KeyedSums(1)
+        mode_ttw.add(_pack_keys(owner, part_mode), part_sums[1:2])
+        pair_keys, pair_ttw, _ = mode_ttw.view()
+        pair_owner, pair_mode = _unpack_keys(pair_keys, 2)
+        dominant = _dominant_modes(pair_owner, pair_mode, pair_ttw[0], len(counts), len(self.codes.modes))
+
+        row, decimals = QUERY_METRICS[metric]
+        top = top_k_indices(round_array(sums[row], decimals), n)
+        countries = self.codes.countries.labels
+        modes = self.codes.modes.labels
+        return {
+            "query": self.describe(key),
+            "matches": len(counts),
+            "flows": [
+                _flow_dict(countries[from_iso3[i]], countries[to_iso3[i]], sums[:, i], counts[i],
+                           modes[dominant[i]])
+                for i in top
+            ],
+        }
+
+    def describe(self, key: tuple) -> dict:
+        filters, metric, n = key
+        query: dict = {"metric": metric, "n": n}
+        for (param, (_, table)), selected in zip(QUERY_FILTERS.items(), filters):
+            if selected is not None:
+                labels = getattr(self.codes, table).labels
+                query[param] = [str(labels[code]) for code in selected]
+        return query
+
+    def meta(self) -> dict:
+        return {
+            "filters": {param: list(labels) for param, labels in self.lookup.items()},
+            "metrics": list(QUERY_METRICS),
+            "default_n": DEFAULT_TOP_N,
+            "max_n": MAX_TOP_N,
+        }
+
+
+class QueryService:
+    """A minimal HTTP/1.1 server (GET only, one request per connection)."""
+
+    def __init__(self, index: CorridorIndex, cache: LRUCache) -> None:
+        self.index = index
+        self.cache = cache
+        self.encode = preprocess.JSON_ENCODERS[preprocess.JSON_ENCODER]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            method, target, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+            status, headers, body = await self.respond(method, target)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, headers, body = 400, {}, self.encode({"error": "malformed request"})
+        except ConnectionError:
+            return
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        lines = [f"HTTP/1.1 {status} {reason}",
+                 "Content-Type: application/json",
+                 f"Content-Length: {len(body)}",
+                 "Access-Control-Allow-Origin: *",
+                 "Connection: close",
+                 *(f"{name}: {value}" for name, value in headers.items())]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def respond(self, method: str, target: str) -> tuple[int, dict, bytes]:
+        if method != "GET":
+            return 405, {"Allow": "GET"}, self.encode({"error": "only GET is supported"})
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {}, self.encode({"cells": len(self.index.cube), "cache": self.cache.stats()})
+        if url.path == "/meta":
+            return 200, {}, self.encode(self.index.meta())
+        if url.path != "/top":
+            return 404, {}, self.encode({"error": f"no such endpoint: {url.path}"})
+
+        t0 = time.perf_counter()
+        try:
+            key = self.index.normalise(parse_qs(url.query))
+        except QueryError as exc:
+            return 400, {}, self.encode({"error": str(exc)})
+        payload = self.cache.get(key)
+        state = "hit"
+        if payload is None:
+            state = "miss"
+            # Keep the event loop free for other connections while numpy works
+            result = await asyncio.get_running_loop().run_in_executor(None, self.index.top, key)
+            payload = self.encode(result)
+            self.cache.put(key, payload)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        return 200, {"X-Cache": state, "X-Elapsed-Ms": f"{elapsed_ms:.2f}"}, payload
+
+
+def load_index() -> CorridorIndex:
+    t0 = time.perf_counter()
+    codes, cube = preprocess.emissions_cube()
+    index = CorridorIndex(codes, cube)
+    print(f"Loaded {len(cube):,} cube cells in {time.perf_counter() - t0:.2f}s")
+    return index
+
+
+async def serve(index: CorridorIndex, host: str, port: int, cache_entries: int) -> None:
+    service = QueryService(index, LRUCache(cache_entries))
+    server = await asyncio.start_server(service.handle, host, port, limit=MAX_REQUEST_BYTES)
+    print(f"Serving corridor queries on http://{host}:{port}/top")
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve top-N corridor queries from the emissions cube.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--cache-entries", type=int, default=CACHE_ENTRIES, metavar="N",
+                        help="query results kept in the LRU cache (default: %(default)s)")
+    parser.add_argument("--timeseries-dir", type=Path, default=preprocess.TIMESERIES_DIR, metavar="DIR",
+                        help="directory of the bilateral CSV (default: %(default)s)")
+    parser.add_argument("--cache-dir", type=Path, metavar="DIR",
+                        help="preprocess.py cache directory holding the cube "
+                             f"(default: {preprocess.EMISSIONS_CUBE_DIR.parent})")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    preprocess.TIMESERIES_DIR = args.timeseries_dir.resolve()
+    if args.cache_dir:
+        preprocess.BILATERAL_CACHE_DIR = args.cache_dir.resolve() / "bilateral"
+        preprocess.EMISSIONS_CUBE_DIR = args.cache_dir.resolve() / "cube"
+    try:
+        asyncio.run(serve(load_index(), args.host, args.port, args.cache_entries))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
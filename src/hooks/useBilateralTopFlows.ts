@@ -0,0 +1,20 @@
+import { useEffect, useState } from 'react'
+import { hasDataFile, useDataLoader } from './useDataLoader'
+import { decodeFlowTables } from '../utils/typedArrays'
+import type { BilateralTopFlows } from '../types/data'
+
+/**
+ * The top bilateral flows per year and mode, read from the packed
+ * bilateral_top_flows.bin when the build published it (preprocess.py
+ * --binary-flows) and from bilateral_top_flows.json otherwise. With
+ * `enabled` false nothing is fetched (e.g. while a view has better data).
+ */
+export function useBilateralTopFlows(enabled = true) {
+  const [binary, setBinary] = useState<boolean | null>(null)
+  useEffect(() => { if (enabled) hasDataFile('bilateral_top_flows.bin').then(setBinary) }, [enabled])
+
+  const packed = useDataLoader<BilateralTopFlows>(enabled && binary ? 'bilateral_top_flows.bin' : null, decodeFlowTables)
+  const json = useDataLoader<BilateralTopFlows>(enabled && binary === false ? 'bilateral_top_flows.json' : null)
+  if (binary) return packed
+  return { ...json, loading: binary === null || json.loading }
+}
@@ -1,26 +1,92 @@
-import { useState, useEffect, useRef } from 'react'
+import { useState, useEffect } from 'react'
+import type { Identifiers } from '../types/data'
+import { decodeIdentifiers } from '../utils/identifiers'
 
 const cache = new Map<string, unknown>()
+const inflight = new Map<string, Promise<unknown>>()
 
-export function useDataLoader<T>(filename: string) {
-  const [data, setData] = useState<T | null>(() => (cache.get(filename) as T) ?? null)
-  const [loading, setLoading] = useState(!cache.has(filename))
+// Logical name -> content-hashed filename, from data_manifest.json. The
+// hashed files never change, so they can be cached indefinitely; without a
+// manifest (e.g. a dev build) the plain names are fetched instead.
+let manifest: Promise<Record<string, string>> | null = null
+
+function loadManifest(): Promise<Record<string, string>> {
+  manifest ??= fetch(`${import.meta.env.BASE_URL}data/data_manifest.json`, { cache: 'no-cache' })
+    .then(r => (r.ok ? r.json() : {}))
+    .then((json: { files?: Record<string, string> }) => json.files ?? {})
+    .catch(() => ({}))
+  return manifest
+}
+
+function resolveFilename(filename: string): Promise<string> {
+  return loadManifest().then(files => files[filename] ?? filename)
+}
+
+/** Whether the data manifest lists `filename` (false when there is no manifest). */
+export function hasDataFile(filename: string): Promise<boolean> {
+  return loadManifest().then(files => filename in files)
+}
+
+// Code -> label dictionary of a build written with --encode-ids; null when
+// the build has none. A manifest that doesn't list it saves the request.
+let identifiers: Promise<Identifiers | null> | null = null
+
+function loadIdentifiers(): Promise<Identifiers | null> {
+  identifiers ??= loadManifest()
+    .then(files => {
+      if (Object.keys(files).length > 0 && !('identifiers.json' in files)) return null
+      return fetch(`${import.meta.env.BASE_URL}data/${files['identifiers.json'] ?? 'identifiers.json'}`)
+        .then(r => (r.ok ? r.json() : null))
+    })
+    .catch(() => null)
+  return identifiers
+}
+
+function fetchData(filename: string, decode?: (buffer: ArrayBuffer) => unknown): Promise<unknown> {
+  let request = inflight.get(filename)
+  if (!request) {
+    request = resolveFilename(filename)
+      .then(resolved => fetch(`${import.meta.env.BASE_URL}data/${resolved}`))
+      .then(r => {
+        if (!r.ok) throw new Error(`Failed: ${filename}`)
+        if (decode) return r.arrayBuffer().then(decode)
+        return Promise.all([r.json(), loadIdentifiers()]).then(([json, ids]) => decodeIdentifiers(filename, json, ids))
+      })
+      .then(json => { cache.set(filename, json); return json })
+      .finally(() => inflight.delete(filename))
+    inflight.set(filename, request)
+  }
+  return request
+}
+
+/**
+ * Fetch and cache a file under `data/`; pass `null` to load nothing (e.g. no
+ * shard selected yet). Binary files are read through `decode` instead of
+ * being parsed as JSON; JSON files have their identifier codes replaced by
+ * labels (see utils/identifiers).
+ */
+export function useDataLoader<T>(filename: string | null, decode?: (buffer: ArrayBuffer) => T) {
+  const [data, setData] = useState<T | null>(() => (filename ? (cache.get(filename) as T) ?? null : null))
+  const [loading, setLoading] = useState(filename !== null && !cache.has(filename))
   const [error, setError] = useState<string | null>(null)
-  const fetchedRef = useRef(false)
 
   useEffect(() => {
-    if (cache.has(filename)) {
-      setData(cache.get(filename) as T)
+    if (filename === null || cache.has(filename)) {
+      setData(filename === null ? null : cache.get(filename) as T)
       setLoading(false)
+      setError(null)
       return
     }
-    if (fetchedRef.current) return
-    fetchedRef.current = true
-
-    fetch(`${import.meta.env.BASE_URL}data/${filename}`)
-      .then(r => { if (!r.ok) throw new Error(`Failed: ${filename}`); return r.json() })
-      .then((json: T) => { cache.set(filename, json); setData(json); setLoading(false) })
-      .catch(e => { setError(e.message); setLoading(false) })
+    let current = true
+    setData(null)
+    setLoading(true)
+    setError(null)
+    fetchData(filename, decode)
+      .then(json => { if (current) { setData(json as T); setLoading(false) } })
+      .catch(e => { if (current) { setError(e.message); setLoading(false) } })
+    return () => { current = false }
+    // decode is a module-level function; only the filename selects the data
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [filename])
 
   return { data, loading, error }
@@ -59,8 +59,37 @@ export interface BilateralTopFlows {
   [year: string]: { [mode: string]: BilateralFlow[] }
 }
 
-export interface BilateralByCommodity {
-  [commodity: string]: { [year: string]: BilateralFlow[] }
+/** One commodity's shard: its top flows per year. */
+export interface CommodityFlows { [year: string]: BilateralFlow[] }
+
+/** One country's shard: its top partners per year, direction and mode ("all" included). */
+export interface CountryPartners {
+  [year: string]: {
+    imports: { [mode: string]: BilateralFlow[] }
+    exports: { [mode: string]: BilateralFlow[] }
+  }
+}
+
+/** A country's partner shard as written: one row per flow, the other end being `country`. */
+export interface ColumnarCountryPartners {
+  format: 'columnar'
+  country: string
+  years: string[]
+  directions: ('imports' | 'exports')[]
+  modes: string[]
+  partners: string[]
+  rows: { year: number[]; direction: number[]; mode: number[]; partner: number[]; dominant_mode: number[] }
+  values: { wtw: number[]; ttw: number[]; wtt: number[]; food_miles: number[]; cost: number[]; n_commodities: number[] }
+}
+
+export interface ShardEntry {
+  path: string
+  bytes: number
+  blake2b: string
+}
+
+export interface ShardManifest {
+  shards: { [label: string]: ShardEntry }
 }
 
 export interface GlobalByModeEntry {
@@ -104,3 +133,22 @@ export interface DropdownLists {
   commodities: string[]
   countries: CountryListItem[]
 }
+
+/** identifiers.json: the label of every integer code, per table (written with --encode-ids). */
+export interface Identifiers {
+  countries: string[]
+  commodities: string[]
+  modes: string[]
+}
+
+export interface ColumnarRouteTable {
+  format: 'columnar'
+  keys: string[]
+  years: string[]
+  routes: string[]
+  rows: { key: number[]; year: number[]; route: number[] }
+  values: { [metric: string]: number[] }
+}
+
+/** A route table as written by the preprocessor: nested (default) or columnar. */
+export type RouteTable<T> = T | ColumnarRouteTable
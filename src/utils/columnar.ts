@@ -0,0 +1,66 @@
+import type {
+  BilateralFlow, ColumnarCountryPartners, ColumnarRouteTable, CountryPartners, RouteTable,
+} from '../types/data'
+
+const decoded = new WeakMap<object, unknown>()
+
+export function isColumnarTable(data: unknown): data is ColumnarRouteTable {
+  return typeof data === 'object' && data !== null && (data as { format?: unknown }).format === 'columnar'
+}
+
+/**
+ * Expand a columnar route table into the nested `{key: {year: {route: {...}}}}`
+ * shape the views index into. Nested tables are returned as-is; decoded
+ * tables are cached per loaded object, so every caller gets the same result.
+ */
+export function decodeRouteTable<T>(data: RouteTable<T> | null): T | null {
+  if (!isColumnarTable(data)) return data
+  const hit = decoded.get(data)
+  if (hit) return hit as T
+
+  const { keys, years, routes, rows, values } = data
+  const metrics = Object.keys(values)
+  const result: Record<string, Record<string, Record<string, Record<string, number>>>> = {}
+  for (let i = 0; i < rows.key.length; i++) {
+    const record: Record<string, number> = {}
+    for (const m of metrics) record[m] = values[m][i]
+    const byYear = (result[keys[rows.key[i]]] ??= {})
+    const byRoute = (byYear[years[rows.year[i]]] ??= {})
+    byRoute[routes[rows.route[i]]] = record
+  }
+  decoded.set(data, result)
+  return result as T
+}
+
+/**
+ * Expand a columnar partner shard into `{year: {imports, exports}}` lists of
+ * flows, rebuilding each flow's "from"/"to" from the shard's country and the
+ * row's partner. Cached per loaded shard like decodeRouteTable().
+ */
+export function decodeCountryPartners(data: ColumnarCountryPartners | null): CountryPartners | null {
+  if (!data) return null
+  const hit = decoded.get(data)
+  if (hit) return hit as CountryPartners
+
+  const { country, years, directions, modes, partners, rows, values } = data
+  const result: CountryPartners = {}
+  for (const year of years) result[year] = { imports: {}, exports: {} }
+  for (let i = 0; i < rows.year.length; i++) {
+    const direction = directions[rows.direction[i]]
+    const partner = partners[rows.partner[i]]
+    const flow: BilateralFlow = {
+      from: direction === 'imports' ? partner : country,
+      to: direction === 'imports' ? country : partner,
+      wtw: values.wtw[i],
+      ttw: values.ttw[i],
+      wtt: values.wtt[i],
+      food_miles: values.food_miles[i],
+      cost: values.cost[i],
+      n_commodities: values.n_commodities[i],
+      dominant_mode: modes[rows.dominant_mode[i]],
+    }
+    ;(result[years[rows.year[i]]][direction][modes[rows.mode[i]]] ??= []).push(flow)
+  }
+  decoded.set(data, result)
+  return result
+}
@@ -0,0 +1,77 @@
+import type { Identifiers } from '../types/data'
+
+type Table = keyof Identifiers
+
+// Files whose object keys are identifiers, per nesting level (null: a level
+// of other keys, e.g. years). A columnar table holds its top-level codes in
+// its `keys` array instead.
+const KEYED: Record<string, (Table | null)[]> = {
+  'consumer_countries.json': ['countries'],
+  'producer_countries.json': ['countries'],
+  'commodities.json': ['commodities'],
+  'transport_factors.json': ['commodities', 'modes'],
+  'bilateral_top_flows.json': [null, 'modes'],
+}
+
+// Identifier fields of the records in the encoded files
+const FLOW_FIELDS: Record<string, Table> = { from: 'countries', to: 'countries', dominant_mode: 'modes' }
+const MODE_FIELDS: Record<string, Table> = { mode: 'modes' }
+
+function recordFields(filename: string): Record<string, Table> | null {
+  if (filename === 'global_by_mode.json') return MODE_FIELDS
+  // The columnar partner shards (bilateral_by_country/) carry their own dictionaries
+  if (filename === 'bilateral_top_flows.json' || filename.startsWith('bilateral_by_commodity/')) return FLOW_FIELDS
+  return null
+}
+
+// Every identifier in an encoded file is a code; "all" is the one key
+// beside them (the across-modes flows of bilateral_top_flows.json)
+function label(ids: Identifiers, table: Table, code: number): string {
+  return ids[table][code] ?? String(code)
+}
+
+function decodeKeys(ids: Identifiers, value: unknown, levels: (Table | null)[]): unknown {
+  if (levels.length === 0 || typeof value !== 'object' || value === null) return value
+  const [table, ...rest] = levels
+  // Object.entries() follows the file's key order: the preprocessor
+  // writes coded keys ascending, as JSON.parse() orders them
+  return Object.fromEntries(Object.entries(value).map(([key, child]) => [
+    table === null || key === 'all' ? key : label(ids, table, Number(key)),
+    decodeKeys(ids, child, rest),
+  ]))
+}
+
+// Rewrite `fields` of every record under `value` in place: the nesting of
+// year/mode/direction objects ends in arrays of records
+function decodeRecords(ids: Identifiers, value: unknown, fields: Record<string, Table>): void {
+  if (Array.isArray(value)) {
+    for (const record of value as Record<string, unknown>[]) {
+      if (typeof record !== 'object' || record === null) continue
+      for (const [field, table] of Object.entries(fields)) {
+        if (typeof record[field] === 'number') record[field] = label(ids, table, record[field] as number)
+      }
+    }
+  } else if (typeof value === 'object' && value !== null) {
+    for (const child of Object.values(value)) decodeRecords(ids, child, fields)
+  }
+}
+
+/**
+ * Replace the integer codes of a file written with --encode-ids by their
+ * labels, so the views see the same data as from an unencoded build. Only
+ * the files, keys and fields the preprocessor encodes are touched (records
+ * in place); `ids` is null when the build wrote no dictionary.
+ */
+export function decodeIdentifiers(filename: string, data: unknown, ids: Identifiers | null): unknown {
+  if (!ids || typeof data !== 'object' || data === null) return data
+  const fields = recordFields(filename)
+  if (fields) decodeRecords(ids, data, fields)
+  const levels = KEYED[filename]
+  if (!levels) return data
+  const keyed = data as Record<string, unknown>
+  if (keyed.format === 'columnar') {
+    keyed.keys = (keyed.keys as number[]).map(code => label(ids, levels[0] as Table, code))
+    return keyed
+  }
+  return decodeKeys(ids, data, levels)
+}
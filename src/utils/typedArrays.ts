@@ -0,0 +1,81 @@
+import type { BilateralFlow, BilateralTopFlows } from '../types/data'
+
+// Reader for the packed typed-array files written by write_typed_arrays() in
+// preprocess.py: "TARR", uint32 version, uint32 header length, JSON header,
+// then little-endian arrays at 8-byte aligned offsets.
+
+type TypedArray = Float64Array | Float32Array | Uint32Array | Uint16Array | Int32Array | Uint8Array
+
+const ARRAY_TYPES = {
+  float64: Float64Array,
+  float32: Float32Array,
+  uint32: Uint32Array,
+  uint16: Uint16Array,
+  int32: Int32Array,
+  uint8: Uint8Array,
+} as const
+
+interface ArraySpec {
+  dtype: keyof typeof ARRAY_TYPES
+  offset: number
+  length: number
+}
+
+const LITTLE_ENDIAN = new Uint8Array(new Uint16Array([1]).buffer)[0] === 1
+
+/** Parse the header and wrap each array as a typed array view over `buffer` (no copy). */
+export function readTypedArrays<H>(buffer: ArrayBuffer): { header: H; arrays: TypedArray[] } {
+  const view = new DataView(buffer)
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4))
+  if (magic !== 'TARR' || view.getUint32(4, true) !== 1) throw new Error('Unsupported typed-array file')
+  if (!LITTLE_ENDIAN) throw new Error('Typed-array files need a little-endian platform')
+
+  const headerLength = view.getUint32(8, true)
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)))
+  const arrays = (header.arrays as ArraySpec[]).map(({ dtype, offset, length }) =>
+    new ARRAY_TYPES[dtype](buffer, offset, length))
+  return { header: header as H, arrays }
+}
+
+interface FlowTableHeader {
+  countries: string[]
+  modes: string[]
+  blocks: { year: string; mode: string; length: number; columns: Record<string, number> }[]
+}
+
+/**
+ * Decode bilateral_top_flows.bin into the same `{year: {mode: flows}}` shape
+ * as the JSON. Each block's flow objects are only built when it is first
+ * read, so the map view pays for the year and mode it shows.
+ */
+export function decodeFlowTables(buffer: ArrayBuffer): BilateralTopFlows {
+  const { header, arrays } = readTypedArrays<FlowTableHeader>(buffer)
+  const { countries, modes } = header
+  const result: BilateralTopFlows = {}
+  for (const block of header.blocks) {
+    const col = (name: string) => arrays[block.columns[name]]
+    let flows: BilateralFlow[] | null = null
+    Object.defineProperty(result[block.year] ??= {}, block.mode, {
+      enumerable: true,
+      get() {
+        if (flows) return flows
+        const [wtw, ttw, wtt, foodMiles, cost, nCommodities, from, to, dominant] = [
+          'wtw', 'ttw', 'wtt', 'food_miles', 'cost', 'n_commodities', 'from', 'to', 'dominant_mode',
+        ].map(col)
+        flows = Array.from({ length: block.length }, (_, i) => ({
+          from: countries[from[i]],
+          to: countries[to[i]],
+          wtw: wtw[i],
+          ttw: ttw[i],
+          wtt: wtt[i],
+          food_miles: foodMiles[i],
+          cost: cost[i],
+          n_commodities: nCommodities[i],
+          dominant_mode: modes[dominant[i]],
+        }))
+        return flows
+      },
+    })
+  }
+  return result
+}
@@ -5,7 +5,8 @@ import {
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, Cell } from 'recharts'
 import { useData } from '../context/DataContext'
 import { useDataLoader } from '../hooks/useDataLoader'
-import type { BilateralTopFlows, BilateralByCommodity } from '../types/data'
+import { useBilateralTopFlows } from '../hooks/useBilateralTopFlows'
+import type { CommodityFlows, ShardManifest } from '../types/data'
 import { YearSlider } from '../components/shared/YearSlider'
 import { ChartContainer } from '../components/shared/ChartContainer'
 import { LoadingSpinner } from '../components/shared/LoadingSpinner'
@@ -16,13 +17,17 @@ const GEO_URL = 'https://cdn.jsdelivr.net/npm/world-atlas@2/countries-110m.json'
 
 export function BilateralFlowMap() {
   const { selectedYear, getCountryName, countryMeta } = useData()
-  const { data: bilateral, loading } = useDataLoader<BilateralTopFlows>('bilateral_top_flows.json')
-  const { data: bilateralByCommodity, loading: commLoading } = useDataLoader<BilateralByCommodity>('bilateral_by_commodity.json')
+  const { data: bilateral, loading } = useBilateralTopFlows()
+  const { data: commodityManifest } = useDataLoader<ShardManifest>('bilateral_by_commodity_manifest.json')
 
   const [modeFilter, setModeFilter] = useState('all')
   const [minEmissions, setMinEmissions] = useState(0)
   const [hoveredFlow, setHoveredFlow] = useState<number | null>(null)
   const [selectedCommodity, setSelectedCommodity] = useState('')
+
+  // Only the selected commodity's shard is fetched
+  const shardPath = (selectedCommodity && commodityManifest?.shards[selectedCommodity]?.path) || null
+  const { data: commodityFlows, loading: commLoading } = useDataLoader<CommodityFlows>(shardPath)
   const [commoditySearch, setCommoditySearch] = useState('')
   const [showCommodityDropdown, setShowCommodityDropdown] = useState(false)
 
@@ -30,14 +35,14 @@ export function BilateralFlowMap() {
 
   // Get flows based on commodity selection + mode filter
   const allFlows = useMemo(() => {
-    if (selectedCommodity && bilateralByCommodity) {
+    if (selectedCommodity) {
       // Commodity-specific flows
-      return bilateralByCommodity[selectedCommodity]?.[yearStr] ?? []
+      return commodityFlows?.[yearStr] ?? []
     }
     // All commodities — use per-mode data
     if (!bilateral?.[yearStr]) return []
     return bilateral[yearStr][modeFilter] ?? []
-  }, [bilateral, bilateralByCommodity, selectedCommodity, yearStr, modeFilter])
+  }, [bilateral, commodityFlows, selectedCommodity, yearStr, modeFilter])
 
   const filteredFlows = useMemo(() => {
     let flows = allFlows
@@ -71,12 +76,12 @@ export function BilateralFlowMap() {
 
   // Commodity list for dropdown — derived from bilateral data (60 transport categories)
   const commodityList = useMemo(() => {
-    if (!bilateralByCommodity) return []
-    const list = Object.keys(bilateralByCommodity).sort()
+    if (!commodityManifest) return []
+    const list = Object.keys(commodityManifest.shards).sort()
     if (!commoditySearch) return list
     const q = commoditySearch.toLowerCase()
     return list.filter(c => c.toLowerCase().includes(q))
-  }, [bilateralByCommodity, commoditySearch])
+  }, [commodityManifest, commoditySearch])
 
   const getCoords = (iso3: string): [number, number] | null => {
     const meta = countryMeta?.[iso3]
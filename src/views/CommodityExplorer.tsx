@@ -6,19 +6,21 @@ import {
 } from 'recharts'
 import { useData } from '../context/DataContext'
 import { useDataLoader } from '../hooks/useDataLoader'
-import type { Commodities, TransportFactors } from '../types/data'
+import type { Commodities, TransportFactors, RouteTable } from '../types/data'
 import { StatCard } from '../components/shared/StatCard'
 import { YearSlider } from '../components/shared/YearSlider'
 import { ChartContainer } from '../components/shared/ChartContainer'
 import { LoadingSpinner } from '../components/shared/LoadingSpinner'
 import { formatEmissions, formatFoodMiles, formatDistance } from '../utils/formatters'
 import { ROUTE_COLORS, MODE_COLORS } from '../utils/colors'
+import { decodeRouteTable } from '../utils/columnar'
 
 export function CommodityExplorer() {
   const { name: paramName } = useParams()
   const navigate = useNavigate()
   const { selectedYear, dropdownLists } = useData()
-  const { data: commodities, loading } = useDataLoader<Commodities>('commodities.json')
+  const { data: commodityTable, loading } = useDataLoader<RouteTable<Commodities>>('commodities.json')
+  const commodities = decodeRouteTable(commodityTable)
   const { data: transportFactors } = useDataLoader<TransportFactors>('transport_factors.json')
 
   const [search, setSearch] = useState('')
@@ -6,25 +6,57 @@ import {
 } from 'recharts'
 import { useData } from '../context/DataContext'
 import { useDataLoader } from '../hooks/useDataLoader'
-import type { ConsumerCountries, ProducerCountries, BilateralTopFlows } from '../types/data'
+import { useBilateralTopFlows } from '../hooks/useBilateralTopFlows'
+import type {
+  ColumnarCountryPartners, ConsumerCountries, CountryPartners, ProducerCountries, RouteTable, ShardManifest,
+} from '../types/data'
 import { StatCard } from '../components/shared/StatCard'
 import { YearSlider } from '../components/shared/YearSlider'
 import { ChartContainer } from '../components/shared/ChartContainer'
 import { LoadingSpinner } from '../components/shared/LoadingSpinner'
 import { formatEmissions, formatFoodMiles } from '../utils/formatters'
 import { ROUTE_COLORS } from '../utils/colors'
+import { decodeCountryPartners, decodeRouteTable } from '../utils/columnar'
 
 export function CountryExplorer() {
   const { iso3: paramIso3 } = useParams()
   const navigate = useNavigate()
   const { selectedYear, getCountryName, dropdownLists } = useData()
-  const { data: consumers, loading: cl } = useDataLoader<ConsumerCountries>('consumer_countries.json')
-  const { data: producers } = useDataLoader<ProducerCountries>('producer_countries.json')
-  const { data: bilateral } = useDataLoader<BilateralTopFlows>('bilateral_top_flows.json')
+  const { data: consumerTable, loading: cl } = useDataLoader<RouteTable<ConsumerCountries>>('consumer_countries.json')
+  const { data: producerTable } = useDataLoader<RouteTable<ProducerCountries>>('producer_countries.json')
+  const consumers = decodeRouteTable(consumerTable)
+  const producers = decodeRouteTable(producerTable)
+  const { data: partnerManifest, error: partnerManifestError } =
+    useDataLoader<ShardManifest>('bilateral_by_country_manifest.json')
 
   const [search, setSearch] = useState('')
+  const [partnerMode, setPartnerMode] = useState('all')
   const iso3 = paramIso3 || 'USA'
 
+  // Only the selected country's partner shard is fetched. Builds without
+  // partner shards (or without one for this country) fall back to filtering
+  // the global top flows, as before the shards existed.
+  const partnerPath = partnerManifest?.shards[iso3]?.path ?? null
+  const { data: shard, error: shardError } = useDataLoader<ColumnarCountryPartners>(partnerPath)
+  const fallback = partnerManifestError !== null || shardError !== null || (partnerManifest !== null && partnerPath === null)
+  const { data: bilateral } = useBilateralTopFlows(fallback)
+
+  const partners = useMemo((): CountryPartners | null => {
+    if (!fallback) return decodeCountryPartners(shard)
+    if (!bilateral) return null
+    const result: CountryPartners = {}
+    for (const [year, byMode] of Object.entries(bilateral)) {
+      const yp: CountryPartners[string] = (result[year] = { imports: {}, exports: {} })
+      for (const [m, flows] of Object.entries(byMode)) {
+        const imports = flows.filter(f => f.to === iso3).sort((a, b) => b.ttw - a.ttw)
+        const exports = flows.filter(f => f.from === iso3).sort((a, b) => b.ttw - a.ttw)
+        if (imports.length) yp.imports[m] = imports
+        if (exports.length) yp.exports[m] = exports
+      }
+    }
+    return result
+  }, [fallback, shard, bilateral, iso3])
+
   const filtered = useMemo(() => {
     if (!dropdownLists) return []
     const q = search.toLowerCase()
@@ -62,27 +94,32 @@ export function CountryExplorer() {
     { name: 'International', value: bilTtw },
   ]
 
+  // Partner lists are already ranked by TTW (in the shard or by the fallback)
+  const partnerModes = useMemo(() => {
+    const yp = partners?.[yearStr]
+    if (!yp) return ['all']
+    const modes = new Set([...Object.keys(yp.imports), ...Object.keys(yp.exports)])
+    modes.delete('all')
+    return ['all', ...modes]
+  }, [partners, yearStr])
+  // A mode picked for another country or year may have no flows here
+  const activeMode = partnerModes.includes(partnerMode) ? partnerMode : 'all'
+
   // Top source countries (imports TO this country)
   const topSources = useMemo(() => {
-    if (!bilateral) return []
-    const flows = bilateral[yearStr]?.all ?? []
+    const flows = partners?.[yearStr]?.imports[activeMode] ?? []
     return flows
-      .filter((f: any) => f.to === iso3)
-      .sort((a: any, b: any) => b.ttw - a.ttw)
       .slice(0, 10)
-      .map((f: any) => ({ name: getCountryName(f.from), ttw: f.ttw, iso3: f.from }))
-  }, [bilateral, yearStr, iso3, getCountryName])
+      .map(f => ({ name: getCountryName(f.from), ttw: f.ttw, iso3: f.from }))
+  }, [partners, yearStr, activeMode, getCountryName])
 
   // Top destinations (exports FROM this country)
   const topDest = useMemo(() => {
-    if (!bilateral) return []
-    const flows = bilateral[yearStr]?.all ?? []
+    const flows = partners?.[yearStr]?.exports[activeMode] ?? []
     return flows
-      .filter((f: any) => f.from === iso3)
-      .sort((a: any, b: any) => b.ttw - a.ttw)
       .slice(0, 10)
-      .map((f: any) => ({ name: getCountryName(f.to), ttw: f.ttw, iso3: f.to }))
-  }, [bilateral, yearStr, iso3, getCountryName])
+      .map(f => ({ name: getCountryName(f.to), ttw: f.ttw, iso3: f.to }))
+  }, [partners, yearStr, activeMode, getCountryName])
 
   // Producer time series
   const producerTimeSeries = useMemo(() => {
@@ -178,6 +215,19 @@ export function CountryExplorer() {
       </div>
 
       {/* Trade Partners */}
+      <div className="flex gap-2">
+        {partnerModes.map(m => (
+          <button key={m}
+            onClick={() => setPartnerMode(m)}
+            className={`px-3 py-1.5 text-xs font-medium rounded-lg transition-colors ${
+              activeMode === m
+                ? 'bg-blue-600 text-white'
+                : 'bg-slate-700 text-slate-300 hover:bg-slate-600'
+            }`}>
+            {m === 'all' ? 'All Modes' : m.charAt(0).toUpperCase() + m.slice(1)}
+          </button>
+        ))}
+      </div>
       <div className="grid grid-cols-1 lg:grid-cols-2 gap-4">
         <ChartContainer title="Top Import Sources" subtitle={`Who ${getCountryName(iso3)} imports from — by transport emissions`}>
           {topSources.length > 0 ? (
@@ -7,21 +7,24 @@ import {
 import { ComposableMap, Geographies, Geography, ZoomableGroup } from 'react-simple-maps'
 import { useData } from '../context/DataContext'
 import { useDataLoader } from '../hooks/useDataLoader'
-import type { GlobalTimeseries, ConsumerCountries, Commodities } from '../types/data'
+import type { GlobalTimeseries, ConsumerCountries, Commodities, RouteTable } from '../types/data'
 import { StatCard } from '../components/shared/StatCard'
 import { YearSlider } from '../components/shared/YearSlider'
 import { ChartContainer } from '../components/shared/ChartContainer'
 import { LoadingSpinner } from '../components/shared/LoadingSpinner'
 import { formatEmissionsMt, formatBillionTkm, formatVolume, formatPercent, formatEmissions } from '../utils/formatters'
 import { ROUTE_COLORS, getSequentialColor } from '../utils/colors'
+import { decodeRouteTable } from '../utils/columnar'
 
 const GEO_URL = 'https://cdn.jsdelivr.net/npm/world-atlas@2/countries-110m.json'
 
 export function GlobalOverview() {
   const { selectedYear, getCountryName, countryMeta } = useData()
   const { data: global, loading: gl } = useDataLoader<GlobalTimeseries>('global_timeseries.json')
-  const { data: consumers, loading: cl } = useDataLoader<ConsumerCountries>('consumer_countries.json')
-  const { data: commodities, loading: cml } = useDataLoader<Commodities>('commodities.json')
+  const { data: consumerTable, loading: cl } = useDataLoader<RouteTable<ConsumerCountries>>('consumer_countries.json')
+  const { data: commodityTable, loading: cml } = useDataLoader<RouteTable<Commodities>>('commodities.json')
+  const consumers = decodeRouteTable(consumerTable)
+  const commodities = decodeRouteTable(commodityTable)
   const navigate = useNavigate()
 
   const yearIdx = global ? global.years.indexOf(selectedYear) : -1